@@ -0,0 +1,265 @@
+import hashlib
+import re
+from datetime import date, datetime, time, timezone
+from functools import wraps
+
+from django.http import JsonResponse
+from django.views.decorators.gzip import gzip_page
+from django.views.decorators.http import condition, require_GET
+
+from . import catalogue_cache, event_listing, geo, search_index, user_state
+from .db_routing import read_from_replica
+from .models import Booking, Event, StarredItem, Venue
+from .pagination import InvalidCursor, keyset_page, page_size
+
+# Read-only JSON API, version 1 (/api/v1/...), for the mobile app and
+# partner sites.
+# Rows come straight from values() querysets and are paged with keyset
+# cursors; ?fields=a,b picks the fields. Every response carries a strong
+# ETag built from the catalogue version (plus, for catalogue endpoints, the
+# counters version, since events carry their seats booked, and for /me/
+# endpoints the time the user last starred or booked), which lives in the
+# cache, so a poll with a matching If-None-Match gets a 304 without a query.
+# Catalogue responses are also cached until either version changes.
+
+API_VERSION = 1
+
+# Public field name -> ORM lookup, in default output order
+EVENT_FIELDS = {
+    'id': 'eventID',
+    'name': 'name',
+    'date': 'date',
+    'venue_id': 'venue_id',
+    'venue_name': 'venue__name',
+    'capacity': 'capacity',
+    'booked': 'booked',
+    'images': 'image_variants',
+}
+VENUE_FIELDS = {
+    'id': 'venueID',
+    'name': 'name',
+    'location': 'location',
+    'latitude': 'latitude',
+    'longitude': 'longitude',
+    'images': 'image_variants',
+}
+BOOKING_FIELDS = {
+    'id': 'bookingID',
+    'event_id': 'event_id',
+    'event_name': 'event__name',
+    'event_date': 'event__date',
+    'venue_name': 'event__venue__name',
+    'booked_at': 'booking_date',
+}
+STAR_FIELDS = {
+    'id': 'id',
+    'event_id': 'event_id',
+    'event_name': 'event__name',
+    'venue_id': 'venue_id',
+    'venue_name': 'venue__name',
+}
+
+# Same test GZipMiddleware uses to decide whether to compress
+ACCEPTS_GZIP = re.compile(r'\bgzip\b')
+
+
+class ApiError(ValueError):
+    pass
+
+
+def _json(data, status=200):
+    return JsonResponse(data, status=status, json_dumps_params={'separators': (',', ':')})
+
+
+def _error(message, status=400):
+    return _json({'error': message}, status=status)
+
+
+def _requested_fields(request, *available):
+    # Names from ?fields=, or None for the defaults; each must exist in one of available
+    requested = [name.strip() for name in request.GET.get('fields', '').split(',') if name.strip()]
+    if not requested:
+        return None
+    unknown = [name for name in requested if not any(name in fields for fields in available)]
+    if unknown:
+        raise ApiError(f'Unknown fields: {", ".join(unknown)}')
+    return requested
+
+
+def _fields(request, available):
+    return _requested_fields(request, available) or list(available)
+
+
+def _next_url(request, next_cursor):
+    if not next_cursor:
+        return None
+    params = request.GET.copy()
+    params['cursor'] = next_cursor
+    return f'{request.path}?{params.urlencode()}'
+
+
+def _page(request, queryset, available, ordering):
+    # {'data': [...], 'next': url or None} for one keyset page of values() rows
+    names = _fields(request, available)
+    lookups = list(dict.fromkeys([available[name] for name in names] + ordering))
+    rows, next_cursor = keyset_page(queryset.values(*lookups), ordering, request.GET.get('cursor'),
+                                    page_size(request.GET.get('limit')))
+    return {
+        'data': [{name: row[available[name]] for name in names} for row in rows],
+        'next': _next_url(request, next_cursor),
+    }
+
+
+def _location(request):
+    try:
+        return geo.parse_location(request.GET)
+    except geo.InvalidLocation as error:
+        raise ApiError(str(error))
+
+
+def _representation(request):
+    # Compressed and plain bodies differ, so they need different strong ETags
+    return 'gzip' if ACCEPTS_GZIP.search(request.headers.get('Accept-Encoding', '')) else 'identity'
+
+
+def _etag(*parts):
+    return hashlib.sha1(':'.join(str(part) for part in parts).encode()).hexdigest()
+
+
+def catalogue_etag(request, *args, **kwargs):
+    # Event lists start today by default, so the date is part of the version
+    return _etag(API_VERSION, catalogue_cache.get_version(), catalogue_cache.get_counters_version(), date.today(),
+                 request.get_full_path(), _representation(request))
+
+
+def catalogue_last_modified(request, *args, **kwargs):
+    # The later of the last catalogue change and the start of today
+    changed = max(catalogue_cache.changed_at(), datetime.combine(date.today(), time.min).timestamp())
+    return datetime.fromtimestamp(int(changed), timezone.utc)
+
+
+def user_etag(request, *args, **kwargs):
+    user_id = request.session.get('userID')
+    if not user_id:
+        return None
+    return _etag(API_VERSION, catalogue_cache.get_version(), user_id, user_state.changed_at(user_id),
+                 request.get_full_path(), _representation(request))
+
+
+def user_last_modified(request, *args, **kwargs):
+    user_id = request.session.get('userID')
+    if not user_id:
+        return None
+    changed = max(catalogue_cache.changed_at(), user_state.changed_at(user_id))
+    return datetime.fromtimestamp(int(changed), timezone.utc)
+
+
+def catalogue_endpoint(view):
+    # GET only; conditional on the catalogue and counters versions; gzipped;
+    # the body is cached per URL until either changes
+    @wraps(view)
+    def cached_view(request):
+        key = hashlib.sha1(request.get_full_path().encode()).hexdigest()
+        try:
+            return _json(catalogue_cache.cached(f'api_{view.__name__}', lambda: view(request),
+                                                catalogue_cache.get_counters_version(), date.today(), key))
+        except (ApiError, InvalidCursor, event_listing.InvalidFilter) as error:
+            return _error(str(error) if isinstance(error, ApiError) else 'Invalid filter or cursor')
+
+    return require_GET(condition(catalogue_etag, catalogue_last_modified)(gzip_page(read_from_replica(cached_view))))
+
+
+def user_endpoint(view):
+    # GET only, for the logged in user; conditional on their last change; gzipped
+    @wraps(view)
+    def user_view(request):
+        user_id = request.session.get('userID')
+        if not user_id:
+            return _error('Authentication required', status=401)
+        try:
+            return _json(view(request, user_id))
+        except (ApiError, InvalidCursor) as error:
+            return _error(str(error) if isinstance(error, ApiError) else 'Invalid cursor')
+
+    return require_GET(condition(user_etag, user_last_modified)(gzip_page(user_view)))
+
+
+@catalogue_endpoint
+def events(request):
+    # Same window and filters as the event list page: from, to, venue
+    filters = event_listing.parse_filters(request.GET)
+    return _page(request, event_listing.queryset(filters), EVENT_FIELDS, event_listing.ORDERING)
+
+
+@catalogue_endpoint
+def venues(request):
+    return _page(request, Venue.objects.all(), VENUE_FIELDS, ['venueID'])
+
+
+@catalogue_endpoint
+def venues_nearby(request):
+    # Venues within ?radius= km (default 25) of ?lat=&lon=, nearest first
+    latitude, longitude, radius = _location(request)
+    available = dict(VENUE_FIELDS, distance_km=None)
+    names = _fields(request, available)
+    hits, next_cursor = geo.venues_near(latitude, longitude, radius, request.GET.get('cursor'),
+                                        page_size(request.GET.get('limit')))
+    lookups = dict.fromkeys([VENUE_FIELDS[name] for name in names if name in VENUE_FIELDS] + ['venueID'])
+    by_id = {row['venueID']: row for row in Venue.objects.filter(pk__in=[venue_id for _, venue_id in hits])
+             .values(*lookups)}
+    data = []
+    for distance, venue_id in hits:
+        row = dict(by_id[venue_id], distance_km=round(distance, 3))
+        data.append({name: row[available[name] or name] for name in names})
+    return {'data': data, 'next': _next_url(request, next_cursor)}
+
+
+@catalogue_endpoint
+def events_nearby(request):
+    # Upcoming events (from / to as for events/) at venues within ?radius= km
+    # of ?lat=&lon=: nearest venue first, then by date
+    latitude, longitude, radius = _location(request)
+    available = dict(EVENT_FIELDS, distance_km=None)
+    names = _fields(request, available)
+    filters = event_listing.parse_filters(request.GET)
+    rows, next_cursor = geo.events_near(
+        latitude, longitude, radius, event_listing.queryset(filters),
+        [EVENT_FIELDS[name] for name in names if name in EVENT_FIELDS], request.GET.get('cursor'),
+        page_size(request.GET.get('limit')))
+    for row in rows:
+        row['distance_km'] = round(row['distance_km'], 3)
+    return {
+        'data': [{name: row[available[name] or name] for name in names} for row in rows],
+        'next': _next_url(request, next_cursor),
+    }
+
+
+@catalogue_endpoint
+def search(request):
+    # Ranked matches from the search index; no cursor, at most MAX_PAGE_SIZE of each kind
+    query = request.GET.get('q', '')
+    kinds = [request.GET['type']] if request.GET.get('type') in ('event', 'venue') else ['event', 'venue']
+    requested = _requested_fields(request, EVENT_FIELDS, VENUE_FIELDS)
+    limit = page_size(request.GET.get('limit'))
+    result = {}
+    for kind, model, available in [('event', Event, EVENT_FIELDS), ('venue', Venue, VENUE_FIELDS)]:
+        if kind not in kinds:
+            continue
+        names = [name for name in requested if name in available] if requested else list(available)
+        pk = available['id']
+        ids = [object_id for _, object_id in search_index.search(query, kind=kind, limit=limit)]
+        rows = model.objects.filter(pk__in=ids).values(*dict.fromkeys([available[name] for name in names] + [pk]))
+        by_id = {row[pk]: row for row in rows}
+        result[f'{kind}s'] = [{name: by_id[object_id][available[name]] for name in names}
+                              for object_id in ids if object_id in by_id]
+    return result
+
+
+@user_endpoint
+def bookings(request, user_id):
+    return _page(request, Booking.objects.filter(user_id=user_id), BOOKING_FIELDS, ['bookingID'])
+
+
+@user_endpoint
+def stars(request, user_id):
+    return _page(request, StarredItem.objects.filter(userID_id=user_id), STAR_FIELDS, ['id'])
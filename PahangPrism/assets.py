@@ -0,0 +1,107 @@
+import os
+import posixpath
+import re
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.contrib.staticfiles.finders import BaseFinder
+from django.core.files.storage import FileSystemStorage
+
+# CSS bundles.
+# Each page links one stylesheet, css/bundles/<name>.css, built by
+# concatenating and minifying the files listed here (in cascade order).
+# BundleFinder exposes the bundles like any other static file, so runserver
+# serves them and collectstatic hashes and precompresses them along with
+# everything else (see STORAGES in settings.py).
+
+BUNDLES = {
+    'about': ['css/style.css', 'css/pages/about.css'],
+    'admin': ['css/admin_styles.css'],
+    'admin_dashboard': ['css/style.css', 'css/pages/admin_dashboard.css'],
+    'admin_database_management': ['css/style.css', 'css/pages/admin_database_management.css'],
+    'booked_events': ['css/style.css', 'css/pages/booked_events.css'],
+    'confirm_delete': ['css/admin_styles.css', 'css/pages/confirm_delete.css'],
+    'event_list': ['css/style.css', 'css/event_pages.css', 'css/pages/event_list.css'],
+    'index': ['css/style.css', 'css/pages/index.css'],
+    'login': ['css/login.css', 'css/pages/login.css'],
+    'register': ['css/style.css', 'css/register.css'],
+    'search': ['css/style.css', 'css/search.css'],
+    'starred_list': ['css/style.css', 'css/event_pages.css', 'css/starred_list.css'],
+    'user_dashboard': ['css/style.css', 'css/pages/user_dashboard.css'],
+    'venue_list': ['css/style.css', 'css/venue_list.css'],
+}
+
+BUNDLE_DIR = 'css/bundles'
+
+URL_PATTERN = re.compile(r'''url\(\s*(['"]?)([^'")]+)\1\s*\)''')
+
+
+def bundle_path(name):
+    if name not in BUNDLES:
+        raise ValueError(f'Unknown CSS bundle: {name}')
+    return f'{BUNDLE_DIR}/{name}.css'
+
+
+def minify(css):
+    css = re.sub(r'/\*.*?\*/', '', css, flags=re.S)
+    css = re.sub(r'\s+', ' ', css)
+    css = re.sub(r'\s*([{};,>])\s*', r'\1', css)
+    css = re.sub(r':\s+', ':', css)
+    return css.replace(';}', '}').strip()
+
+
+def rebase_urls(css, source):
+    # Relative url()s point from the source file; make them point from the
+    # bundle instead so the manifest storage can hash what they reference
+    def rebase(match):
+        url = match.group(2)
+        if url.startswith(('/', 'data:', '#')) or '//' in url:
+            return match.group(0)
+        target = posixpath.normpath(posixpath.join(posixpath.dirname(source), url))
+        return f'url("{posixpath.relpath(target, BUNDLE_DIR)}")'
+    return URL_PATTERN.sub(rebase, css)
+
+
+def _sources(name):
+    found = []
+    for path in BUNDLES[name]:
+        absolute = finders.find(path)
+        if not absolute:
+            raise FileNotFoundError(path)
+        found.append((path, absolute))
+    return found
+
+
+def build(name, storage):
+    # Writes the bundle unless it is newer than all of its sources
+    sources = _sources(name)
+    target = storage.path(bundle_path(name))
+    if os.path.exists(target) and os.path.getmtime(target) >= max(os.path.getmtime(a) for _, a in sources):
+        return target
+    parts = []
+    for path, absolute in sources:
+        with open(absolute, encoding='utf-8') as source:
+            parts.append(rebase_urls(minify(source.read()), path))
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    with open(target, 'w', encoding='utf-8') as bundle:
+        bundle.write('\n'.join(parts) + '\n')
+    return target
+
+
+class BundleFinder(BaseFinder):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.storage = FileSystemStorage(location=settings.CSS_BUNDLE_ROOT)
+
+    def find(self, path, find_all=False, **kwargs):
+        find_all = find_all or kwargs.get('all', False)
+        name = posixpath.splitext(posixpath.basename(path))[0]
+        if name not in BUNDLES or path != bundle_path(name):
+            return []
+        target = build(name, self.storage)
+        return [target] if find_all else target
+
+    def list(self, ignore_patterns):
+        for name in BUNDLES:
+            build(name, self.storage)
+            yield bundle_path(name), self.storage
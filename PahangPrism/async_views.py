@@ -0,0 +1,129 @@
+from asgiref.sync import sync_to_async
+from django.contrib import messages
+from django.db.models import Q
+from django.http import HttpResponseBadRequest
+from django.shortcuts import redirect, render
+
+from . import catalogue_cache, credentials, event_listing, feeds, identity, search_index, user_state
+from .catalogue_cache import cache_anonymous_page
+from .db_routing import read_from_replica
+from .models import Booking, Event, Venue, WaitlistEntry
+from .pagination import InvalidCursor
+
+# Async versions of the read-heavy views, used instead of the ones in
+# views.py when the site runs under ASGI (DJANGO_ASGI=True, see urls.py).
+# They behave the same; querysets are evaluated here with the async ORM
+# so nothing touches the database while the template renders.
+
+
+async def _venue_rows():
+    return [venue async for venue in Venue.objects.all()]
+
+
+@cache_anonymous_page('event_list', vary_on=catalogue_cache.get_counters_version)
+@read_from_replica
+async def event_list(request):
+    try:
+        filters = event_listing.parse_filters(request.GET)
+        events, next_cursor = await event_listing.aget_page(filters, request.GET.get('cursor'), request.GET.get('limit'))
+    except (event_listing.InvalidFilter, InvalidCursor):
+        return HttpResponseBadRequest('Invalid filter or cursor')
+    state = await user_state.aget_state(await request.session.aget('userID'))
+    venues = await event_listing.avenue_choices()
+    return event_listing.response(request, filters, events, next_cursor, state, venues)
+
+
+@cache_anonymous_page('venue_list')
+@read_from_replica
+async def venue_list(request):
+    venues = await catalogue_cache.acached('venues', _venue_rows)
+    state = await user_state.aget_state(await request.session.aget('userID'))
+
+    context = {
+        'venues': venues,
+        'starred_venues': state['starred_venues'],
+    }
+    return render(request, 'venue_list.html', context)
+
+
+@read_from_replica
+async def search(request):
+    query = request.GET.get('q')
+    events = []
+    venues = []
+    if query and search_index.is_supported():
+        hits = await sync_to_async(search_index.search)(query)
+        event_ids = [pk for kind, pk in hits if kind == 'event']
+        venue_ids = [pk for kind, pk in hits if kind == 'venue']
+        found_events = await Event.objects.select_related('venue').ain_bulk(event_ids)
+        found_venues = await Venue.objects.ain_bulk(venue_ids)
+        events = [found_events[pk] for pk in event_ids if pk in found_events]
+        venues = [found_venues[pk] for pk in venue_ids if pk in found_venues]
+    elif query:
+        events = [event async for event in Event.objects.select_related('venue').filter(
+            Q(name__icontains=query) |
+            Q(venue__name__icontains=query)
+        )]
+        venues = [venue async for venue in Venue.objects.filter(
+            Q(name__icontains=query) |
+            Q(location__icontains=query)
+        )]
+
+    state = await user_state.aget_state(await request.session.aget('userID'))
+
+    context = {
+        'query': query,
+        'events': events,
+        'venues': venues,
+        'starred_venues': state['starred_venues'],
+        'booked_events': state['booked_events'],
+    }
+    return render(request, 'search.html', context)
+
+
+async def booked_events(request):
+    userID = await request.session.aget('userID')
+    if not userID:
+        messages.error(request, 'You must be logged in to view your booked events.')
+        return redirect('login')
+
+    bookings = [booking async for booking in Booking.objects.filter(user_id=userID).select_related('event')]
+    waitlist = [entry async for entry in
+                WaitlistEntry.objects.filter(user_id=userID).select_related('event').order_by('created_at')]
+    context = {'bookings': bookings, 'waitlist': waitlist, 'calendar_url': feeds.bookings_url(request, userID)}
+    return render(request, 'booked_events.html', context)
+
+
+async def user_dashboard(request):
+    user = await identity.aget_user(await request.session.aget('userID'))
+    if not user:
+        messages.error(request, 'You must be logged in to view your dashboard.')
+        return redirect('login')
+
+    bookings = [booking async for booking in
+                Booking.objects.filter(user_id=user.userID).select_related('event', 'event__venue')]
+
+    context = {
+        'user': user,
+        'bookings': bookings,
+    }
+    return render(request, 'user_dashboard.html', context)
+
+
+async def login(request):
+    # The password check awaits the hashing pool instead of holding the event loop
+    if request.method == 'POST':
+        user = await credentials.aauthenticate(request.POST['email'], request.POST['password'])
+        if user is not None:
+            # A session not in this process's cache is loaded from the database
+            await request.session.aset('userID', user.userID)
+            await request.session.aset('is_staff', user.is_staff)
+            messages.success(request, 'You are now logged in.')
+
+            next_url = request.GET.get('next')
+            if next_url:
+                return redirect(next_url)
+            return redirect('index')
+        messages.error(request, 'Invalid email or password.')
+
+    return render(request, 'login.html')
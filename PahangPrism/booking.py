@@ -0,0 +1,128 @@
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+
+from . import stats
+from .models import Booking, Event, WaitlistEntry
+
+# Seat reservation for events.
+# A seat is taken with a single conditional UPDATE
+#   UPDATE event SET booked = booked + 1 WHERE eventID = %s AND booked < capacity
+# which is atomic on both Postgres (row lock) and SQLite (database write
+# lock), so an event can never be oversold however many requests race for
+# the last seat. The (user, event) unique constraint makes retries safe:
+# a duplicate booking rolls its seat back and reports ALREADY_BOOKED.
+# Every change in seats taken is also counted for the trending scores
+# (see PahangPrism/stats.py) in the same transaction.
+
+BOOKED = 'booked'
+ALREADY_BOOKED = 'already_booked'
+WAITLISTED = 'waitlisted'
+ALREADY_WAITLISTED = 'already_waitlisted'
+MAX_CAPACITY = 2 ** 31 - 1  # Largest value of the integer column on Postgres
+
+
+class InvalidCapacity(ValueError):
+    pass
+
+
+def parse_capacity(value):
+    # A capacity from form or file text: a whole number of seats, or None (unlimited) if blank
+    value = str(value if value is not None else '').strip()
+    if not value:
+        return None
+    if not (value.isascii() and value.isdigit()) or int(value) > MAX_CAPACITY:
+        raise InvalidCapacity(f'invalid capacity "{value}"')
+    return int(value)
+
+
+def take_seat(event_id):
+    has_room = Q(capacity__isnull=True) | Q(booked__lt=F('capacity'))
+    return Event.objects.filter(Q(eventID=event_id) & has_room).update(booked=F('booked') + 1) == 1
+
+
+def release_seat(event_id):
+    Event.objects.filter(eventID=event_id, booked__gt=0).update(booked=F('booked') - 1)
+
+
+def book(user_id, event_id):
+    # Returns one of BOOKED, ALREADY_BOOKED, WAITLISTED, ALREADY_WAITLISTED
+    try:
+        with transaction.atomic():
+            # The write comes first so SQLite takes its write lock up front
+            if take_seat(event_id):
+                Booking.objects.create(user_id=user_id, event_id=event_id)
+                WaitlistEntry.objects.filter(user_id=user_id, event_id=event_id).delete()
+                stats.count_booking(event_id, 1)
+                return BOOKED
+            if Booking.objects.filter(user_id=user_id, event_id=event_id).exists():
+                return ALREADY_BOOKED
+            _, created = WaitlistEntry.objects.get_or_create(user_id=user_id, event_id=event_id)
+            return WAITLISTED if created else ALREADY_WAITLISTED
+    except IntegrityError:
+        # Already booked (possibly by a concurrent retry); the seat was rolled back with the transaction
+        return ALREADY_BOOKED
+
+
+def free_seat(event_id):
+    # Hand a freed seat to the first user on the waitlist, or give it back.
+    # Must run inside a transaction. Returns the promoted user's ID or None.
+    waiting = (WaitlistEntry.objects.select_for_update()
+               .filter(event_id=event_id).order_by('created_at', 'pk').first())
+    if waiting is None:
+        release_seat(event_id)
+        stats.count_booking(event_id, -1)
+        return None
+    Booking.objects.create(user_id=waiting.user_id, event_id=event_id)
+    waiting.delete()
+    return waiting.user_id
+
+
+def fill_from_waitlist(event_id):
+    # After capacity is raised, book waitlisted users into the new seats.
+    # Returns the promoted user IDs.
+    promoted = []
+    with transaction.atomic():
+        while True:
+            waiting = (WaitlistEntry.objects.select_for_update()
+                       .filter(event_id=event_id).order_by('created_at', 'pk').first())
+            if waiting is None or not take_seat(event_id):
+                if promoted:
+                    stats.count_booking(event_id, len(promoted))
+                return promoted
+            Booking.objects.create(user_id=waiting.user_id, event_id=event_id)
+            waiting.delete()
+            promoted.append(waiting.user_id)
+
+
+def cancel(booking):
+    # Returns the ID of the user promoted from the waitlist, if any
+    with transaction.atomic():
+        deleted, _ = Booking.objects.filter(pk=booking.pk).delete()
+        if not deleted:
+            return None
+        return free_seat(booking.event_id)
+
+
+def cancel_all(user_id):
+    # Cancel every booking of a user about to be deleted, so each seat goes
+    # to the waitlist as with cancel(); a CASCADE would leave Event.booked
+    # too high. Must run inside the transaction that deletes the user.
+    # Returns the IDs of the promoted users.
+    WaitlistEntry.objects.filter(user_id=user_id).delete()
+    promoted = [cancel(booking) for booking in Booking.objects.filter(user_id=user_id).order_by('pk')]
+    return [promoted_id for promoted_id in promoted if promoted_id is not None]
+
+
+def move(booking, event_id):
+    # Staff edits can move a booking to another event. The seat follows it
+    # without a capacity check, since staff may overbook on purpose.
+    # Returns the ID of the user promoted on the old event, if any.
+    promoted = None
+    with transaction.atomic():
+        if booking.event_id != event_id:
+            promoted = free_seat(booking.event_id)
+            Event.objects.filter(eventID=event_id).update(booked=F('booked') + 1)
+            stats.count_booking(event_id, 1)
+            booking.event_id = event_id
+        booking.save()
+    return promoted
@@ -0,0 +1,210 @@
+import time
+from functools import wraps
+from inspect import iscoroutinefunction
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .db_routing import primary
+
+# Caching for the public catalogue pages.
+# Every key includes the catalogue version, which signals bump whenever an
+# Event or Venue is saved or deleted. Old entries are never deleted; they
+# just stop being read and expire on their own.
+# Seats booked and star counts change without a save, so pages showing them
+# also key on the counters version, which stats.py bumps when they change.
+# The versions live in the default cache, so every process (web workers and
+# the task worker) must share it, e.g. through REDIS_URL; with a
+# process-local cache a bump is only seen by the process that made it.
+
+VERSION_KEY = 'pahangprism:catalogue-version'
+COUNTERS_KEY = 'pahangprism:counters-version'
+CHANGED_KEY = 'pahangprism:catalogue-changed-at'
+STATS_KEY = 'pahangprism:catalogue-cache:{}:{}'
+
+# Backends whose entries only the current process sees
+LOCAL_BACKENDS = {
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+}
+
+# Names of everything cached through this module, for stats()
+CACHED_NAMES = set()
+
+
+def _timeout():
+    return getattr(settings, 'CATALOGUE_CACHE_TIMEOUT', 3600)
+
+
+def is_shared():
+    # Whether other processes see this process's version bumps
+    return settings.CACHES['default']['BACKEND'] not in LOCAL_BACKENDS
+
+
+def _get(key):
+    version = cache.get(key)
+    if version is None:
+        # Seed from the clock so a lost version key can't bring back stale pages
+        cache.add(key, int(time.time()), None)
+        version = cache.get(key)
+    return version
+
+
+async def _aget(key):
+    version = await cache.aget(key)
+    if version is None:
+        await cache.aadd(key, int(time.time()), None)
+        version = await cache.aget(key)
+    return version
+
+
+def _bump(key):
+    try:
+        return cache.incr(key)
+    except ValueError:
+        _get(key)
+        return cache.incr(key)
+
+
+def get_version():
+    return _get(VERSION_KEY)
+
+
+async def aget_version():
+    return await _aget(VERSION_KEY)
+
+
+def bump_version():
+    cache.set(CHANGED_KEY, time.time(), None)
+    return _bump(VERSION_KEY)
+
+
+def get_counters_version():
+    return _get(COUNTERS_KEY)
+
+
+async def aget_counters_version():
+    return await _aget(COUNTERS_KEY)
+
+
+def bump_counters():
+    return _bump(COUNTERS_KEY)
+
+
+def changed_at():
+    # Unix time of the last catalogue change, for Last-Modified headers.
+    # If the key was lost, "now" is the safe answer.
+    changed = cache.get(CHANGED_KEY)
+    if changed is None:
+        cache.add(CHANGED_KEY, time.time(), None)
+        changed = cache.get(CHANGED_KEY)
+    return changed
+
+
+def _count(name, outcome):
+    key = STATS_KEY.format(name, outcome)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 0, None)
+        cache.incr(key)
+
+
+async def _acount(name, outcome):
+    key = STATS_KEY.format(name, outcome)
+    try:
+        await cache.aincr(key)
+    except ValueError:
+        await cache.aadd(key, 0, None)
+        await cache.aincr(key)
+
+
+def stats():
+    result = {'version': get_version()}
+    for name in sorted(CACHED_NAMES):
+        hits = cache.get(STATS_KEY.format(name, 'hits'), 0)
+        misses = cache.get(STATS_KEY.format(name, 'misses'), 0)
+        result[name] = {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': round(hits / (hits + misses), 3) if hits + misses else None,
+        }
+    return result
+
+
+def cached(name, build, *key_parts):
+    # Return the cached value for name at the current catalogue version,
+    # calling build() on a miss
+    CACHED_NAMES.add(name)
+    key = ':'.join(['pahangprism:catalogue', name, str(get_version())] + [str(part) for part in key_parts])
+    value = cache.get(key)
+    if value is None:
+        _count(name, 'misses')
+        with primary():
+            value = build()
+        cache.set(key, value, _timeout())
+    else:
+        _count(name, 'hits')
+    return value
+
+
+async def acached(name, build, *key_parts):
+    # Async cached(); build is an async callable
+    CACHED_NAMES.add(name)
+    key = ':'.join(['pahangprism:catalogue', name, str(await aget_version())] + [str(part) for part in key_parts])
+    value = await cache.aget(key)
+    if value is None:
+        await _acount(name, 'misses')
+        with primary():
+            value = await build()
+        await cache.aset(key, value, _timeout())
+    else:
+        await _acount(name, 'hits')
+    return value
+
+
+def cache_anonymous_page(name, vary_on=None):
+    # Cache the whole response for visitors who aren't logged in.
+    # Logged in users always go through the view, which renders their overlay.
+    # vary_on() returns a value to add to the key, for pages that also show
+    # data outside the catalogue.
+    def page_key(version, request):
+        extra = f':{vary_on()}' if vary_on else ''
+        return f'pahangprism:page:{name}:{version}{extra}:{request.get_full_path()}'
+
+    def decorator(view):
+        CACHED_NAMES.add(name)
+
+        if iscoroutinefunction(view):
+            @wraps(view)
+            async def awrapped(request, *args, **kwargs):
+                if request.method != 'GET' or await request.session.aget('userID'):
+                    return await view(request, *args, **kwargs)
+                key = page_key(await aget_version(), request)
+                response = await cache.aget(key)
+                if response is not None:
+                    await _acount(name, 'hits')
+                    return response
+                await _acount(name, 'misses')
+                response = await view(request, *args, **kwargs)
+                if response.status_code == 200 and not response.streaming and not response.cookies:
+                    await cache.aset(key, response, _timeout())
+                return response
+            return awrapped
+
+        @wraps(view)
+        def wrapped(request, *args, **kwargs):
+            if request.method != 'GET' or request.session.get('userID'):
+                return view(request, *args, **kwargs)
+            key = page_key(get_version(), request)
+            response = cache.get(key)
+            if response is not None:
+                _count(name, 'hits')
+                return response
+            _count(name, 'misses')
+            response = view(request, *args, **kwargs)
+            if response.status_code == 200 and not response.streaming and not response.cookies:
+                cache.set(key, response, _timeout())
+            return response
+        return wrapped
+    return decorator
@@ -0,0 +1,173 @@
+import csv
+import json
+import time
+from datetime import date
+
+from django.db import transaction
+
+from . import booking, catalogue_cache, geo, search_index, sequences
+from .models import Event, Venue
+
+# Bulk loader for the tourism board's season calendar.
+# Rows are read one at a time from CSV or JSONL, so memory use depends on
+# the batch size and the number of venues, not on the file size.
+#
+# Each row has a "type" of "venue" or "event" (or the importer's default):
+#   venue: venueID, name, location, optional latitude and longitude
+#   event: name, date (YYYY-MM-DD), venue (a venueID), optional capacity
+# Venues must come before the events that use them, or already exist.
+
+DEFAULT_BATCH_SIZE = 1000
+MAX_REPORTED_ERRORS = 50
+
+
+class ImportRowError(ValueError):
+    pass
+
+
+def detect_format(filename):
+    return 'jsonl' if filename.lower().endswith(('.jsonl', '.ndjson', '.json')) else 'csv'
+
+
+def iter_rows(stream, fmt):
+    # Yields (line number, dict) without reading the whole file.
+    # Lines that can't be parsed yield an ImportRowError instead of a dict.
+    if fmt == 'jsonl':
+        for line_no, line in enumerate(stream, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                row = json.loads(line)
+            except json.JSONDecodeError as e:
+                yield line_no, ImportRowError(f'invalid JSON ({e.msg})')
+                continue
+            if not isinstance(row, dict):
+                row = ImportRowError('expected a JSON object')
+            yield line_no, row
+    else:
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+
+
+def _field(row, name, model=None):
+    # The stripped value; with a model, also checked against its field's max_length,
+    # which bulk_create would otherwise only hit on Postgres, failing the batch
+    value = row.get(name)
+    value = '' if value is None else str(value).strip()
+    if not value:
+        raise ImportRowError(f'missing "{name}"')
+    max_length = model._meta.get_field(name).max_length if model else None
+    if max_length and len(value) > max_length:
+        raise ImportRowError(f'"{name}" is longer than {max_length} characters')
+    return value
+
+
+class ImportResult:
+    def __init__(self):
+        self.rows = 0
+        self.venues = 0
+        self.events = 0
+        self.errors = []
+        self.error_count = 0
+        self.elapsed = 0.0
+
+    @property
+    def rows_per_sec(self):
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+    def add_error(self, line_no, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(f'line {line_no}: {message}')
+
+    def summary(self):
+        return (f'{self.rows} rows ({self.venues} venues, {self.events} events), '
+                f'{self.error_count} errors in {self.elapsed:.2f}s ({self.rows_per_sec:.0f} rows/sec)')
+
+
+class CatalogueImporter:
+    def __init__(self, batch_size=DEFAULT_BATCH_SIZE, dry_run=False, default_type=None):
+        self.batch_size = batch_size
+        self.dry_run = dry_run
+        self.default_type = default_type
+        # venueID -> name, so events resolve their venue without a query per row
+        self.venues = dict(Venue.objects.values_list('venueID', 'name'))
+        self.venue_batch = []
+        self.event_batch = []
+        self.result = ImportResult()
+
+    def run(self, stream, fmt):
+        started = time.perf_counter()
+        try:
+            for line_no, row in iter_rows(stream, fmt):
+                self.result.rows += 1
+                try:
+                    if isinstance(row, ImportRowError):
+                        raise row
+                    self.add_row(row)
+                except ImportRowError as e:
+                    self.result.add_error(line_no, str(e))
+                if len(self.venue_batch) + len(self.event_batch) >= self.batch_size:
+                    self.flush()
+        except UnicodeDecodeError:
+            # Rows read so far are kept, as with any other bad row
+            self.result.add_error(self.result.rows + 1, 'file is not UTF-8 text; stopped reading here')
+        self.flush()
+        self.result.elapsed = time.perf_counter() - started
+        return self.result
+
+    def add_row(self, row):
+        kind = str(row.get('type') or self.default_type or '').strip().lower()
+        if kind == 'venue':
+            venue_id = _field(row, 'venueID', Venue)
+            if venue_id in self.venues:
+                raise ImportRowError(f'venue {venue_id} already exists')
+            try:
+                latitude, longitude = geo.parse_coordinates(row.get('latitude'), row.get('longitude'))
+            except geo.InvalidLocation as e:
+                raise ImportRowError(str(e))
+            venue = Venue(venueID=venue_id, name=_field(row, 'name', Venue), location=_field(row, 'location', Venue),
+                          latitude=latitude, longitude=longitude, geohash=geo.geohash_for(latitude, longitude))
+            self.venues[venue_id] = venue.name
+            self.venue_batch.append(venue)
+        elif kind == 'event':
+            venue_id = _field(row, 'venue')
+            if venue_id not in self.venues:
+                raise ImportRowError(f'unknown venue {venue_id}')
+            try:
+                event_date = date.fromisoformat(_field(row, 'date'))
+            except ValueError:
+                raise ImportRowError(f'invalid date "{row.get("date")}"')
+            try:
+                capacity = booking.parse_capacity(row.get('capacity'))
+            except booking.InvalidCapacity as e:
+                raise ImportRowError(str(e))
+            self.event_batch.append(Event(name=_field(row, 'name', Event), date=event_date, venue_id=venue_id,
+                                          capacity=capacity))
+        else:
+            raise ImportRowError(f'unknown row type "{kind}"')
+
+    def flush(self):
+        venues, events = self.venue_batch, self.event_batch
+        self.venue_batch, self.event_batch = [], []
+        if not venues and not events:
+            return
+        if not self.dry_run:
+            with transaction.atomic():
+                # bulk_create skips Event.save, so IDs come from one counter bump per batch
+                if events:
+                    for event, event_id in zip(events, sequences.event_ids(len(events))):
+                        event.eventID = event_id
+                Venue.objects.bulk_create(venues, batch_size=self.batch_size)
+                Event.objects.bulk_create(events, batch_size=self.batch_size)
+                # bulk_create doesn't send post_save, so index the batch here
+                search_index.index_documents(
+                    [search_index.venue_document(venue) for venue in venues] +
+                    [('event', event.eventID, event.name, self.venues[event.venue_id]) for event in events]
+                )
+            # bulk_create doesn't send the signals that bump the version either
+            catalogue_cache.bump_version()
+        self.result.venues += len(venues)
+        self.result.events += len(events)
@@ -0,0 +1,76 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import check_password, identify_hasher, make_password
+from django.utils.crypto import constant_time_compare
+
+from .models import User
+
+# Passwords of PahangPrism users.
+# Hashes use the first of settings.PASSWORD_HASHERS (argon2 by default).
+# Older rows may still hold plaintext or a hash from another hasher; they
+# are checked as-is and rewritten with the preferred hasher on the next
+# successful login.
+#
+# Hashing is deliberately slow CPU work, so it runs in a small shared
+# thread pool (PASSWORD_HASH_WORKERS): a burst of logins queues there
+# instead of occupying every worker thread, and async callers await it
+# without blocking the event loop.
+
+_pool = ThreadPoolExecutor(
+    max_workers=getattr(settings, 'PASSWORD_HASH_WORKERS', 2),
+    thread_name_prefix='password-hash',
+)
+
+
+def hash_password(raw_password):
+    return _pool.submit(make_password, raw_password).result()
+
+
+def is_hashed(stored):
+    try:
+        identify_hasher(stored)
+    except ValueError:
+        return False
+    return True
+
+
+def _check(raw_password, stored):
+    # Returns (matches, new_hash); new_hash is set when the row should be upgraded
+    if not stored:
+        # Same work as a real check, so unknown emails don't answer faster
+        make_password(raw_password)
+        return False, None
+    if not is_hashed(stored):
+        if constant_time_compare(raw_password, stored):
+            return True, make_password(raw_password)
+        return False, None
+
+    upgraded = []
+    matches = check_password(raw_password, stored, setter=lambda raw: upgraded.append(make_password(raw)))
+    return matches, upgraded[0] if upgraded else None
+
+
+def authenticate(email, raw_password):
+    # Returns the matching User or None
+    user = User.objects.filter(email=email).first()
+    matches, new_hash = _pool.submit(_check, raw_password, user.password if user else None).result()
+    if not matches:
+        return None
+    if new_hash:
+        user.password = new_hash
+        user.save(update_fields=['password'])
+    return user
+
+
+async def aauthenticate(email, raw_password):
+    user = await User.objects.filter(email=email).afirst()
+    matches, new_hash = await asyncio.wrap_future(
+        _pool.submit(_check, raw_password, user.password if user else None))
+    if not matches:
+        return None
+    if new_hash:
+        user.password = new_hash
+        await user.asave(update_fields=['password'])
+    return user
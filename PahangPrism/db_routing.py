@@ -0,0 +1,134 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+
+# Primary/replica routing.
+# Writes and ordinary reads go to 'default'. Views wrapped in
+# @read_from_replica (the catalogue pages) read PahangPrism models from
+# the optional 'replica' database instead, except:
+#   - after the request itself has written, and
+#   - for REPLICA_PIN_SECONDS after the same browser wrote, tracked with a
+#     cookie set by ReplicaPinMiddleware (read-your-writes).
+# Other apps (sessions, auth, admin) always use the primary, and so do
+# catalogue_cache fills, so a lagging replica can't be cached under a new
+# catalogue version.
+
+REPLICA = 'replica'
+PIN_COOKIE = 'pahangprism_primary'
+
+# Per-request routing state: {'replica': bool, 'wrote': bool}
+_state = ContextVar('pahangprism_db_routing', default=None)
+
+
+def replica_configured():
+    return REPLICA in connections.settings
+
+
+def _ours(model):
+    return model._meta.app_label == 'PahangPrism'
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state and state['replica'] and not state['wrote'] and _ours(model) and replica_configured():
+            return REPLICA
+        return None
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None and _ours(model):
+            state['wrote'] = True
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replica holds the same rows as the primary
+        return True
+
+
+@contextmanager
+def primary():
+    # Reads inside the block use the primary even in a @read_from_replica view
+    state = _state.get()
+    on_replica = state is not None and state['replica']
+    if on_replica:
+        state['replica'] = False
+    try:
+        yield
+    finally:
+        if on_replica:
+            state['replica'] = True
+
+
+def read_from_replica(view):
+    def allowed(request):
+        state = _state.get()
+        return state is not None and not state['wrote'] and PIN_COOKIE not in request.COOKIES
+
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def awrapped(request, *args, **kwargs):
+            state = _state.get()
+            if allowed(request):
+                state['replica'] = True
+            try:
+                return await view(request, *args, **kwargs)
+            finally:
+                if state is not None:
+                    state['replica'] = False
+        return awrapped
+
+    @wraps(view)
+    def wrapped(request, *args, **kwargs):
+        state = _state.get()
+        if allowed(request):
+            state['replica'] = True
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            if state is not None:
+                state['replica'] = False
+    return wrapped
+
+
+class ReplicaPinMiddleware:
+    # Starts each request's routing state and pins the browser to the
+    # primary for a while after any PahangPrism write
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def _pin(self, state, response):
+        if state['wrote']:
+            pin_seconds = getattr(settings, 'REPLICA_PIN_SECONDS', 10)
+            response.set_cookie(PIN_COOKIE, str(int(time.time()) + pin_seconds),
+                                max_age=pin_seconds, httponly=True, samesite='Lax')
+        return response
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        state = {'replica': False, 'wrote': False}
+        token = _state.set(state)
+        try:
+            return self._pin(state, self.get_response(request))
+        finally:
+            _state.reset(token)
+
+    async def __acall__(self, request):
+        state = {'replica': False, 'wrote': False}
+        token = _state.set(state)
+        try:
+            return self._pin(state, await self.get_response(request))
+        finally:
+            _state.reset(token)
@@ -0,0 +1,127 @@
+from datetime import date
+
+from django.http import JsonResponse
+from django.shortcuts import render
+from django.template.loader import render_to_string
+
+from . import catalogue_cache
+from .models import Event, Venue
+from .pagination import akeyset_page, keyset_page, page_size
+
+# The public event listing: a date window (upcoming events by default),
+# an optional venue, and keyset pages over (date, eventID), which the
+# event_date_id_idx / event_venue_date_id_idx indexes serve directly, so
+# page 1 and page 10,000 cost the same whatever the size of the table.
+# Pages are cached per filter and cursor until the catalogue changes, or
+# the seats booked or star counts they show do.
+
+EVENT_PAGE_SIZE = 24
+ORDERING = ['date', 'eventID']
+
+
+class InvalidFilter(ValueError):
+    pass
+
+
+def _date(value, default):
+    if not value:
+        return default
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise InvalidFilter(value)
+
+
+def parse_filters(params):
+    # {'start', 'end', 'venue'} from the query string; the window starts today unless 'from' is given
+    filters = {
+        'start': _date(params.get('from'), date.today()),
+        'end': _date(params.get('to'), None),
+        'venue': params.get('venue') or None,
+    }
+    if filters['end'] and filters['end'] < filters['start']:
+        raise InvalidFilter(params.get('to'))
+    return filters
+
+
+def queryset(filters):
+    events = Event.objects.select_related('venue').filter(date__gte=filters['start'])
+    if filters['end']:
+        events = events.filter(date__lte=filters['end'])
+    if filters['venue']:
+        events = events.filter(venue_id=filters['venue'])
+    return events
+
+
+def _key_parts(filters, cursor, limit):
+    return [filters['start'], filters['end'], filters['venue'], cursor, limit]
+
+
+def get_page(filters, cursor=None, limit=None):
+    # (events, next_cursor); raises pagination.InvalidCursor for a bad cursor
+    limit = page_size(limit, EVENT_PAGE_SIZE)
+    return catalogue_cache.cached(
+        'events', lambda: keyset_page(queryset(filters), ORDERING, cursor, limit),
+        catalogue_cache.get_counters_version(), *_key_parts(filters, cursor, limit))
+
+
+async def aget_page(filters, cursor=None, limit=None):
+    limit = page_size(limit, EVENT_PAGE_SIZE)
+
+    async def build():
+        return await akeyset_page(queryset(filters), ORDERING, cursor, limit)
+
+    return await catalogue_cache.acached('events', build, await catalogue_cache.aget_counters_version(),
+                                         *_key_parts(filters, cursor, limit))
+
+
+def venue_choices():
+    # (venueID, name) pairs for the venue filter
+    return catalogue_cache.cached(
+        'venue_choices', lambda: list(Venue.objects.order_by('name').values_list('venueID', 'name')))
+
+
+async def avenue_choices():
+    async def build():
+        return [choice async for choice in Venue.objects.order_by('name').values_list('venueID', 'name')]
+
+    return await catalogue_cache.acached('venue_choices', build)
+
+
+def as_json(event, starred_events, booked_events):
+    return {
+        'id': event.eventID,
+        'name': event.name,
+        'date': event.date.isoformat(),
+        'venue': {'id': event.venue_id, 'name': event.venue.name},
+        'capacity': event.capacity,
+        'booked': event.booked,
+        'star_count': event.star_count,
+        'starred': event.eventID in starred_events,
+        'is_booked': event.eventID in booked_events,
+    }
+
+
+def response(request, filters, events, next_cursor, state, venues):
+    # The page, or with ?format=json the next batch of cards for infinite scroll
+    next_url = None
+    if next_cursor:
+        params = request.GET.copy()
+        params['cursor'] = next_cursor
+        params.pop('format', None)
+        next_url = f'{request.path}?{params.urlencode()}'
+    context = {
+        'events': events,
+        'next_url': next_url,
+        'filters': filters,
+        'venues': venues,
+        'starred_events': state['starred_events'],
+        'booked_events': state['booked_events'],
+    }
+    if request.GET.get('format') == 'json':
+        return JsonResponse({
+            'events': [as_json(event, state['starred_events'], state['booked_events']) for event in events],
+            'html': render_to_string('event_cards.html', context, request),
+            'next': next_url,
+        })
+    return render(request, 'event_list.html', context)
@@ -0,0 +1,241 @@
+import hashlib
+from datetime import date, datetime, timedelta, timezone
+from urllib.parse import quote
+from xml.sax.saxutils import escape
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+from django.http import Http404, HttpResponse, HttpResponseBadRequest, StreamingHttpResponse
+from django.urls import reverse
+from django.utils.cache import patch_cache_control
+from django.utils.http import http_date
+from django.views.decorators.http import condition, require_GET
+
+from . import catalogue_cache, event_listing, user_state
+from .db_routing import read_from_replica
+from .models import Event
+
+# Calendar feeds: iCalendar (RFC 5545) and RSS 2.0 for the upcoming
+# events, with the event list's from / to / venue filters, and a private
+# iCalendar feed of each user's bookings behind a signed token, since
+# calendar apps can't log in.
+# Calendar apps poll every few minutes, so every feed has an ETag built
+# from the catalogue version (and the user's last booking change), kept in
+# the cache: an unchanged feed is a 304 without a query. Bodies are
+# streamed from iterator() querysets so a large calendar never sits in
+# memory; those under CACHE_MAX_BYTES are also cached until the version
+# changes.
+
+PRODID = '-//Pahang Prism//Events//EN'
+MAX_AGE = 300  # Seconds clients may reuse a feed without asking
+CACHE_MAX_BYTES = 512 * 1024
+CHUNK_BYTES = 64 * 1024
+ITERATOR_CHUNK_SIZE = 500
+
+# Feeds read plain rows, not model instances (and their JSON image fields)
+EVENT_COLUMNS = ['eventID', 'name', 'date', 'venue_id', 'venue__name', 'venue__location']
+
+ICAL_TYPE = 'text/calendar; charset=utf-8'
+RSS_TYPE = 'application/rss+xml; charset=utf-8'
+
+_signer = signing.Signer(salt='PahangPrism.feeds.bookings')
+
+
+def bookings_token(user_id):
+    return _signer.sign(str(user_id))
+
+
+def _token_user(token):
+    try:
+        return int(_signer.unsign(token))
+    except (signing.BadSignature, ValueError):
+        return None
+
+
+def bookings_url(request, user_id):
+    return request.build_absolute_uri(reverse('bookings_ical', args=[bookings_token(user_id)]))
+
+
+def _etag(*parts):
+    return hashlib.sha1(':'.join(str(part) for part in parts).encode()).hexdigest()
+
+
+# iCalendar text
+
+def _ical_text(value):
+    return (value.replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,')
+            .replace('\r\n', '\\n').replace('\n', '\\n'))
+
+
+def _fold(line):
+    # Content lines are at most 75 octets; longer ones continue after CRLF + space
+    encoded = line.encode()
+    if len(encoded) <= 75:
+        return line + '\r\n'
+    parts, start, limit = [], 0, 75
+    while start < len(encoded):
+        end = min(start + limit, len(encoded))
+        while end < len(encoded) and (encoded[end] & 0xC0) == 0x80:
+            end -= 1  # Don't split a UTF-8 sequence
+        parts.append(encoded[start:end].decode())
+        start, limit = end, 74
+    return '\r\n '.join(parts) + '\r\n'
+
+
+def _ical_stamp(timestamp):
+    return datetime.fromtimestamp(int(timestamp), timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+
+
+def _vevent(event, host, stamp, status=None):
+    location = f'{event["venue__name"]}, {event["venue__location"]}'
+    lines = [
+        'BEGIN:VEVENT',
+        f'UID:{event["eventID"]}@{host}',
+        f'DTSTAMP:{stamp}',
+        f'DTSTART;VALUE=DATE:{event["date"]:%Y%m%d}',
+        f'DTEND;VALUE=DATE:{event["date"] + timedelta(days=1):%Y%m%d}',
+        f'SUMMARY:{_ical_text(event["name"])}',
+        f'LOCATION:{_ical_text(location)}',
+    ]
+    if status:
+        lines.append(f'STATUS:{status}')
+    lines.append('END:VEVENT')
+    return ''.join(_fold(line) for line in lines)
+
+
+def _calendar(name, events, host, stamp, status=None):
+    yield ''.join(_fold(line) for line in [
+        'BEGIN:VCALENDAR', 'VERSION:2.0', f'PRODID:{PRODID}', 'CALSCALE:GREGORIAN',
+        f'X-WR-CALNAME:{_ical_text(name)}', f'REFRESH-INTERVAL;VALUE=DURATION:PT{MAX_AGE // 60}M',
+    ])
+    for event in events:
+        yield _vevent(event, host, stamp, status)
+    yield 'END:VCALENDAR\r\n'
+
+
+# RSS
+
+def _rss(title, link, events, changed):
+    yield (f'<?xml version="1.0" encoding="utf-8"?>\n<rss version="2.0"><channel>'
+           f'<title>{escape(title)}</title><link>{escape(link)}</link>'
+           f'<description>Upcoming events in Pahang</description>'
+           f'<lastBuildDate>{http_date(changed)}</lastBuildDate><ttl>{MAX_AGE // 60}</ttl>')
+    for event in events:
+        url = f'{link}?venue={quote(event["venue_id"])}&from={event["date"]:%Y-%m-%d}'
+        where = f'{event["date"]:%d %b %Y} at {event["venue__name"]}, {event["venue__location"]}'
+        yield (f'<item><title>{escape(event["name"])}</title><link>{escape(url)}</link>'
+               f'<description>{escape(where)}</description>'
+               f'<guid isPermaLink="false">{escape(event["eventID"])}</guid></item>')
+    yield '</channel></rss>\n'
+
+
+# Responses
+
+def _chunks(parts):
+    # Join small parts into CHUNK_BYTES writes
+    buffer, size = [], 0
+    for part in parts:
+        buffer.append(part)
+        size += len(part)
+        if size >= CHUNK_BYTES:
+            yield ''.join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield ''.join(buffer)
+
+
+def _caching(key, chunks):
+    # Pass chunks through, and cache the whole body if it stays small
+    body, size = [], 0
+    for chunk in chunks:
+        if body is not None:
+            body.append(chunk)
+            size += len(chunk)
+            if size > CACHE_MAX_BYTES:
+                body = None
+        yield chunk
+    if body is not None:
+        cache.set(key, ''.join(body), settings.CATALOGUE_CACHE_TIMEOUT)
+
+
+def _feed_response(key, content_type, parts, private=False):
+    body = cache.get(key)
+    if body is not None:
+        response = HttpResponse(body, content_type=content_type)
+    else:
+        response = StreamingHttpResponse(_caching(key, _chunks(parts)), content_type=content_type)
+    patch_cache_control(response, max_age=MAX_AGE, **({'private': True} if private else {'public': True}))
+    return response
+
+
+def _public_etag(request, *args, **kwargs):
+    # The default window starts today, so the date is part of the version
+    return _etag('feed', catalogue_cache.get_version(), date.today(), request.get_full_path())
+
+
+def _public_last_modified(request, *args, **kwargs):
+    return datetime.fromtimestamp(int(catalogue_cache.changed_at()), timezone.utc)
+
+
+def _upcoming(request):
+    # Events in the requested window, read on the database the view picked
+    filters = event_listing.parse_filters(request.GET)
+    events = event_listing.queryset(filters).order_by(*event_listing.ORDERING).values(*EVENT_COLUMNS)
+    return events.using(events.db).iterator(chunk_size=ITERATOR_CHUNK_SIZE)
+
+
+@require_GET
+@condition(_public_etag, _public_last_modified)
+@read_from_replica
+def events_ical(request):
+    try:
+        events = _upcoming(request)
+    except event_listing.InvalidFilter:
+        return HttpResponseBadRequest('Invalid filter')
+    stamp = _ical_stamp(catalogue_cache.changed_at())
+    parts = _calendar('Pahang Prism events', events, request.get_host(), stamp)
+    return _feed_response(f'pahangprism:feed:{_public_etag(request)}', ICAL_TYPE, parts)
+
+
+@require_GET
+@condition(_public_etag, _public_last_modified)
+@read_from_replica
+def events_rss(request):
+    try:
+        events = _upcoming(request)
+    except event_listing.InvalidFilter:
+        return HttpResponseBadRequest('Invalid filter')
+    parts = _rss('Pahang Prism events', request.build_absolute_uri(reverse('event_list')), events,
+                 catalogue_cache.changed_at())
+    return _feed_response(f'pahangprism:feed:{_public_etag(request)}', RSS_TYPE, parts)
+
+
+def _bookings_version(token):
+    user_id = _token_user(token)
+    if user_id is None:
+        return None
+    return user_id, max(catalogue_cache.changed_at(), user_state.changed_at(user_id))
+
+
+def _bookings_etag(request, token):
+    version = _bookings_version(token)
+    return version and _etag('bookings', catalogue_cache.get_version(), *version)
+
+
+def _bookings_last_modified(request, token):
+    version = _bookings_version(token)
+    return version and datetime.fromtimestamp(int(version[1]), timezone.utc)
+
+
+@require_GET
+@condition(_bookings_etag, _bookings_last_modified)
+def bookings_ical(request, token):
+    user_id = _token_user(token)
+    if user_id is None:
+        raise Http404
+    events = (Event.objects.filter(booking__user_id=user_id).order_by(*event_listing.ORDERING)
+              .values(*EVENT_COLUMNS).iterator(chunk_size=ITERATOR_CHUNK_SIZE))
+    stamp = _ical_stamp(_bookings_version(token)[1])
+    parts = _calendar('My Pahang Prism bookings', events, request.get_host(), stamp, status='CONFIRMED')
+    return _feed_response(f'pahangprism:feed:{_bookings_etag(request, token)}', ICAL_TYPE, parts, private=True)
@@ -0,0 +1,262 @@
+import math
+from collections import defaultdict
+
+from django.core.exceptions import ValidationError
+from django.db.models import DateField, F, Q, Window
+from django.db.models.functions import RowNumber
+
+from .models import Venue
+from .pagination import InvalidCursor, decode_cursor, encode_cursor
+
+# Proximity search over venue coordinates without PostGIS.
+# Each venue stores a geohash of its latitude/longitude (see Venue.save):
+# nearby points share a prefix, so the cells covering a search circle's
+# bounding box are a few range scans on venue_geohash_idx, which works
+# the same on SQLite and Postgres. Those candidates are cut to the box
+# by latitude/longitude, then to the circle by exact haversine distance,
+# and sorted by distance. Longitudes are not wrapped at +/-180 degrees.
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+GEOHASH_PRECISION = 9  # ~5m cells, stored on Venue
+MAX_CELLS = 16  # Range scans per search; coarser cells are used beyond this
+
+DEFAULT_RADIUS_KM = 25
+MAX_RADIUS_KM = 500
+INITIAL_REACH_KM = 1  # First circle nearest() tries before widening
+# Venues whose events one page of events_near() may look at, VENUE_BATCH to
+# a query; past this the page comes back short, with a cursor to carry on from
+MAX_VENUES_PER_PAGE = 200  # A multiple of VENUE_BATCH
+VENUE_BATCH = 50
+
+
+class InvalidLocation(ValueError):
+    pass
+
+
+def encode(latitude, longitude, precision=GEOHASH_PRECISION):
+    # Standard geohash: interleaved longitude/latitude bisections, 5 bits per character
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, value, even = [], 0, 0, True
+    while len(chars) < precision:
+        target, bounds = (longitude, lon_range) if even else (latitude, lat_range)
+        middle = (bounds[0] + bounds[1]) / 2
+        value <<= 1
+        if target >= middle:
+            value |= 1
+            bounds[0] = middle
+        else:
+            bounds[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(BASE32[value])
+            bits, value = 0, 0
+    return ''.join(chars)
+
+
+def geohash_for(latitude, longitude):
+    # The stored geohash; '' for venues without coordinates, which no search finds
+    if latitude is None or longitude is None:
+        return ''
+    return encode(latitude, longitude)
+
+
+def cell_size(precision):
+    # (degrees of latitude, degrees of longitude) covered by one cell
+    lon_bits = (5 * precision + 1) // 2
+    lat_bits = 5 * precision // 2
+    return 180 / 2 ** lat_bits, 360 / 2 ** lon_bits
+
+
+def distance_km(lat1, lon1, lat2, lon2):
+    # Haversine great-circle distance
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    a = (math.sin((phi2 - phi1) / 2) ** 2
+         + math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def bounding_box(latitude, longitude, radius_km):
+    # (min_lat, max_lat, min_lon, max_lon) enclosing the circle
+    d_lat = radius_km / KM_PER_DEGREE
+    min_lat, max_lat = max(-90.0, latitude - d_lat), min(90.0, latitude + d_lat)
+    if min_lat == -90.0 or max_lat == 90.0:
+        return min_lat, max_lat, -180.0, 180.0
+    # Widest at the latitude nearest a pole
+    d_lon = d_lat / math.cos(math.radians(max(abs(min_lat), abs(max_lat))))
+    return min_lat, max_lat, max(-180.0, longitude - d_lon), min(180.0, longitude + d_lon)
+
+
+def covering_cells(box):
+    # Geohash prefixes of the finest precision whose cells cover box in at most MAX_CELLS
+    min_lat, max_lat, min_lon, max_lon = box
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        lat_step, lon_step = cell_size(precision)
+        rows = math.floor(max_lat / lat_step) - math.floor(min_lat / lat_step) + 1
+        columns = math.floor(max_lon / lon_step) - math.floor(min_lon / lon_step) + 1
+        if rows * columns <= MAX_CELLS:
+            break
+    cells = set()
+    for row in range(rows):
+        latitude = min(max_lat, min_lat + row * lat_step)
+        for column in range(columns):
+            cells.add(encode(latitude, min(max_lon, min_lon + column * lon_step), precision))
+    # The corners, in case stepping from the minimum skipped past a boundary
+    for latitude in (min_lat, max_lat):
+        for longitude in (min_lon, max_lon):
+            cells.add(encode(latitude, longitude, precision))
+    return sorted(cells)
+
+
+def _successor(prefix):
+    # Smallest string above every string starting with prefix, in geohash characters
+    while prefix and prefix[-1] == BASE32[-1]:
+        prefix = prefix[:-1]
+    if not prefix:
+        return None
+    return prefix[:-1] + BASE32[BASE32.index(prefix[-1]) + 1]
+
+
+def _cell_filter(cells):
+    # Range conditions rather than LIKE, which SQLite can't serve from the index
+    condition = Q()
+    for cell in cells:
+        upper = _successor(cell)
+        condition |= Q(geohash__gte=cell, geohash__lt=upper) if upper else Q(geohash__gte=cell)
+    return condition
+
+
+def parse_coordinates(latitude, longitude):
+    # (latitude, longitude) as floats from form or file values; (None, None) if both are blank
+    latitude, longitude = (str(value if value is not None else '').strip() for value in (latitude, longitude))
+    if not latitude and not longitude:
+        return None, None
+    try:
+        latitude, longitude = float(latitude), float(longitude)
+    except ValueError:
+        raise InvalidLocation('latitude and longitude must be numbers')
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        raise InvalidLocation('latitude or longitude out of range')
+    return latitude, longitude
+
+
+def parse_location(params):
+    # (latitude, longitude, radius_km) from ?lat=&lon=&radius=
+    latitude, longitude = parse_coordinates(params.get('lat'), params.get('lon'))
+    if latitude is None:
+        raise InvalidLocation('lat and lon are required')
+    try:
+        radius = float(params.get('radius') or DEFAULT_RADIUS_KM)
+    except ValueError:
+        raise InvalidLocation('radius must be a number')
+    if not 0 < radius <= MAX_RADIUS_KM:
+        raise InvalidLocation(f'radius must be between 0 and {MAX_RADIUS_KM} km')
+    return latitude, longitude, radius
+
+
+def venues_within(latitude, longitude, radius_km):
+    # [(distance_km, venueID)] for every venue in the circle, nearest first
+    box = bounding_box(latitude, longitude, radius_km)
+    candidates = (Venue.objects.filter(_cell_filter(covering_cells(box)))
+                  .filter(latitude__range=box[:2], longitude__range=box[2:])
+                  .values_list('venueID', 'latitude', 'longitude'))
+    hits = []
+    for venue_id, venue_lat, venue_lon in candidates:
+        distance = distance_km(latitude, longitude, venue_lat, venue_lon)
+        if distance <= radius_km:
+            hits.append((distance, venue_id))
+    hits.sort()
+    return hits
+
+
+def nearest(latitude, longitude, radius_km, count, after=None, inclusive=False):
+    # The first `count` venues of venues_within() that come after the
+    # (distance_km, venueID) `after` (or are it, if inclusive). The circle
+    # searched grows from just past `after` until it holds enough venues, so
+    # a page in a dense area doesn't measure every venue out to radius_km.
+    start = after[0] if after else 0
+    reach = min(radius_km, start + INITIAL_REACH_KM)
+    while True:
+        hits = venues_within(latitude, longitude, reach)
+        if after:
+            hits = [hit for hit in hits if hit >= after] if inclusive else [hit for hit in hits if hit > after]
+        if len(hits) >= count or reach >= radius_km:
+            return hits[:count]
+        reach = min(radius_km, start + (reach - start) * 4)
+
+
+def _cursor(values, size):
+    if not values:
+        return None
+    values = decode_cursor(values)
+    if (len(values) != size or isinstance(values[0], bool) or not isinstance(values[0], (int, float))
+            or not isinstance(values[1], str)):
+        raise InvalidCursor(values)
+    return values
+
+
+def _events_cursor(cursor):
+    # [distance, venueID, date, eventID]; the last two are both None at the start of a venue
+    after = _cursor(cursor, 4)
+    if not after:
+        return after
+    if after[2] is None and after[3] is None:
+        return after
+    if not isinstance(after[2], str) or not isinstance(after[3], str):
+        raise InvalidCursor(after)
+    try:
+        after[2] = DateField().to_python(after[2])
+    except ValidationError:
+        raise InvalidCursor(after)
+    return after
+
+
+def venues_near(latitude, longitude, radius_km, cursor=None, limit=20):
+    # One page of venues_within(); returns ([(distance_km, venueID)], next_cursor)
+    after = _cursor(cursor, 2)
+    hits = nearest(latitude, longitude, radius_km, limit + 1, after and tuple(after))
+    next_cursor = encode_cursor(hits[limit - 1]) if len(hits) > limit else None
+    return hits[:limit], next_cursor
+
+
+def events_near(latitude, longitude, radius_km, events, fields, cursor=None, limit=20):
+    # One page of events (a queryset, e.g. upcoming ones) at venues in the
+    # circle: nearest venue first, then by date. Rows are values(*fields)
+    # dicts plus 'distance_km'. Returns (rows, next_cursor).
+    after = _events_cursor(cursor)
+    fields = list(dict.fromkeys(list(fields) + ['venue_id', 'date', 'eventID']))
+    # Venues are read VENUE_BATCH at a time with one query for each batch,
+    # taking at most the limit + 1 first events of every venue in it
+    first_events = Window(RowNumber(), partition_by=[F('venue_id')], order_by=[F('date'), F('eventID')])
+    position, inclusive = after and tuple(after[:2]), True
+    rows, visited = [], 0
+    while True:
+        if visited == MAX_VENUES_PER_PAGE:
+            # Carry on from the start of the next venue on the next page
+            following = nearest(latitude, longitude, radius_km, 1, position)
+            return rows, following and encode_cursor([*following[0], None, None])
+        batch = nearest(latitude, longitude, radius_km, VENUE_BATCH, position, inclusive)
+        if not batch:
+            return rows, None
+        venue_events = events.filter(venue_id__in=[venue_id for _, venue_id in batch])
+        if after and visited == 0 and after[2] is not None:
+            # The rest of the venue the last page stopped in
+            venue_events = venue_events.exclude(
+                Q(venue_id=after[1]) & (Q(date__lt=after[2]) | Q(date=after[2], eventID__lte=after[3])))
+        by_venue = defaultdict(list)
+        for row in (venue_events.annotate(position=first_events).filter(position__lte=limit + 1)
+                    .order_by('venue_id', 'date', 'eventID').values(*fields)):
+            by_venue[row['venue_id']].append(row)
+        for distance, venue_id in batch:
+            for row in by_venue[venue_id]:
+                row['distance_km'] = distance
+                rows.append(row)
+        if len(rows) > limit:
+            rows = rows[:limit]
+            last = rows[-1]
+            return rows, encode_cursor([last['distance_km'], last['venue_id'], last['date'], last['eventID']])
+        position, inclusive = batch[-1], False
+        visited += len(batch)
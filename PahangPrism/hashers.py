@@ -0,0 +1,13 @@
+from django.conf import settings
+from django.contrib.auth.hashers import Argon2PasswordHasher
+
+
+class TunedArgon2PasswordHasher(Argon2PasswordHasher):
+    # Django's argon2 defaults use 100 MiB and 8 lanes per hash, which caps
+    # a small worker at a few logins per second. These default to the
+    # OWASP baseline (19 MiB, 2 passes, 1 lane) and can be raised from
+    # settings. Hashes made with other parameters still verify and are
+    # rehashed on the next login.
+    time_cost = getattr(settings, 'ARGON2_TIME_COST', 2)
+    memory_cost = getattr(settings, 'ARGON2_MEMORY_COST', 19456)
+    parallelism = getattr(settings, 'ARGON2_PARALLELISM', 1)
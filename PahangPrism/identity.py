@@ -0,0 +1,54 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.deprecation import MiddlewareMixin
+from django.utils.functional import SimpleLazyObject
+
+from .models import User
+
+# The logged in PahangPrism user.
+# Login stores the user's ID in the session; IdentityMiddleware exposes the
+# matching User as request.pahang_user (request.user is the unrelated
+# contrib.auth user). It is loaded on first access, at most once per
+# request, and from the cache when warm. User saves and deletes invalidate
+# the cached copy (see signals.py). The password is never cached.
+
+
+def _key(user_id):
+    return f'pahangprism:identity:{user_id}'
+
+
+def _timeout():
+    return getattr(settings, 'IDENTITY_CACHE_TIMEOUT', 300)
+
+
+def get_user(user_id):
+    # Returns None when logged out or when the user no longer exists
+    if not user_id:
+        return None
+    user = cache.get(_key(user_id))
+    if user is None:
+        user = User.objects.defer('password').filter(userID=user_id).first()
+        if user is not None:
+            cache.set(_key(user_id), user, _timeout())
+    return user
+
+
+async def aget_user(user_id):
+    if not user_id:
+        return None
+    user = await cache.aget(_key(user_id))
+    if user is None:
+        user = await User.objects.defer('password').filter(userID=user_id).afirst()
+        if user is not None:
+            await cache.aset(_key(user_id), user, _timeout())
+    return user
+
+
+def invalidate(user_id):
+    if user_id:
+        cache.delete(_key(user_id))
+
+
+class IdentityMiddleware(MiddlewareMixin):
+    def process_request(self, request):
+        request.pahang_user = SimpleLazyObject(lambda: get_user(request.session.get('userID')))
@@ -0,0 +1,150 @@
+import hashlib
+import io
+
+from django.contrib.staticfiles import finders
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
+# Event/venue image pipeline.
+# An upload is stored once as the original, then resized (by the
+# process_image task) into the VARIANTS widths and encoded as AVIF, WebP
+# and JPEG. File names carry a hash of the original's bytes, so they never
+# change for the same picture and can be served with a one-year immutable
+# cache header (see views.serve_media).
+#
+# Pillow is only needed when processing; pages render from the stored
+# variants without it.
+
+VARIANTS = {
+    'thumb': 320,
+    'card': 640,
+    'hero': 1600,
+}
+# Preferred first; the template offers each to the browser in this order
+FORMATS = ['avif', 'webp', 'jpeg']
+QUALITY = {'avif': 55, 'webp': 75, 'jpeg': 80}
+MIME_TYPES = {'avif': 'image/avif', 'webp': 'image/webp', 'jpeg': 'image/jpeg'}
+EXTENSIONS = {'avif': 'avif', 'webp': 'webp', 'jpeg': 'jpg'}
+
+IMAGE_ROOT = 'images'
+# Extension of a stored original, by the format Pillow detects in it
+ORIGINAL_EXTENSIONS = {'JPEG': 'jpg', 'PNG': 'png', 'GIF': 'gif', 'WEBP': 'webp', 'AVIF': 'avif', 'TIFF': 'tif'}
+
+
+class InvalidImage(ValueError):
+    pass
+
+
+def _pillow():
+    try:
+        from PIL import Image, ImageOps, features
+    except ImportError:
+        raise ImproperlyConfigured('Pillow is required to process event and venue images.')
+    return Image, ImageOps, features
+
+
+def available_formats():
+    _, _, features = _pillow()
+    return [fmt for fmt in FORMATS if fmt == 'jpeg' or features.check(fmt)]
+
+
+def digest(data):
+    return hashlib.sha256(data).hexdigest()[:16]
+
+
+def _save(path, data):
+    if not default_storage.exists(path):
+        default_storage.save(path, ContentFile(data))
+    return path
+
+
+def process(data, prefix):
+    # Returns {variant: {'width': w, 'height': h, format: path, ...}}
+    Image, ImageOps, _ = _pillow()
+    name = digest(data)
+    source = ImageOps.exif_transpose(Image.open(io.BytesIO(data))).convert('RGB')
+    formats = available_formats()
+
+    variants = {}
+    for variant, width in VARIANTS.items():
+        resized = source.copy()
+        if resized.width > width:
+            resized.thumbnail((width, resized.height * width // resized.width + 1), Image.LANCZOS)
+        entry = {'width': resized.width, 'height': resized.height}
+        for fmt in formats:
+            buffer = io.BytesIO()
+            options = {'quality': QUALITY[fmt]}
+            if fmt == 'jpeg':
+                options.update(optimize=True, progressive=True)
+            resized.save(buffer, fmt.upper(), **options)
+            entry[fmt] = _save(f'{IMAGE_ROOT}/{prefix}/{name}-{variant}.{EXTENSIONS[fmt]}', buffer.getvalue())
+        variants[variant] = entry
+    return variants
+
+
+def read_source(path):
+    # Originals live in media storage; rows migrated from the old template
+    # point at the bundled static images instead
+    if default_storage.exists(path):
+        with default_storage.open(path, 'rb') as source:
+            return source.read()
+    found = finders.find(path)
+    if found:
+        with open(found, 'rb') as source:
+            return source.read()
+    raise FileNotFoundError(path)
+
+
+def files(obj):
+    paths = {obj.image} if obj.image else set()
+    for entry in (obj.image_variants or {}).values():
+        paths.update(entry.get(fmt) for fmt in FORMATS if entry.get(fmt))
+    return paths
+
+
+def delete_unused(old_paths, obj):
+    # Remove files the object no longer uses. Names are content hashes, so a
+    # re-upload of the same picture keeps its files.
+    for path in old_paths - files(obj):
+        if path.startswith(f'{IMAGE_ROOT}/') and default_storage.exists(path):
+            default_storage.delete(path)
+
+
+def prefix_for(obj):
+    return f'{obj._meta.model_name}/{obj.pk}'
+
+
+def check(upload):
+    # The format of an uploaded image, e.g. 'PNG'; raises InvalidImage for
+    # anything Pillow can't read, before it is stored
+    Image, _, _ = _pillow()
+    upload.seek(0)
+    try:
+        with Image.open(upload) as image:
+            fmt = image.format
+            image.verify()
+    except Exception:  # verify() raises whatever the format's decoder does
+        raise InvalidImage(f'{upload.name} is not an image')
+    finally:
+        upload.seek(0)
+    return fmt
+
+
+def store_original(upload, prefix):
+    fmt = check(upload)
+    data = upload.read()
+    extension = ORIGINAL_EXTENSIONS.get(fmt, fmt.lower())
+    return _save(f'{IMAGE_ROOT}/{prefix}/{digest(data)}-original.{extension}', data)
+
+
+def attach(obj, upload):
+    # Store upload as obj's image. The variants are built, and the files of
+    # the image it replaces deleted, by the process_image task; until then
+    # pages keep showing the old variants.
+    from .tasks import process_image
+
+    old_files = files(obj)
+    obj.image = store_original(upload, prefix_for(obj))
+    obj.save(update_fields=['image'])
+    process_image.enqueue(kind=obj._meta.model_name, object_id=obj.pk, path=obj.image, old_files=sorted(old_files))
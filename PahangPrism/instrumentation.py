@@ -0,0 +1,350 @@
+import asyncio
+import bisect
+import logging
+import os
+import random
+import socket
+import threading
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+
+# Per-view request metrics.
+# RequestMetricsMiddleware times every request, logging those slower than
+# SLOW_REQUEST_MS, and samples a fraction of requests
+# (REQUEST_METRICS_SAMPLE_RATE) and records, per URL name, wall time, DB
+# time, query count, duplicate queries and response size into fixed-bucket
+# histograms. Each process aggregates in memory and publishes a snapshot
+# to the cache every REQUEST_METRICS_FLUSH_SECONDS; collect() merges the
+# snapshots of all processes for the Prometheus endpoint and the panel on
+# the admin dashboard. The list of processes is changed under a short cache
+# lock, and processes whose snapshot has expired are dropped from it.
+#
+# Queries are seen by a wrapper installed on every new connection (see
+# apps.py). It only records while a sampled request's recorder is set in
+# the context, which also follows async views into the ORM's threads.
+
+logger = logging.getLogger('PahangPrism.slow_requests')
+
+# Upper bounds; the last bucket is +Inf
+BUCKETS = {
+    'duration_seconds': [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10],
+    'db_seconds': [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5],
+    'queries': [0, 1, 2, 3, 5, 10, 20, 50, 100, 200],
+    'response_bytes': [1000, 5000, 10000, 25000, 50000, 100000, 250000, 500000, 1000000],
+}
+
+SNAPSHOT_KEY = 'pahangprism:metrics:{}'
+PROCESSES_KEY = 'pahangprism:metrics:processes'
+PROCESSES_LOCK_KEY = 'pahangprism:metrics:processes-lock'
+LOCK_SECONDS = 5
+LOCK_ATTEMPTS = 50  # 10ms apart
+
+_recorder = ContextVar('pahangprism_query_recorder', default=None)
+_lock = threading.Lock()
+_views = {}
+_last_flush = 0.0
+_process_id = f'{socket.gethostname()}:{os.getpid()}'
+
+
+def _new_view():
+    return {
+        'count': 0,
+        'duplicates': 0,
+        'histograms': {name: {'buckets': [0] * (len(bounds) + 1), 'sum': 0} for name, bounds in BUCKETS.items()},
+    }
+
+
+def record_query(execute, sql, params, many, context):
+    recorder = _recorder.get()
+    if recorder is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        recorder.append((sql, repr(params), time.perf_counter() - started))
+
+
+def install_query_recorder(sender, connection, **kwargs):
+    # connection_created receiver
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+def observe(view_name, duration, queries, response_bytes):
+    # queries is a list of (sql, params, seconds)
+    values = {
+        'duration_seconds': duration,
+        'db_seconds': sum(seconds for _, _, seconds in queries),
+        'queries': len(queries),
+        'response_bytes': response_bytes,
+    }
+    duplicates = len(queries) - len({(sql, params) for sql, params, _ in queries})
+    with _lock:
+        view = _views.setdefault(view_name, _new_view())
+        view['count'] += 1
+        view['duplicates'] += duplicates
+        for name, value in values.items():
+            histogram = view['histograms'][name]
+            histogram['buckets'][bisect.bisect_left(BUCKETS[name], value)] += 1
+            histogram['sum'] += value
+
+
+def _snapshot():
+    with _lock:
+        return {
+            name: {
+                'count': view['count'],
+                'duplicates': view['duplicates'],
+                'histograms': {
+                    metric: {'buckets': list(h['buckets']), 'sum': h['sum']}
+                    for metric, h in view['histograms'].items()
+                },
+            }
+            for name, view in _views.items()
+        }
+
+
+def _flush_due():
+    global _last_flush
+    now = time.monotonic()
+    if now - _last_flush < getattr(settings, 'REQUEST_METRICS_FLUSH_SECONDS', 10):
+        return False
+    _last_flush = now
+    return True
+
+
+def _timeout():
+    return getattr(settings, 'REQUEST_METRICS_RETENTION', 24 * 3600)
+
+
+def _changed_processes(processes, add, remove):
+    # The new list, or None if it needs no change
+    changed = [process for process in processes if process not in remove]
+    if add and add not in changed:
+        changed.append(add)
+    return changed if changed != processes else None
+
+
+def _update_processes(add=None, remove=()):
+    # Get-then-set under the lock, so processes updating at once don't drop
+    # each other's IDs. Gives up quietly if the lock stays taken; the next
+    # flush tries again.
+    for _ in range(LOCK_ATTEMPTS):
+        if cache.add(PROCESSES_LOCK_KEY, _process_id, LOCK_SECONDS):
+            try:
+                processes = cache.get(PROCESSES_KEY) or []
+                changed = _changed_processes(processes, add, remove)
+                if changed is not None:
+                    cache.set(PROCESSES_KEY, changed, None)
+            finally:
+                cache.delete(PROCESSES_LOCK_KEY)
+            return
+        time.sleep(0.01)
+
+
+async def _aupdate_processes(add=None, remove=()):
+    for _ in range(LOCK_ATTEMPTS):
+        if await cache.aadd(PROCESSES_LOCK_KEY, _process_id, LOCK_SECONDS):
+            try:
+                processes = await cache.aget(PROCESSES_KEY) or []
+                changed = _changed_processes(processes, add, remove)
+                if changed is not None:
+                    await cache.aset(PROCESSES_KEY, changed, None)
+            finally:
+                await cache.adelete(PROCESSES_LOCK_KEY)
+            return
+        await asyncio.sleep(0.01)
+
+
+def flush():
+    # Publish this process's totals. A restarted process starts again from
+    # zero under a new key; the old snapshot stays until it expires.
+    cache.set(SNAPSHOT_KEY.format(_process_id), _snapshot(), _timeout())
+    if _process_id not in (cache.get(PROCESSES_KEY) or []):
+        _update_processes(add=_process_id)
+
+
+async def aflush():
+    await cache.aset(SNAPSHOT_KEY.format(_process_id), _snapshot(), _timeout())
+    if _process_id not in (await cache.aget(PROCESSES_KEY) or []):
+        await _aupdate_processes(add=_process_id)
+
+
+def reset():
+    global _last_flush
+    with _lock:
+        _views.clear()
+    _last_flush = 0.0
+
+
+def collect():
+    # Totals of every process that has published, including this one
+    flush()
+    merged = {}
+    processes = cache.get(PROCESSES_KEY) or []
+    snapshots = cache.get_many([SNAPSHOT_KEY.format(process) for process in processes])
+    expired = [process for process in processes if SNAPSHOT_KEY.format(process) not in snapshots]
+    if expired:
+        _update_processes(remove=expired)
+    for snapshot in snapshots.values():
+        for name, view in snapshot.items():
+            total = merged.setdefault(name, _new_view())
+            total['count'] += view['count']
+            total['duplicates'] += view['duplicates']
+            for metric, histogram in view['histograms'].items():
+                target = total['histograms'][metric]
+                target['buckets'] = [a + b for a, b in zip(target['buckets'], histogram['buckets'])]
+                target['sum'] += histogram['sum']
+    return merged
+
+
+def quantile(metric, histogram, q):
+    # Linear interpolation inside the bucket, like Prometheus' histogram_quantile
+    count = sum(histogram['buckets'])
+    if not count:
+        return 0
+    bounds = BUCKETS[metric]
+    rank = q * count
+    seen = 0
+    for i, in_bucket in enumerate(histogram['buckets']):
+        if seen + in_bucket >= rank and in_bucket:
+            if i == len(bounds):
+                return bounds[-1]
+            lower = bounds[i - 1] if i else 0
+            return lower + (bounds[i] - lower) * (rank - seen) / in_bucket
+        seen += in_bucket
+    return bounds[-1]
+
+
+def summary():
+    # Rows for the admin dashboard panel, slowest p95 first
+    rows = []
+    for name, view in collect().items():
+        histograms = view['histograms']
+        rows.append({
+            'view': name,
+            'count': view['count'],
+            'p50_ms': quantile('duration_seconds', histograms['duration_seconds'], 0.5) * 1000,
+            'p95_ms': quantile('duration_seconds', histograms['duration_seconds'], 0.95) * 1000,
+            'p99_ms': quantile('duration_seconds', histograms['duration_seconds'], 0.99) * 1000,
+            'db_p95_ms': quantile('db_seconds', histograms['db_seconds'], 0.95) * 1000,
+            'queries_avg': histograms['queries']['sum'] / view['count'],
+            'queries_p95': quantile('queries', histograms['queries'], 0.95),
+            'duplicates_avg': view['duplicates'] / view['count'],
+            'bytes_p95': quantile('response_bytes', histograms['response_bytes'], 0.95),
+        })
+    return sorted(rows, key=lambda row: row['p95_ms'], reverse=True)
+
+
+def _label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"')
+
+
+def prometheus_text():
+    lines = []
+    views = collect()
+    for metric, bounds in BUCKETS.items():
+        name = f'pahangprism_request_{metric}'
+        lines.append(f'# TYPE {name} histogram')
+        for view_name, view in sorted(views.items()):
+            label = _label(view_name)
+            histogram = view['histograms'][metric]
+            cumulative = 0
+            for bound, in_bucket in zip(bounds + ['+Inf'], histogram['buckets']):
+                cumulative += in_bucket
+                lines.append(f'{name}_bucket{{view="{label}",le="{bound}"}} {cumulative}')
+            lines.append(f'{name}_sum{{view="{label}"}} {histogram["sum"]}')
+            lines.append(f'{name}_count{{view="{label}"}} {view["count"]}')
+    lines.append('# TYPE pahangprism_request_duplicate_queries_total counter')
+    for view_name, view in sorted(views.items()):
+        lines.append(f'pahangprism_request_duplicate_queries_total{{view="{_label(view_name)}"}} {view["duplicates"]}')
+    return '\n'.join(lines) + '\n'
+
+
+def _view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return '<unresolved>'
+    return match.view_name or match._func_path
+
+
+def _response_bytes(response):
+    if response.streaming:
+        return int(response.get('Content-Length') or 0)
+    return len(response.content)
+
+
+def _log_if_slow(request, duration, queries):
+    # Every request is timed; queries is None unless it was sampled
+    threshold = getattr(settings, 'SLOW_REQUEST_MS', 0)
+    if not threshold or duration * 1000 < threshold:
+        return
+    if queries is None:
+        logger.warning('Slow request %s %s: %.0fms (not sampled, no SQL captured)',
+                       request.method, request.get_full_path(), duration * 1000)
+        return
+    statements = '\n'.join(f'  {seconds * 1000:.1f}ms  {sql}  {params}' for sql, params, seconds in queries)
+    logger.warning('Slow request %s %s: %.0fms, %d queries\n%s',
+                   request.method, request.get_full_path(), duration * 1000, len(queries), statements)
+
+
+class RequestMetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def _sampled(self):
+        rate = getattr(settings, 'REQUEST_METRICS_SAMPLE_RATE', 0.1)
+        return rate >= 1 or random.random() < rate
+
+    def _finish(self, request, response, started, queries):
+        duration = time.perf_counter() - started
+        if queries is not None:
+            observe(_view_name(request), duration, queries, _response_bytes(response))
+        _log_if_slow(request, duration, queries)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        started = time.perf_counter()
+        if not self._sampled():
+            response = self.get_response(request)
+            self._finish(request, response, started, None)
+            return response
+        queries = []
+        token = _recorder.set(queries)
+        try:
+            response = self.get_response(request)
+        finally:
+            _recorder.reset(token)
+        self._finish(request, response, started, queries)
+        if _flush_due():
+            flush()
+        return response
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        if not self._sampled():
+            response = await self.get_response(request)
+            self._finish(request, response, started, None)
+            return response
+        queries = []
+        token = _recorder.set(queries)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _recorder.reset(token)
+        self._finish(request, response, started, queries)
+        if _flush_due():
+            await aflush()
+        return response
@@ -0,0 +1,97 @@
+import multiprocessing
+import statistics
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, close_old_connections, connections
+
+from PahangPrism import booking
+from PahangPrism.models import Booking, Event, User, Venue, WaitlistEntry
+
+
+def attempt(event_id, user_id, retries):
+    outcomes, latencies, errors = [], [], 0
+    try:
+        for _ in range(retries):
+            started = time.perf_counter()
+            try:
+                outcomes.append(booking.book(user_id, event_id))
+            except OperationalError:
+                errors += 1
+            latencies.append(time.perf_counter() - started)
+    finally:
+        close_old_connections()
+        connections.close_all()
+    return outcomes, latencies, errors
+
+
+def run_threads(event_id, user_ids, retries, workers):
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(lambda user_id: attempt(event_id, user_id, retries), user_ids))
+
+
+def run(event_id, user_ids, retries, workers, processes):
+    if processes <= 1:
+        return run_threads(event_id, user_ids, retries, workers)
+    # Separate processes, like gunicorn workers, each with its own threads.
+    # Connections are closed first so no child inherits an open one.
+    connections.close_all()
+    chunks = [user_ids[i::processes] for i in range(processes)]
+    threads = max(1, workers // processes)
+    with ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context('fork')) as pool:
+        futures = [pool.submit(run_threads, event_id, chunk, retries, threads) for chunk in chunks]
+        return [result for future in futures for result in future.result()]
+
+
+class Command(BaseCommand):
+    help = ('Fire concurrent booking requests at one event and check it is never oversold. '
+            'Runs against the configured database and removes its data afterwards.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500, help='Number of users trying to book')
+        parser.add_argument('--capacity', type=int, default=100)
+        parser.add_argument('--workers', type=int, default=32, help='Concurrent threads, each with its own connection')
+        parser.add_argument('--processes', type=int, default=1,
+                            help='Split the workers across this many processes, like gunicorn workers')
+        parser.add_argument('--retries', type=int, default=1, help='Times each user repeats the request, to exercise idempotency')
+
+    def handle(self, *args, **options):
+        run_id = uuid.uuid4().hex[:8]
+        venue = Venue.objects.create(venueID=f'BENCH-{run_id}', name='Benchmark Hall', location='Benchmark')
+        event = Event.objects.create(name=f'Benchmark {run_id}', date=date.today(), venue=venue, capacity=options['capacity'])
+        User.objects.bulk_create(
+            User(full_name=f'Bench {i}', email=f'bench-{run_id}-{i}@example.com', password='!')
+            for i in range(options['requests'])
+        )
+        user_ids = [user.userID for user in User.objects.filter(email__startswith=f'bench-{run_id}-')]
+
+        try:
+            started = time.perf_counter()
+            results = run(event.eventID, user_ids, options['retries'], options['workers'], options['processes'])
+            elapsed = time.perf_counter() - started
+
+            outcomes = [outcome for result in results for outcome in result[0]]
+            latencies = sorted(latency for result in results for latency in result[1])
+            errors = sum(result[2] for result in results)
+            event.refresh_from_db()
+            booked = Booking.objects.filter(event=event).count()
+            waitlisted = WaitlistEntry.objects.filter(event=event).count()
+
+            self.stdout.write(f'{len(latencies)} requests in {elapsed:.2f}s ({len(latencies) / elapsed:.0f} req/s)')
+            self.stdout.write(f'latency p50={statistics.median(latencies) * 1000:.1f}ms '
+                              f'p95={latencies[int(len(latencies) * 0.95) - 1] * 1000:.1f}ms '
+                              f'p99={latencies[int(len(latencies) * 0.99) - 1] * 1000:.1f}ms')
+            for name in (booking.BOOKED, booking.ALREADY_BOOKED, booking.WAITLISTED, booking.ALREADY_WAITLISTED):
+                self.stdout.write(f'  {name}: {outcomes.count(name)}')
+            self.stdout.write(f'  database errors: {errors}')
+            self.stdout.write(f'bookings={booked} counter={event.booked} capacity={event.capacity} waitlist={waitlisted}')
+
+            if booked > event.capacity or booked != event.booked:
+                raise CommandError('Event was oversold or the seat counter drifted.')
+            self.stdout.write(self.style.SUCCESS('No overselling.'))
+        finally:
+            User.objects.filter(email__startswith=f'bench-{run_id}-').delete()
+            venue.delete()
@@ -0,0 +1,78 @@
+import json
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from PahangPrism import event_listing, geo
+from PahangPrism.models import Venue
+
+# Times proximity searches at random points around the venues of the
+# configured database, normally one filled by seed_catalogue, e.g.
+#   seed_catalogue --venues 100000 --events 200000 --users 1000
+#   bench_geo --radius 5 --radius 25
+
+
+def percentile(samples, fraction):
+    return samples[max(0, int(len(samples) * fraction) - 1)]
+
+
+class Command(BaseCommand):
+    help = ('Measure nearest-venue and nearby-event searches (geohash prefilter, bounding box, '
+            'haversine) at random points near the catalogue\'s venues.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--queries', type=int, default=500, help='Searches per radius')
+        parser.add_argument('--radius', type=float, action='append', help='Radius in km (repeatable)')
+        parser.add_argument('--limit', type=int, default=20, help='Page size')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--json', action='store_true', help='Print the results as JSON')
+
+    def handle(self, *args, **options):
+        points = list(Venue.objects.exclude(geohash='').values_list('latitude', 'longitude')[:10000])
+        if not points:
+            raise CommandError('No venues have coordinates; run seed_catalogue first.')
+        rng = random.Random(options['seed'])
+        upcoming = event_listing.queryset(event_listing.parse_filters({}))
+
+        results = {'venues': Venue.objects.exclude(geohash='').count(), 'radii': {}}
+        for radius in options['radius'] or [5, 25]:
+            venue_times, event_times, found = [], [], []
+            for _ in range(options['queries']):
+                latitude, longitude = rng.choice(points)
+                latitude += rng.uniform(-0.05, 0.05)
+                longitude += rng.uniform(-0.05, 0.05)
+
+                started = time.perf_counter()
+                hits, _ = geo.venues_near(latitude, longitude, radius, limit=options['limit'])
+                venue_times.append(time.perf_counter() - started)
+                found.append(len(geo.venues_within(latitude, longitude, radius)))
+
+                started = time.perf_counter()
+                geo.events_near(latitude, longitude, radius, upcoming, ['name'], limit=options['limit'])
+                event_times.append(time.perf_counter() - started)
+            results['radii'][radius] = {
+                'venues_in_radius_avg': statistics.mean(found),
+                'venues_near': self.summarize(venue_times),
+                'events_near': self.summarize(event_times),
+            }
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        self.stdout.write(f'{results["venues"]} venues with coordinates')
+        for radius, stats in results['radii'].items():
+            self.stdout.write(f'radius {radius:g}km ({stats["venues_in_radius_avg"]:.0f} venues inside on average)')
+            for name in ('venues_near', 'events_near'):
+                timing = stats[name]
+                self.stdout.write(f'  {name:12} p50={timing["p50_ms"]:.2f}ms  p95={timing["p95_ms"]:.2f}ms  '
+                                  f'p99={timing["p99_ms"]:.2f}ms')
+
+    def summarize(self, samples):
+        samples = sorted(samples)
+        return {
+            'p50_ms': statistics.median(samples) * 1000,
+            'p95_ms': percentile(samples, 0.95) * 1000,
+            'p99_ms': percentile(samples, 0.99) * 1000,
+        }
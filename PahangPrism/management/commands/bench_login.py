@@ -0,0 +1,101 @@
+import asyncio
+import json
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import get_hasher, make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from PahangPrism import credentials
+from PahangPrism.models import User
+
+BENCH_EMAIL = 'bench-login@example.invalid'
+BENCH_PASSWORD = 'correct horse battery staple'
+
+
+def percentile(samples, fraction):
+    return samples[max(0, int(len(samples) * fraction) - 1)]
+
+
+class Command(BaseCommand):
+    help = ('Measure logins per second in one worker process, through the sync and async '
+            'login paths, against the configured database and password hasher.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='Logins per mode')
+        parser.add_argument('--concurrency', type=int, default=16, help='Simultaneous login attempts')
+        parser.add_argument('--json', action='store_true', help='Print the results as JSON')
+
+    def handle(self, *args, **options):
+        if User.objects.filter(email=BENCH_EMAIL).exists():
+            raise CommandError(f'{BENCH_EMAIL} already exists; delete it first.')
+
+        hasher = get_hasher()
+        started = time.perf_counter()
+        make_password(BENCH_PASSWORD)
+        hash_ms = (time.perf_counter() - started) * 1000
+
+        user = User.objects.create(full_name='Login benchmark', email=BENCH_EMAIL,
+                                   password=make_password(BENCH_PASSWORD))
+        try:
+            results = {
+                'hasher': hasher.algorithm,
+                'hash_ms': hash_ms,
+                'hash_workers': getattr(settings, 'PASSWORD_HASH_WORKERS', 2),
+                'sync': self.run_sync(options['requests'], options['concurrency']),
+                'async': asyncio.run(self.run_async(options['requests'], options['concurrency'])),
+            }
+        finally:
+            user.delete()
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        self.stdout.write(f'{results["hasher"]}: {hash_ms:.1f}ms per hash, '
+                          f'{results["hash_workers"]} hashing threads')
+        for mode in ('sync', 'async'):
+            stats = results[mode]
+            self.stdout.write(
+                f'{mode:5} {stats["rps"]:8.1f} logins/s  p50={stats["p50_ms"]:.1f}ms  '
+                f'p95={stats["p95_ms"]:.1f}ms  failures={stats["failures"]}')
+
+    def summarize(self, outcomes, elapsed):
+        latencies = sorted(latency for latency, _ in outcomes)
+        return {
+            'requests': len(latencies),
+            'failures': sum(not ok for _, ok in outcomes),
+            'rps': len(latencies) / elapsed if elapsed else 0.0,
+            'p50_ms': statistics.median(latencies) * 1000,
+            'p95_ms': percentile(latencies, 0.95) * 1000,
+        }
+
+    def run_sync(self, total, concurrency):
+        # Request threads, like a threaded WSGI worker
+        def one(_):
+            started = time.perf_counter()
+            ok = credentials.authenticate(BENCH_EMAIL, BENCH_PASSWORD) is not None
+            return time.perf_counter() - started, ok
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            outcomes = list(pool.map(one, range(total)))
+        elapsed = time.perf_counter() - started
+        connections.close_all()
+        return self.summarize(outcomes, elapsed)
+
+    async def run_async(self, total, concurrency):
+        # Concurrent logins on one event loop, like a uvicorn worker
+        limit = asyncio.Semaphore(concurrency)
+
+        async def one():
+            async with limit:
+                started = time.perf_counter()
+                ok = await credentials.aauthenticate(BENCH_EMAIL, BENCH_PASSWORD) is not None
+                return time.perf_counter() - started, ok
+
+        started = time.perf_counter()
+        outcomes = await asyncio.gather(*(one() for _ in range(total)))
+        return self.summarize(outcomes, time.perf_counter() - started)
@@ -0,0 +1,135 @@
+import asyncio
+import json
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from importlib import import_module
+
+from django.conf import settings
+from django.contrib.messages.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test import RequestFactory
+
+from PahangPrism import async_views, views
+from PahangPrism.identity import IdentityMiddleware
+
+READ_VIEWS = {
+    'event_list': ('/events/', {}),
+    'venue_list': ('/venues/', {}),
+    'search': ('/search/', {'q': 'festival'}),
+    'booked_events': ('/booked/', {}),
+    'user_dashboard': ('/dashboard/', {}),
+}
+
+
+def percentile(samples, fraction):
+    return samples[max(0, int(len(samples) * fraction) - 1)]
+
+
+class Command(BaseCommand):
+    help = ('Compare the sync and async versions of the read-heavy views under concurrent load. '
+            'Calls the views directly against the configured database, without middleware.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500, help='Requests per view and mode')
+        parser.add_argument('--concurrency', type=int, default=16)
+        parser.add_argument('--views', default=','.join(READ_VIEWS), help='Comma separated view names')
+        parser.add_argument('--user-id', type=int, help='Log the requests in as this PahangPrism user')
+        parser.add_argument('--db-latency', type=float, default=0.0,
+                            help='Milliseconds added to every query, to mimic a networked database')
+        parser.add_argument('--json', action='store_true', help='Print the results as JSON')
+
+    def handle(self, *args, **options):
+        names = [name.strip() for name in options['views'].split(',') if name.strip()]
+        unknown = set(names) - set(READ_VIEWS)
+        if unknown:
+            raise CommandError(f'Unknown views: {", ".join(sorted(unknown))}')
+
+        self.factory = RequestFactory()
+        self.session_key = self.make_session(options['user_id'])
+        self.latency = options['db_latency'] / 1000
+
+        results = {}
+        for name in names:
+            results[name] = {
+                'sync': self.run_sync(getattr(views, name), name, options['requests'], options['concurrency']),
+                'async': asyncio.run(
+                    self.run_async(getattr(async_views, name), name, options['requests'], options['concurrency'])),
+            }
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        for name, modes in results.items():
+            for mode, stats in modes.items():
+                self.stdout.write(
+                    f'{name:15} {mode:5} {stats["rps"]:8.0f} req/s  p50={stats["p50_ms"]:.1f}ms  '
+                    f'p95={stats["p95_ms"]:.1f}ms  p99={stats["p99_ms"]:.1f}ms  errors={stats["errors"]}')
+
+    def make_session(self, user_id):
+        store = import_module(settings.SESSION_ENGINE).SessionStore()
+        if user_id:
+            store['userID'] = user_id
+        store.save()
+        return store.session_key
+
+    def build_request(self, name):
+        path, params = READ_VIEWS[name]
+        request = self.factory.get(path, params)
+        request.session = import_module(settings.SESSION_ENGINE).SessionStore(self.session_key)
+        request._messages = default_storage(request)
+        IdentityMiddleware(lambda request: None).process_request(request)
+        return request
+
+    def delay(self, execute, sql, params, many, context):
+        time.sleep(self.latency)
+        return execute(sql, params, many, context)
+
+    def summarize(self, latencies, errors, elapsed):
+        latencies.sort()
+        return {
+            'requests': len(latencies),
+            'errors': errors,
+            'rps': len(latencies) / elapsed if elapsed else 0.0,
+            'p50_ms': statistics.median(latencies) * 1000 if latencies else 0.0,
+            'p95_ms': percentile(latencies, 0.95) * 1000 if latencies else 0.0,
+            'p99_ms': percentile(latencies, 0.99) * 1000 if latencies else 0.0,
+        }
+
+    def run_sync(self, view, name, total, concurrency):
+        # One thread per worker, like a pool of sync gunicorn workers
+        def one(_):
+            started = time.perf_counter()
+            try:
+                with connection.execute_wrapper(self.delay):
+                    ok = view(self.build_request(name)).status_code < 400
+            except Exception:
+                ok = False
+            return time.perf_counter() - started, ok
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            outcomes = list(pool.map(one, range(total)))
+        elapsed = time.perf_counter() - started
+        connections.close_all()
+        return self.summarize([latency for latency, _ in outcomes], sum(not ok for _, ok in outcomes), elapsed)
+
+    async def run_async(self, view, name, total, concurrency):
+        # Many requests in flight on one event loop, like a uvicorn worker
+        limit = asyncio.Semaphore(concurrency)
+
+        async def one():
+            async with limit:
+                started = time.perf_counter()
+                try:
+                    with connection.execute_wrapper(self.delay):
+                        ok = (await view(self.build_request(name))).status_code < 400
+                except Exception:
+                    ok = False
+                return time.perf_counter() - started, ok
+
+        started = time.perf_counter()
+        outcomes = await asyncio.gather(*(one() for _ in range(total)))
+        elapsed = time.perf_counter() - started
+        return self.summarize([latency for latency, _ in outcomes], sum(not ok for _, ok in outcomes), elapsed)
@@ -0,0 +1,40 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from PahangPrism.catalogue_import import DEFAULT_BATCH_SIZE, CatalogueImporter, detect_format
+
+
+class Command(BaseCommand):
+    help = 'Bulk import venues and events from a CSV or JSONL file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV or JSONL file, or - for stdin')
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help='Defaults to the file extension')
+        parser.add_argument('--type', choices=['venue', 'event'], help='Row type for rows without a "type" column')
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+        parser.add_argument('--dry-run', action='store_true', help='Validate rows without writing anything')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or detect_format(path)
+        importer = CatalogueImporter(
+            batch_size=options['batch_size'],
+            dry_run=options['dry_run'],
+            default_type=options['type'],
+        )
+
+        if path == '-':
+            result = importer.run(sys.stdin, fmt)
+        else:
+            try:
+                with open(path, newline='', encoding='utf-8-sig') as stream:
+                    result = importer.run(stream, fmt)
+            except OSError as e:
+                raise CommandError(str(e))
+
+        for error in result.errors:
+            self.stderr.write(error)
+        prefix = 'Dry run: ' if options['dry_run'] else 'Imported '
+        style = self.style.WARNING if result.error_count else self.style.SUCCESS
+        self.stdout.write(style(prefix + result.summary()))
@@ -0,0 +1,274 @@
+import json
+import random
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from importlib import import_module
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test import Client
+
+from PahangPrism.models import Event, User, Venue
+from PahangPrism.management.commands.seed_catalogue import EMAIL_DOMAIN, STAFF_EMAIL, THEMES, TOWN_COORDINATES, TOWNS
+
+# Replays a weighted mix of requests through the whole middleware stack
+# (Django's test client, no network) from concurrent threads against the
+# configured database, normally one filled by seed_catalogue. Reports
+# throughput, latency percentiles and queries per request for each
+# endpoint, and can compare the result against an earlier run's JSON.
+
+DEFAULT_MIX = 'event_list=30,search=20,booked_events=15,book_event=10,star_item=10,admin_table=10,admin_dashboard=5'
+
+
+def percentile(samples, fraction):
+    return samples[max(0, int(len(samples) * fraction) - 1)]
+
+
+def parse_mix(value):
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.strip().partition('=')
+        if name not in ENDPOINTS:
+            raise CommandError(f'Unknown endpoint {name!r}; choose from {", ".join(ENDPOINTS)}')
+        try:
+            mix[name] = float(weight or 1)
+        except ValueError:
+            raise CommandError(f'Invalid weight for {name}: {weight!r}')
+    return mix
+
+
+# Each endpoint returns (method, path, data, staff) for one request
+
+def home(run):
+    return 'get', '/', {}, False
+
+
+def event_list(run):
+    return 'get', '/events/', {}, False
+
+
+def search(run):
+    return 'get', '/search/', {'q': run.random.choice(THEMES + TOWNS)}, False
+
+
+def suggest(run):
+    word = run.random.choice(THEMES + TOWNS)
+    return 'get', '/search/suggest/', {'q': word[:run.random.randint(1, len(word))]}, False
+
+
+def booked_events(run):
+    return 'get', '/booked/', {}, False
+
+
+def book_event(run):
+    return 'post', f'/book-event/{run.random.choice(run.event_ids)}/', {}, False
+
+
+def star_item(run):
+    return 'post', f'/star-item/event/{run.random.choice(run.event_ids)}/', {}, False
+
+
+def admin_table(run):
+    params = {'sort': run.random.choice(['id', 'name', 'date', 'venue'])}
+    if run.random.random() < 0.3:
+        params['q'] = run.random.choice(THEMES)
+    return 'get', f'/database-management/{run.random.choice(["events", "bookings", "users"])}/', params, True
+
+
+def api_events(run):
+    return 'get', '/api/v1/events/', {'venue': run.random.choice(run.venue_ids)}, False
+
+
+def api_nearby(run):
+    latitude, longitude = TOWN_COORDINATES[run.random.choice(TOWNS)]
+    params = {'lat': latitude + run.random.uniform(-0.1, 0.1), 'lon': longitude + run.random.uniform(-0.1, 0.1),
+              'radius': run.random.choice([2, 10, 25])}
+    return 'get', f'/api/v1/{run.random.choice(["events", "venues"])}/nearby/', params, False
+
+
+def admin_dashboard(run):
+    return 'get', '/admin-dashboard/', {}, True
+
+
+ENDPOINTS = {
+    'home': home,
+    'event_list': event_list,
+    'search': search,
+    'suggest': suggest,
+    'booked_events': booked_events,
+    'book_event': book_event,
+    'star_item': star_item,
+    'admin_table': admin_table,
+    'admin_dashboard': admin_dashboard,
+    'api_events': api_events,
+    'api_nearby': api_nearby,
+}
+
+
+class Command(BaseCommand):
+    help = ('Replay a weighted mix of page views, bookings, stars and admin requests from concurrent '
+            'workers and report throughput, latency percentiles and query counts per endpoint.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mix', default=DEFAULT_MIX, help='Comma separated endpoint=weight pairs')
+        parser.add_argument('--requests', type=int, default=2000, help='Total requests')
+        parser.add_argument('--duration', type=float, help='Run for this many seconds instead')
+        parser.add_argument('--concurrency', type=int, default=8, help='Worker threads')
+        parser.add_argument('--sessions', type=int, default=200, help='Distinct logged in seed users')
+        parser.add_argument('--seed', type=int, help='Random seed, for a repeatable request sequence')
+        parser.add_argument('--host', default='testserver', help='Host header; must be in ALLOWED_HOSTS')
+        parser.add_argument('--output', help='Write the results as JSON to this file')
+        parser.add_argument('--compare', help='JSON results of an earlier run to compare against')
+        parser.add_argument('--max-regression', type=float, default=0.2,
+                            help='Fail if an endpoint\'s p95 grows by more than this fraction over --compare')
+
+    def handle(self, *args, **options):
+        mix = parse_mix(options['mix'])
+        baseline = None
+        if options['compare']:
+            with open(options['compare']) as f:
+                baseline = json.load(f)
+
+        self.random = random.Random(options['seed'])
+        self.event_ids = list(Event.objects.values_list('eventID', flat=True))
+        self.venue_ids = list(Venue.objects.values_list('venueID', flat=True))
+        if not self.event_ids:
+            raise CommandError('There are no events; run seed_catalogue first.')
+        self.user_sessions = self.make_sessions(
+            User.objects.filter(email__endswith=f'@{EMAIL_DOMAIN}', is_staff=False), options['sessions'])
+        self.staff_sessions = self.make_sessions(User.objects.filter(email=STAFF_EMAIL), 1)
+        if not self.user_sessions or not self.staff_sessions:
+            raise CommandError('There are no seed users; run seed_catalogue first.')
+
+        self.host = options['host']
+        self.lock = threading.Lock()
+        self.samples = {name: [] for name in mix}
+        self.errors = {name: 0 for name in mix}
+        plan = self.plan(mix, options['requests'])
+
+        started = time.perf_counter()
+        deadline = started + options['duration'] if options['duration'] else None
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+            list(pool.map(lambda _: self.worker(plan, deadline), range(options['concurrency'])))
+        elapsed = time.perf_counter() - started
+
+        results = {
+            'elapsed_seconds': elapsed,
+            'concurrency': options['concurrency'],
+            'requests': sum(len(samples) for samples in self.samples.values()),
+            'rps': sum(len(samples) for samples in self.samples.values()) / elapsed if elapsed else 0.0,
+            'catalogue': {'events': len(self.event_ids)},
+            'endpoints': {name: self.summarize(name, elapsed) for name in mix},
+        }
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, indent=2)
+
+        self.report(results)
+        if baseline is not None and self.compare(results, baseline, options['max_regression']):
+            raise CommandError(f'p95 latency regressed by more than {options["max_regression"]:.0%}.')
+
+    def make_sessions(self, users, count):
+        keys = []
+        for user_id, is_staff in users.order_by('userID').values_list('userID', 'is_staff')[:count]:
+            store = import_module(settings.SESSION_ENGINE).SessionStore()
+            store['userID'] = user_id
+            store['is_staff'] = is_staff
+            store.save()
+            keys.append(store.session_key)
+        return keys
+
+    def plan(self, mix, total):
+        # Endpoint names in the order workers take them; cycled under --duration
+        names = list(mix)
+        return self.random.choices(names, weights=[mix[name] for name in names], k=total)
+
+    def worker(self, plan, deadline):
+        client = Client(HTTP_HOST=self.host)
+        try:
+            while True:
+                with self.lock:
+                    if deadline is None:
+                        if not plan:
+                            return
+                        name = plan.pop()
+                    else:
+                        if time.perf_counter() >= deadline:
+                            return
+                        name = self.random.choice(plan)
+                    method, path, data, staff = ENDPOINTS[name](self)
+                    session_key = self.random.choice(self.staff_sessions if staff else self.user_sessions)
+                self.request(client, name, method, path, data, session_key)
+        finally:
+            connections.close_all()
+
+    def request(self, client, name, method, path, data, session_key):
+        client.cookies[settings.SESSION_COOKIE_NAME] = session_key
+        queries = []
+
+        def count(execute, sql, params, many, context):
+            queries.append(sql)
+            return execute(sql, params, many, context)
+
+        started = time.perf_counter()
+        try:
+            with connection.execute_wrapper(count):
+                response = getattr(client, method)(path, data)
+            ok = response.status_code < 400
+        except Exception:
+            ok = False
+        latency = time.perf_counter() - started
+        with self.lock:
+            self.samples[name].append((latency, len(queries)))
+            if not ok:
+                self.errors[name] += 1
+
+    def summarize(self, name, elapsed):
+        samples = self.samples[name]
+        if not samples:
+            return {'requests': 0, 'errors': 0, 'rps': 0.0}
+        latencies = sorted(latency for latency, _ in samples)
+        queries = sorted(count for _, count in samples)
+        return {
+            'requests': len(samples),
+            'errors': self.errors[name],
+            'rps': len(samples) / elapsed,
+            'p50_ms': statistics.median(latencies) * 1000,
+            'p95_ms': percentile(latencies, 0.95) * 1000,
+            'p99_ms': percentile(latencies, 0.99) * 1000,
+            'max_ms': latencies[-1] * 1000,
+            'queries_avg': sum(queries) / len(queries),
+            'queries_p95': percentile(queries, 0.95),
+            'queries_max': queries[-1],
+        }
+
+    def report(self, results):
+        self.stdout.write(f'{results["requests"]} requests in {results["elapsed_seconds"]:.1f}s, '
+                          f'{results["rps"]:.1f} req/s with {results["concurrency"]} workers')
+        for name, stats in results['endpoints'].items():
+            if not stats['requests']:
+                continue
+            self.stdout.write(
+                f'{name:16} {stats["rps"]:8.1f} req/s  p50={stats["p50_ms"]:.1f}ms  p95={stats["p95_ms"]:.1f}ms  '
+                f'p99={stats["p99_ms"]:.1f}ms  queries avg={stats["queries_avg"]:.1f} max={stats["queries_max"]}  '
+                f'errors={stats["errors"]}')
+
+    def compare(self, results, baseline, max_regression):
+        # Returns True when some endpoint got slower than allowed
+        failed = False
+        for name, stats in results['endpoints'].items():
+            before = baseline.get('endpoints', {}).get(name)
+            if not before or not before.get('requests') or not stats['requests']:
+                continue
+            change = stats['p95_ms'] / before['p95_ms'] - 1 if before['p95_ms'] else 0.0
+            queries = stats['queries_avg'] - before['queries_avg']
+            regressed = change > max_regression
+            failed = failed or regressed
+            style = self.style.ERROR if regressed else self.style.SUCCESS
+            self.stdout.write(style(
+                f'{name:16} p95 {before["p95_ms"]:.1f}ms -> {stats["p95_ms"]:.1f}ms ({change:+.0%})  '
+                f'queries avg {queries:+.1f}'))
+        return failed
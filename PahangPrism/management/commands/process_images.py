@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from PahangPrism import catalogue_cache, images
+from PahangPrism.models import Event, Venue
+
+
+class Command(BaseCommand):
+    help = 'Build resized AVIF/WebP/JPEG variants for event and venue images'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Rebuild variants that already exist')
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'Encoding as {", ".join(images.available_formats())}')
+        processed = failed = 0
+        for model in (Event, Venue):
+            queryset = model.objects.exclude(image='')
+            if not options['force']:
+                queryset = queryset.filter(image_variants={})
+            for obj in queryset.iterator():
+                try:
+                    data = images.read_source(obj.image)
+                except FileNotFoundError:
+                    self.stderr.write(f'{model.__name__} {obj.pk}: source {obj.image} not found')
+                    failed += 1
+                    continue
+                old_files = images.files(obj)
+                obj.image_variants = images.process(data, images.prefix_for(obj))
+                # update() skips post_save, so the search index and catalogue version aren't touched per row
+                model.objects.filter(pk=obj.pk).update(image_variants=obj.image_variants)
+                images.delete_unused(old_files, obj)
+                processed += 1
+        if processed:
+            catalogue_cache.bump_version()
+        self.stdout.write(self.style.SUCCESS(f'Processed {processed} images, {failed} missing.'))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from PahangPrism import search_index
+from PahangPrism.models import Event, Venue
+
+
+class Command(BaseCommand):
+    help = 'Drop and rebuild the event/venue search index from scratch'
+
+    def handle(self, *args, **options):
+        if not search_index.is_supported(connection):
+            raise CommandError(f'Search index is not available on the {connection.vendor} backend.')
+        with transaction.atomic():
+            count = search_index.rebuild(Event, Venue)
+        self.stdout.write(self.style.SUCCESS(f'Indexed {count} documents.'))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from PahangPrism import stats
+
+
+class Command(BaseCommand):
+    help = ('Recount the booking and star counters on events and venues from the Booking and StarredItem '
+            'tables, fixing any that drifted, and recompute the trending scores.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Report drifted counters without fixing them')
+
+    def handle(self, *args, **options):
+        drift = stats.reconcile(dry_run=options['dry_run'])
+        for counter, count in drift.items():
+            style = self.style.WARNING if count else self.style.SUCCESS
+            self.stdout.write(style(f'{counter}: {count} wrong'))
+        if options['dry_run']:
+            return
+        scored = stats.refresh_trending()
+        self.stdout.write(self.style.SUCCESS(f'Fixed {sum(drift.values())} counters; {scored} items trending.'))
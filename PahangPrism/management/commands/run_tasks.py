@@ -0,0 +1,41 @@
+import signal
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from PahangPrism import catalogue_cache, task_queue
+
+
+class Command(BaseCommand):
+    help = ('Run queued background tasks (image processing, search indexing, waitlist fills) and the '
+            'periodic ones (trending scores). Runs until stopped; SIGTERM lets the current task finish first.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Run what is due now, then exit')
+        parser.add_argument('--poll', type=float, default=1.0, help='Seconds to wait when the queue is empty')
+        parser.add_argument('--batch-size', type=int, default=10, help='Tasks claimed at a time')
+
+    def handle(self, *args, **options):
+        self.stopping = False
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        if not catalogue_cache.is_shared():
+            self.stderr.write('Warning: the cache is local to this process, so web workers keep serving '
+                              'cached pages after the catalogue changes here; set REDIS_URL to share it.')
+        task_queue.schedule_periodic()
+        total = 0
+        while not self.stopping:
+            close_old_connections()
+            ran = task_queue.run_pending(options['batch_size'], limit=options['batch_size'])
+            total += ran
+            if ran:
+                continue
+            if options['once']:
+                break
+            time.sleep(options['poll'])
+        self.stdout.write(f'Ran {total} tasks.')
+
+    def stop(self, signum, frame):
+        self.stopping = True
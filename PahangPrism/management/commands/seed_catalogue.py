@@ -0,0 +1,170 @@
+import random
+import time
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from PahangPrism import catalogue_cache, geo, search_index, sequences, stats
+from PahangPrism.models import Booking, Event, StarredItem, Task, User, Venue
+
+# Synthetic data for load tests (see loadtest.py). Everything created here
+# is marked (venue IDs 'SEED-V<n>', emails '@seed.invalid') so --clear can
+# remove it without touching real rows. Seed users' passwords are unusable.
+
+VENUE_PREFIX = 'SEED-V'
+EMAIL_DOMAIN = 'seed.invalid'
+STAFF_EMAIL = f'staff@{EMAIL_DOMAIN}'
+
+# Town -> (latitude, longitude); seeded venues are scattered up to ~15km around their town
+TOWN_COORDINATES = {
+    'Kuantan': (3.808, 103.326), 'Cherating': (4.127, 103.392), 'Bentong': (3.522, 101.908),
+    'Raub': (3.793, 101.857), 'Temerloh': (3.449, 102.418), 'Pekan': (3.494, 103.390),
+    'Jerantut': (3.936, 102.363), 'Rompin': (2.807, 103.486), 'Tioman': (2.790, 104.170),
+    'Cameron Highlands': (4.471, 101.377), 'Fraser\'s Hill': (3.712, 101.738),
+    'Genting Highlands': (3.423, 101.793), 'Maran': (3.586, 102.773), 'Lipis': (4.184, 102.053),
+}
+TOWNS = list(TOWN_COORDINATES)
+PLACES = ['Beach', 'Park', 'Hall', 'Waterfall', 'Jetty', 'Museum', 'Square', 'Resort', 'Stadium', 'Garden']
+THEMES = ['Festival', 'Run', 'Night Market', 'Concert', 'Food Fair', 'Regatta', 'Tour', 'Workshop',
+          'Cultural Show', 'Trail Walk', 'Lantern Parade', 'Durian Feast', 'Kite Festival', 'Batik Expo']
+
+
+def spread(count, buckets, offset):
+    # count distinct indexes in range(buckets), well mixed for each offset
+    step = 104729  # prime, so distinct while count <= buckets (unless buckets is a multiple of it)
+    return [(offset * 7919 + i * step) % buckets for i in range(min(count, buckets))]
+
+
+class Command(BaseCommand):
+    help = ('Create a synthetic catalogue of venues, events, users, bookings and stars for load '
+            'testing, or remove it again with --clear.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--venues', type=int, default=1000)
+        parser.add_argument('--events', type=int, default=10000)
+        parser.add_argument('--users', type=int, default=10000)
+        parser.add_argument('--bookings', type=int, default=100000)
+        parser.add_argument('--stars', type=int, default=50000)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=1, help='Random seed, for repeatable catalogues')
+        parser.add_argument('--clear', action='store_true', help='Remove seeded data instead')
+
+    def handle(self, *args, **options):
+        if options['clear']:
+            self.clear()
+            return
+        if Venue.objects.filter(venueID__startswith=VENUE_PREFIX).exists():
+            raise CommandError('Seed data already exists; run with --clear first.')
+
+        self.batch_size = options['batch_size']
+        self.random = random.Random(options['seed'])
+        started = time.perf_counter()
+        venue_ids = self.create_venues(options['venues'])
+        event_ids = self.create_events(options['events'], venue_ids)
+        user_ids = self.create_users(options['users'])
+        self.create_bookings(options['bookings'], user_ids, event_ids)
+        self.create_stars(options['stars'], user_ids, event_ids, venue_ids)
+        # Seats taken and star counts follow the rows, ignoring capacity as a past import would
+        self.step('counters', lambda: stats.reconcile(Event.objects.filter(venue__venueID__startswith=VENUE_PREFIX),
+                                                      Venue.objects.filter(venueID__startswith=VENUE_PREFIX)))
+
+        self.step('search index', lambda: search_index.rebuild(Event, Venue, batch_size=self.batch_size))
+        catalogue_cache.bump_version()
+        self.stdout.write(self.style.SUCCESS(f'Seeded in {time.perf_counter() - started:.1f}s'))
+
+    def step(self, label, work):
+        started = time.perf_counter()
+        result = work()
+        self.stdout.write(f'{label}: {time.perf_counter() - started:.1f}s')
+        return result
+
+    def bulk(self, model, rows):
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= self.batch_size:
+                model.objects.bulk_create(batch, ignore_conflicts=True)
+                batch = []
+        model.objects.bulk_create(batch, ignore_conflicts=True)
+
+    def create_venues(self, count):
+        venue_ids = [f'{VENUE_PREFIX}{i}' for i in range(count)]
+
+        def rows():
+            for i, venue_id in enumerate(venue_ids):
+                town = TOWNS[i % len(TOWNS)]
+                latitude, longitude = TOWN_COORDINATES[town]
+                latitude += self.random.uniform(-0.13, 0.13)
+                longitude += self.random.uniform(-0.13, 0.13)
+                # bulk_create skips Venue.save, which sets the geohash
+                yield Venue(venueID=venue_id, name=f'{town} {self.random.choice(PLACES)} {i}', location=town,
+                            latitude=latitude, longitude=longitude, geohash=geo.geohash_for(latitude, longitude))
+
+        self.step(f'{count} venues', lambda: self.bulk(Venue, rows()))
+        return venue_ids
+
+    def create_events(self, count, venue_ids):
+        event_ids = sequences.event_ids(count) if count else []
+        today = date.today()
+
+        def rows():
+            for i, event_id in enumerate(event_ids):
+                yield Event(
+                    eventID=event_id,
+                    name=f'{self.random.choice(THEMES)} {i}',
+                    date=today + timedelta(days=self.random.randint(-90, 365)),
+                    venue_id=venue_ids[i % len(venue_ids)],
+                    capacity=self.random.choice([None, 50, 200, 1000]),
+                )
+
+        self.step(f'{count} events', lambda: self.bulk(Event, rows()))
+        return event_ids
+
+    def create_users(self, count):
+        def rows():
+            yield User(full_name='Seed Staff', email=STAFF_EMAIL, password='!', is_staff=True)
+            for i in range(count):
+                yield User(full_name=f'Seed User {i}', email=f'user{i}@{EMAIL_DOMAIN}', password='!')
+
+        self.step(f'{count} users', lambda: self.bulk(User, rows()))
+        return list(User.objects.filter(email__endswith=f'@{EMAIL_DOMAIN}', is_staff=False)
+                    .order_by('userID').values_list('userID', flat=True))
+
+    def create_bookings(self, count, user_ids, event_ids):
+        if not count or not user_ids or not event_ids:
+            return
+        per_user, extra = divmod(count, len(user_ids))
+
+        def rows():
+            for n, user_id in enumerate(user_ids):
+                for index in spread(per_user + (n < extra), len(event_ids), n):
+                    yield Booking(user_id=user_id, event_id=event_ids[index])
+
+        self.step(f'{count} bookings', lambda: self.bulk(Booking, rows()))
+
+    def create_stars(self, count, user_ids, event_ids, venue_ids):
+        if not count or not user_ids:
+            return
+        per_user, extra = divmod(count, len(user_ids))
+
+        def rows():
+            for n, user_id in enumerate(user_ids):
+                for index in spread(per_user + (n < extra), len(event_ids) + len(venue_ids), n + 1):
+                    if index < len(event_ids):
+                        yield StarredItem(userID_id=user_id, event_id=event_ids[index])
+                    else:
+                        yield StarredItem(userID_id=user_id, venue_id=venue_ids[index - len(event_ids)])
+
+        self.step(f'{count} stars', lambda: self.bulk(StarredItem, rows()))
+
+    def clear(self):
+        # Events, bookings, stars and waitlist entries go with their venues and users
+        with transaction.atomic():
+            users, _ = User.objects.filter(email__endswith=f'@{EMAIL_DOMAIN}').delete()
+            venues, _ = Venue.objects.filter(venueID__startswith=VENUE_PREFIX).delete()
+            # The deletes queued a reindex per event; the rebuild below covers them
+            Task.objects.filter(name='reindex').delete()
+        self.step('search index', lambda: search_index.rebuild(Event, Venue, batch_size=500))
+        catalogue_cache.bump_version()
+        self.stdout.write(self.style.SUCCESS(f'Removed {venues + users} seeded rows.'))
@@ -0,0 +1,37 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+MODES = ['PASSIVE', 'FULL', 'RESTART', 'TRUNCATE']
+
+
+class Command(BaseCommand):
+    help = ('Checkpoint the WAL of every SQLite database into the main file. SQLite does this on its '
+            'own only when no reader is active, so under steady traffic the WAL keeps growing; '
+            'run this from cron, or with --every as a long-running process.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mode', default='TRUNCATE', choices=MODES,
+                            help='TRUNCATE also shrinks the WAL file back to zero bytes')
+        parser.add_argument('--every', type=float, help='Repeat every this many seconds')
+
+    def handle(self, *args, **options):
+        aliases = [alias for alias in connections if connections[alias].vendor == 'sqlite']
+        if not aliases:
+            raise CommandError('No SQLite databases are configured.')
+        while True:
+            for alias in aliases:
+                self.checkpoint(alias, options['mode'])
+            if not options['every']:
+                return
+            time.sleep(options['every'])
+
+    def checkpoint(self, alias, mode):
+        connection = connections[alias]
+        with connection.cursor() as cursor:
+            cursor.execute(f'PRAGMA wal_checkpoint({mode})')
+            busy, wal_pages, checkpointed = cursor.fetchone()
+        connection.close()
+        status = 'blocked by a writer or reader' if busy else 'ok'
+        self.stdout.write(f'{alias}: {checkpointed}/{wal_pages} WAL pages checkpointed ({status})')
@@ -0,0 +1,25 @@
+from django.db import migrations
+
+from PahangPrism import search_index
+
+
+def create_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if not search_index.is_supported(connection):
+        return
+    search_index.rebuild(apps.get_model('PahangPrism', 'Event'), apps.get_model('PahangPrism', 'Venue'), conn=connection)
+
+
+def drop_search_index(apps, schema_editor):
+    search_index.drop_table(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('PahangPrism', '0003_remove_event_image_path_remove_venue_image_path'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
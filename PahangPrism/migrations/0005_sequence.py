@@ -0,0 +1,34 @@
+# Generated by Django 5.1 on 2026-10-18 09:53
+
+from django.db import migrations, models
+
+
+def seed_event_sequence(apps, schema_editor):
+    # Start the counter after the highest numeric 'E<n>' already in use.
+    # IDs are compared as numbers here: 'E10' is higher than 'E9'.
+    Event = apps.get_model('PahangPrism', 'Event')
+    Sequence = apps.get_model('PahangPrism', 'Sequence')
+    db_alias = schema_editor.connection.alias
+    highest = 0
+    for event_id in Event.objects.using(db_alias).values_list('eventID', flat=True).iterator():
+        if event_id[:1] == 'E' and event_id[1:].isdigit():
+            highest = max(highest, int(event_id[1:]))
+    Sequence.objects.using(db_alias).update_or_create(name='event', defaults={'value': highest})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('PahangPrism', '0004_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Sequence',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('value', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(seed_event_sequence, migrations.RunPython.noop),
+    ]
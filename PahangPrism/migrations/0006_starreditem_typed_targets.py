@@ -0,0 +1,93 @@
+# Generated by Django 5.1 on 2026-10-18 09:57
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def copy_targets(apps, schema_editor):
+    # Move content_type/object_id into the typed foreign keys.
+    # Stars pointing at events or venues that no longer exist are dropped.
+    StarredItem = apps.get_model('PahangPrism', 'StarredItem')
+    Event = apps.get_model('PahangPrism', 'Event')
+    Venue = apps.get_model('PahangPrism', 'Venue')
+    db_alias = schema_editor.connection.alias
+    event_ids = set(Event.objects.using(db_alias).values_list('eventID', flat=True))
+    venue_ids = set(Venue.objects.using(db_alias).values_list('venueID', flat=True))
+    orphans = []
+    for item in StarredItem.objects.using(db_alias).all().iterator():
+        if item.content_type == 'event' and item.object_id in event_ids:
+            item.event_id = item.object_id
+        elif item.content_type == 'venue' and item.object_id in venue_ids:
+            item.venue_id = item.object_id
+        else:
+            orphans.append(item.pk)
+            continue
+        item.save(update_fields=['event', 'venue'])
+    StarredItem.objects.using(db_alias).filter(pk__in=orphans).delete()
+
+
+def copy_targets_back(apps, schema_editor):
+    StarredItem = apps.get_model('PahangPrism', 'StarredItem')
+    db_alias = schema_editor.connection.alias
+    for item in StarredItem.objects.using(db_alias).all().iterator():
+        if item.event_id:
+            item.content_type, item.object_id = 'event', item.event_id
+        else:
+            item.content_type, item.object_id = 'venue', item.venue_id
+        item.save(update_fields=['content_type', 'object_id'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('PahangPrism', '0005_sequence'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='starreditem',
+            name='event',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='PahangPrism.event'),
+        ),
+        migrations.AddField(
+            model_name='starreditem',
+            name='venue',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='PahangPrism.venue'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='starreditem',
+            unique_together=set(),
+        ),
+        migrations.RunPython(copy_targets, copy_targets_back),
+        # Defaults only so the columns can be re-added when migrating backwards
+        migrations.AlterField(
+            model_name='starreditem',
+            name='content_type',
+            field=models.CharField(default='', max_length=50),
+        ),
+        migrations.AlterField(
+            model_name='starreditem',
+            name='object_id',
+            field=models.CharField(default='', max_length=255),
+        ),
+        migrations.RemoveField(
+            model_name='starreditem',
+            name='content_type',
+        ),
+        migrations.RemoveField(
+            model_name='starreditem',
+            name='object_id',
+        ),
+        migrations.AddConstraint(
+            model_name='starreditem',
+            constraint=models.UniqueConstraint(condition=models.Q(('event__isnull', False)), fields=('userID', 'event'), name='unique_starred_event'),
+        ),
+        migrations.AddConstraint(
+            model_name='starreditem',
+            constraint=models.UniqueConstraint(condition=models.Q(('venue__isnull', False)), fields=('userID', 'venue'), name='unique_starred_venue'),
+        ),
+        migrations.AddConstraint(
+            model_name='starreditem',
+            constraint=models.CheckConstraint(condition=models.Q(models.Q(('event__isnull', False), ('venue__isnull', True)), models.Q(('event__isnull', True), ('venue__isnull', False)), _connector='OR'), name='starred_item_one_target'),
+        ),
+    ]
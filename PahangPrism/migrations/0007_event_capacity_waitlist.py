@@ -0,0 +1,48 @@
+# Generated by Django 5.1 on 2026-10-18 09:59
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def count_existing_bookings(apps, schema_editor):
+    Event = apps.get_model('PahangPrism', 'Event')
+    Booking = apps.get_model('PahangPrism', 'Booking')
+    db_alias = schema_editor.connection.alias
+    counts = Booking.objects.using(db_alias).values('event_id').annotate(count=Count('bookingID')).values_list('event_id', 'count')
+    for event_id, count in counts:
+        Event.objects.using(db_alias).filter(pk=event_id).update(booked=count)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('PahangPrism', '0006_starreditem_typed_targets'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='booked',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='capacity',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='WaitlistEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('event', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='PahangPrism.event')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='PahangPrism.user')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['event', 'created_at'], name='waitlist_event_created_idx')],
+                'unique_together': {('user', 'event')},
+            },
+        ),
+        migrations.RunPython(count_existing_bookings, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.1 on 2026-10-18 10:03
+
+from django.db import migrations, models
+
+# Pictures event_list.html used to pick by hardcoded eventID.
+# Run "manage.py process_images" afterwards to build their variants.
+LEGACY_EVENT_IMAGES = {
+    'E1': 'image/lavender.avif',
+    'E2': 'image/park.avif',
+    'E3': 'image/island.avif',
+    'E4': 'image/cultural.avif',
+    'E5': 'image/waterfall.avif',
+}
+
+
+def set_legacy_images(apps, schema_editor):
+    Event = apps.get_model('PahangPrism', 'Event')
+    db_alias = schema_editor.connection.alias
+    for event_id, path in LEGACY_EVENT_IMAGES.items():
+        Event.objects.using(db_alias).filter(eventID=event_id, image='').update(image=path)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('PahangPrism', '0007_event_capacity_waitlist'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='image',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='image_variants',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='venue',
+            name='image',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='venue',
+            name='image_variants',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.RunPython(set_legacy_images, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,73 @@
+# Generated by Django 5.1 on 2026-10-18 10:46
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def count_existing_stars(apps, schema_editor):
+    StarredItem = apps.get_model('PahangPrism', 'StarredItem')
+    db_alias = schema_editor.connection.alias
+    for field in ('event', 'venue'):
+        model = apps.get_model('PahangPrism', field.capitalize())
+        counts = (StarredItem.objects.using(db_alias).filter(**{f'{field}__isnull': False})
+                  .values(f'{field}_id').annotate(count=Count('id')).values_list(f'{field}_id', 'count'))
+        for object_id, count in counts:
+            model.objects.using(db_alias).filter(pk=object_id).update(star_count=count)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('PahangPrism', '0010_task_queue'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyActivity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=10)),
+                ('object_id', models.CharField(max_length=50)),
+                ('day', models.DateField()),
+                ('bookings', models.IntegerField(default=0)),
+                ('stars', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='star_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='trending',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='venue',
+            name='star_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='venue',
+            name='trending',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(fields=['trending'], name='event_trending_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='venue',
+            index=models.Index(fields=['trending'], name='venue_trending_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='dailyactivity',
+            index=models.Index(fields=['day'], name='daily_activity_day_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailyactivity',
+            constraint=models.UniqueConstraint(fields=('kind', 'object_id', 'day'), name='unique_daily_activity'),
+        ),
+        migrations.RunPython(count_existing_stars, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,22 @@
+from django.db import migrations
+
+from PahangPrism import search_index
+
+
+def rebuild_search_index(apps, schema_editor):
+    # Re-index so every document takes the rowid kept in the new keys table
+    connection = schema_editor.connection
+    if not search_index.is_supported(connection):
+        return
+    search_index.rebuild(apps.get_model('PahangPrism', 'Event'), apps.get_model('PahangPrism', 'Venue'), conn=connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('PahangPrism', '0012_venue_coordinates'),
+    ]
+
+    operations = [
+        migrations.RunPython(rebuild_search_index, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.1 on 2026-10-18 11:26
+
+from django.db import migrations, models
+
+from PahangPrism import task_queue
+
+
+def mark_periodic_rows(apps, schema_editor):
+    # Keep the oldest row of each periodic task as its one periodic row
+    Task = apps.get_model('PahangPrism', 'Task')
+    for name, func in task_queue.REGISTRY.items():
+        if not func.every:
+            continue
+        rows = Task.objects.filter(name=name).order_by('pk')
+        first = rows.first()
+        if first is not None:
+            rows.exclude(pk=first.pk).delete()
+            Task.objects.filter(pk=first.pk).update(periodic=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('PahangPrism', '0013_search_index_rowids'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='task',
+            name='periodic',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.RunPython(mark_periodic_rows, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='task',
+            constraint=models.UniqueConstraint(condition=models.Q(('periodic', True)), fields=('name',), name='unique_periodic_task'),
+        ),
+    ]
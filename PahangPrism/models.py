@@ -1,6 +1,5 @@
 from django.db import models
-import uuid
-from django.db.models import Max
+from django.utils import timezone
 
 # User model for managing signups and logins
 class User(models.Model):
@@ -18,6 +17,28 @@ class Venue(models.Model):
     venueID = models.CharField(primary_key=True, max_length=50)
     name = models.CharField(max_length=255)
     location = models.CharField(max_length=255)
+    image = models.CharField(max_length=255, blank=True)  # Original upload, see PahangPrism/images.py
+    image_variants = models.JSONField(default=dict, blank=True)
+    star_count = models.PositiveIntegerField(default=0)  # Maintained by PahangPrism.stats
+    trending = models.FloatField(default=0)  # Decayed recent activity, refreshed by PahangPrism.stats
+    latitude = models.FloatField(null=True, blank=True)
+    longitude = models.FloatField(null=True, blank=True)
+    geohash = models.CharField(max_length=12, blank=True, editable=False)  # Of the coordinates, see PahangPrism/geo.py
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['trending'], name='venue_trending_idx'),
+            # Proximity search
+            models.Index(fields=['geohash'], name='venue_geohash_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        from .geo import geohash_for
+        self.geohash = geohash_for(self.latitude, self.longitude)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'latitude', 'longitude'} & set(update_fields):
+            kwargs['update_fields'] = set(update_fields) | {'geohash'}
+        super().save(*args, **kwargs)
 
 # Event model for storing event information
 class Event(models.Model):
@@ -25,29 +46,66 @@ class Event(models.Model):
     name = models.CharField(max_length=255)
     date = models.DateField()
     venue = models.ForeignKey(Venue, on_delete=models.CASCADE)
+    capacity = models.PositiveIntegerField(null=True, blank=True)  # None means unlimited
+    booked = models.PositiveIntegerField(default=0)  # Seats taken, maintained by PahangPrism.booking
+    image = models.CharField(max_length=255, blank=True)  # Original upload, see PahangPrism/images.py
+    image_variants = models.JSONField(default=dict, blank=True)
+    star_count = models.PositiveIntegerField(default=0)  # Maintained by PahangPrism.stats
+    trending = models.FloatField(default=0)  # Decayed recent activity, refreshed by PahangPrism.stats
+
+    class Meta:
+        indexes = [
+            # Keyset pages of the event listing, with and without a venue filter
+            models.Index(fields=['date', 'eventID'], name='event_date_id_idx'),
+            models.Index(fields=['venue', 'date', 'eventID'], name='event_venue_date_id_idx'),
+            # Trending lists on the home page
+            models.Index(fields=['trending'], name='event_trending_idx'),
+        ]
+
+    @property
+    def is_full(self):
+        return self.capacity is not None and self.booked >= self.capacity
 
     def save(self, *args, **kwargs):
         if not self.eventID:
-            # Get the maximum eventID
-            max_id = Event.objects.aggregate(Max('eventID'))['eventID__max']
-            if max_id:
-                # Extract the number, increment it, and create a new ID
-                max_num = int(max_id[1:])
-                new_num = max_num + 1
-                self.eventID = f'E{new_num}'
-            else:
-                # If no events exist yet, start with E1
-                self.eventID = 'E1'
+            # Take the next number from the event counter instead of scanning Max('eventID')
+            from .sequences import next_event_id
+            self.eventID = next_event_id()
         super().save(*args, **kwargs)
 
+# Named counters used to hand out human-readable IDs such as 'E12'
+class Sequence(models.Model):
+    name = models.CharField(primary_key=True, max_length=50)
+    value = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f'{self.name}={self.value}'
+
 # StarredItem model for users to favorite venues and events
+# Exactly one of event / venue is set on each row.
 class StarredItem(models.Model):
     userID = models.ForeignKey(User, on_delete=models.CASCADE)
-    content_type = models.CharField(max_length=50)  # 'venue' or 'event'
-    object_id = models.CharField(max_length=255)
+    event = models.ForeignKey(Event, null=True, blank=True, on_delete=models.CASCADE)
+    venue = models.ForeignKey(Venue, null=True, blank=True, on_delete=models.CASCADE)
 
     class Meta:
-        unique_together = ('userID', 'content_type', 'object_id')
+        constraints = [
+            # (userID, event) / (userID, venue) also serve the per-user lookups
+            models.UniqueConstraint(fields=['userID', 'event'], condition=models.Q(event__isnull=False), name='unique_starred_event'),
+            models.UniqueConstraint(fields=['userID', 'venue'], condition=models.Q(venue__isnull=False), name='unique_starred_venue'),
+            models.CheckConstraint(
+                condition=models.Q(event__isnull=False, venue__isnull=True) | models.Q(event__isnull=True, venue__isnull=False),
+                name='starred_item_one_target',
+            ),
+        ]
+
+    @property
+    def content_type(self):
+        return 'event' if self.event_id else 'venue'
+
+    @property
+    def object_id(self):
+        return self.event_id or self.venue_id
 
 # Booking model for event registrations
 class Booking(models.Model):
@@ -58,3 +116,56 @@ class Booking(models.Model):
 
     class Meta:
         unique_together = ('user', 'event')
+
+# Users waiting for a seat on a full event, served first come first served
+class WaitlistEntry(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    event = models.ForeignKey(Event, on_delete=models.CASCADE)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('user', 'event')
+        indexes = [models.Index(fields=['event', 'created_at'], name='waitlist_event_created_idx')]
+
+# Net bookings and stars per event or venue per day, the input to the
+# trending scores (see PahangPrism.stats). Days older than the trending
+# window are deleted when the scores are refreshed.
+class DailyActivity(models.Model):
+    kind = models.CharField(max_length=10)  # 'event' or 'venue'
+    object_id = models.CharField(max_length=50)
+    day = models.DateField()
+    bookings = models.IntegerField(default=0)
+    stars = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'object_id', 'day'], name='unique_daily_activity'),
+        ]
+        indexes = [models.Index(fields=['day'], name='daily_activity_day_idx')]
+
+# Deferred work for PahangPrism.task_queue; rows are deleted once they succeed
+class Task(models.Model):
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    FAILED = 'failed'
+
+    name = models.CharField(max_length=100)
+    kwargs = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, default=QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_at = models.DateTimeField(default=timezone.now)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    locked_by = models.CharField(max_length=100, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    periodic = models.BooleanField(default=False)  # The one row of an @task(every=...) task
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'run_at'], name='task_status_run_at_idx')]
+        constraints = [
+            models.UniqueConstraint(fields=['name'], condition=models.Q(periodic=True), name='unique_periodic_task'),
+        ]
+
+    def __str__(self):
+        return f'{self.name} ({self.status})'
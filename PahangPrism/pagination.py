@@ -0,0 +1,121 @@
+import base64
+import json
+from datetime import date, datetime
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+# Keyset (cursor) pagination.
+# Instead of OFFSET, each page continues from the (sort value, pk) of the
+# last row of the previous page, so page 1000 costs the same as page 1
+# when the sort column is indexed.
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def _encode_value(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+def encode_cursor(values):
+    raw = json.dumps([_encode_value(value) for value in values], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except (ValueError, TypeError):
+        raise InvalidCursor(cursor)
+    if not isinstance(values, list):
+        raise InvalidCursor(cursor)
+    return values
+
+
+def page_size(value, default=DEFAULT_PAGE_SIZE):
+    try:
+        return max(1, min(int(value), MAX_PAGE_SIZE))
+    except (TypeError, ValueError):
+        return default
+
+
+def _lookup(field, attr):
+    # 'venue__name' -> row.venue.name, or row['venue__name'] for values() rows
+    if isinstance(attr, dict):
+        return attr[field]
+    for part in field.split('__'):
+        attr = getattr(attr, part)
+    return attr
+
+
+def _model_field(model, path):
+    # The model field behind a lookup path such as 'venue__name'
+    *relations, name = path.split('__')
+    for relation in relations:
+        model = model._meta.get_field(relation).related_model
+    return model._meta.get_field(name)
+
+
+def _cursor_values(model, fields, cursor):
+    # Decoded cursor values, each converted to its ordering field's type;
+    # anything that doesn't fit is an InvalidCursor rather than a query error
+    values = decode_cursor(cursor)
+    if len(values) != len(fields):
+        raise InvalidCursor(cursor)
+    converted = []
+    for path, value in zip(fields, values):
+        if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+            raise InvalidCursor(cursor)
+        try:
+            converted.append(_model_field(model, path).to_python(value))
+        except (ValidationError, TypeError, ValueError):
+            raise InvalidCursor(cursor)
+    return converted
+
+
+def _page_query(queryset, fields, cursor, limit, descending):
+    op = 'lt' if descending else 'gt'
+    if cursor:
+        values = _cursor_values(queryset.model, fields, cursor)
+        # (a, b) > (x, y)  <=>  a > x OR (a = x AND b > y)
+        condition = Q()
+        for i, field in enumerate(fields):
+            step = Q(**{f'{field}__{op}': values[i]})
+            for previous, value in zip(fields[:i], values[:i]):
+                step &= Q(**{previous: value})
+            condition |= step
+        # Implied by the OR above, but gives the planner a range on the
+        # leading index column instead of a scan from the start
+        queryset = queryset.filter(condition, **{f'{fields[0]}__{op}e': values[0]})
+
+    ordering = [f'-{field}' if descending else field for field in fields]
+    return queryset.order_by(*ordering)[:limit + 1]
+
+
+def _page_result(rows, fields, limit):
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor([_lookup(field, rows[-1]) for field in fields])
+    return rows, next_cursor
+
+
+def keyset_page(queryset, fields, cursor=None, limit=DEFAULT_PAGE_SIZE, descending=False):
+    # fields is the ordering, most significant first, and must end in a
+    # unique column (normally the pk) so the order is total.
+    # Returns (rows, next_cursor); next_cursor is None on the last page.
+    rows = list(_page_query(queryset, fields, cursor, limit, descending))
+    return _page_result(rows, fields, limit)
+
+
+async def akeyset_page(queryset, fields, cursor=None, limit=DEFAULT_PAGE_SIZE, descending=False):
+    rows = [row async for row in _page_query(queryset, fields, cursor, limit, descending)]
+    return _page_result(rows, fields, limit)
@@ -0,0 +1,225 @@
+import re
+from itertools import chain
+
+from django.db import connection, transaction
+
+# Inverted index behind the search page.
+# On SQLite it is an FTS5 virtual table, on Postgres a plain table with a
+# tsvector column and a GIN index. Both are created in migration 0004.
+# Other backends fall back to the old icontains filters in views.search.
+# FTS5 only finds a row without a full scan by its rowid, so on SQLite each
+# (kind, object_id) gets a fixed rowid from SEARCH_KEYS_TABLE (migration 0013).
+SEARCH_TABLE = 'pahangprism_search'
+SEARCH_KEYS_TABLE = 'pahangprism_search_keys'
+
+SQLITE_CREATE = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5(
+        kind UNINDEXED,
+        object_id UNINDEXED,
+        name,
+        body,
+        tokenize = 'unicode61 remove_diacritics 2',
+        prefix = '2 3'
+    )""",
+    f"""CREATE TABLE IF NOT EXISTS {SEARCH_KEYS_TABLE} (
+        id INTEGER PRIMARY KEY,
+        kind TEXT NOT NULL,
+        object_id TEXT NOT NULL,
+        UNIQUE (kind, object_id)
+    )""",
+]
+
+# The rowid of one document in SEARCH_TABLE, from (kind, object_id)
+SQLITE_ROWID = f"SELECT id FROM {SEARCH_KEYS_TABLE} WHERE kind = %s AND object_id = %s"
+
+POSTGRES_CREATE = [
+    f"""CREATE TABLE IF NOT EXISTS {SEARCH_TABLE} (
+        kind varchar(10) NOT NULL,
+        object_id varchar(50) NOT NULL,
+        name text NOT NULL,
+        body text NOT NULL,
+        document tsvector NOT NULL,
+        PRIMARY KEY (kind, object_id)
+    )""",
+    f"CREATE INDEX IF NOT EXISTS {SEARCH_TABLE}_document_gin ON {SEARCH_TABLE} USING GIN (document)",
+]
+
+DROP = [f"DROP TABLE IF EXISTS {SEARCH_TABLE}", f"DROP TABLE IF EXISTS {SEARCH_KEYS_TABLE}"]
+
+# Name matches count ten times as much as venue name / location matches
+NAME_WEIGHT = 10.0
+BODY_WEIGHT = 1.0
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def is_supported(conn=None):
+    conn = conn or connection
+    return conn.vendor in ('sqlite', 'postgresql')
+
+
+def create_table(conn=None):
+    conn = conn or connection
+    statements = {'sqlite': SQLITE_CREATE, 'postgresql': POSTGRES_CREATE}.get(conn.vendor, [])
+    with conn.cursor() as cursor:
+        for sql in statements:
+            cursor.execute(sql)
+
+
+def drop_table(conn=None):
+    conn = conn or connection
+    if not is_supported(conn):
+        return
+    with conn.cursor() as cursor:
+        for sql in DROP:
+            cursor.execute(sql)
+
+
+def event_document(event):
+    return ('event', event.eventID, event.name, event.venue.name)
+
+
+def venue_document(venue):
+    return ('venue', venue.venueID, venue.name, venue.location)
+
+
+def _write(cursor, vendor, documents, replace=True):
+    # replace=False skips deleting earlier copies, for a table known not to
+    # hold these documents yet
+    documents = list(documents)
+    if not documents:
+        return
+    keys = [[kind, object_id] for kind, object_id, _, _ in documents]
+    if vendor == 'sqlite':
+        cursor.executemany(f"INSERT OR IGNORE INTO {SEARCH_KEYS_TABLE} (kind, object_id) VALUES (%s, %s)", keys)
+        if replace:
+            cursor.executemany(f"DELETE FROM {SEARCH_TABLE} WHERE rowid = ({SQLITE_ROWID})", keys)
+        cursor.executemany(
+            f"INSERT INTO {SEARCH_TABLE} (rowid, kind, object_id, name, body) "
+            f"SELECT id, kind, object_id, %s, %s FROM {SEARCH_KEYS_TABLE} WHERE kind = %s AND object_id = %s",
+            [[name, body, kind, object_id] for kind, object_id, name, body in documents],
+        )
+    else:
+        if replace:
+            cursor.executemany(f"DELETE FROM {SEARCH_TABLE} WHERE kind = %s AND object_id = %s", keys)
+        cursor.executemany(
+            f"""INSERT INTO {SEARCH_TABLE} (kind, object_id, name, body, document)
+            VALUES (%s, %s, %s, %s,
+                    setweight(to_tsvector('simple', %s), 'A') || setweight(to_tsvector('simple', %s), 'B'))""",
+            [[kind, object_id, name, body, name, body] for kind, object_id, name, body in documents],
+        )
+
+
+def index_documents(documents, conn=None):
+    conn = conn or connection
+    if not is_supported(conn):
+        return
+    with conn.cursor() as cursor:
+        _write(cursor, conn.vendor, documents)
+
+
+def index_event(event):
+    index_documents([event_document(event)])
+
+
+def index_venue(venue):
+    # Events carry their venue's name, so a rename has to refresh them too
+    documents = [venue_document(venue)]
+    documents += [event_document(event) for event in venue.event_set.select_related('venue')]
+    index_documents(documents)
+
+
+def remove(kind, object_id, conn=None):
+    conn = conn or connection
+    if not is_supported(conn):
+        return
+    with conn.cursor() as cursor:
+        if conn.vendor == 'sqlite':
+            cursor.execute(f"DELETE FROM {SEARCH_TABLE} WHERE rowid = ({SQLITE_ROWID})", [kind, object_id])
+            cursor.execute(f"DELETE FROM {SEARCH_KEYS_TABLE} WHERE kind = %s AND object_id = %s", [kind, object_id])
+        else:
+            cursor.execute(f"DELETE FROM {SEARCH_TABLE} WHERE kind = %s AND object_id = %s", [kind, object_id])
+
+
+def rebuild(event_model, venue_model, conn=None, batch_size=500):
+    # Drop everything and re-index from the source tables.
+    # Takes the model classes so migrations can pass their historical models.
+    conn = conn or connection
+    if not is_supported(conn):
+        return 0
+    with transaction.atomic(using=conn.alias):
+        # One transaction, rather than a commit per document
+        return _rebuild(event_model, venue_model, conn, batch_size)
+
+
+def _rebuild(event_model, venue_model, conn, batch_size):
+    drop_table(conn)
+    create_table(conn)
+    count = 0
+    documents = chain(
+        (venue_document(venue) for venue in venue_model.objects.using(conn.alias).order_by('pk').iterator(chunk_size=batch_size)),
+        (event_document(event) for event in
+         event_model.objects.using(conn.alias).select_related('venue').order_by('pk').iterator(chunk_size=batch_size)),
+    )
+    with conn.cursor() as cursor:
+        batch = []
+        for document in documents:
+            batch.append(document)
+            if len(batch) >= batch_size:
+                _write(cursor, conn.vendor, batch, replace=False)
+                count += len(batch)
+                batch = []
+        _write(cursor, conn.vendor, batch, replace=False)
+        count += len(batch)
+    return count
+
+
+def _terms(query):
+    return [term.lower() for term in TOKEN_RE.findall(query or '')]
+
+
+def search(query, kind=None, limit=50, conn=None):
+    # Returns [(kind, object_id), ...] best match first.
+    # Every term must match; the last one also matches as a prefix so
+    # "cher" finds "Cherating" while the user is still typing.
+    conn = conn or connection
+    terms = _terms(query)
+    if not terms or not is_supported(conn):
+        return []
+
+    params = []
+    if conn.vendor == 'sqlite':
+        match = ' '.join(f'"{term}"' for term in terms[:-1])
+        match = f'{match} "{terms[-1]}"*'.strip()
+        sql = (
+            f"SELECT kind, object_id FROM {SEARCH_TABLE} "
+            f"WHERE {SEARCH_TABLE} MATCH %s"
+        )
+        params.append(match)
+        if kind:
+            sql += " AND kind = %s"
+            params.append(kind)
+        sql += f" ORDER BY bm25({SEARCH_TABLE}, 0, 0, {NAME_WEIGHT}, {BODY_WEIGHT}) LIMIT %s"
+    else:
+        tsquery = ' & '.join(terms[:-1] + [f'{terms[-1]}:*'])
+        sql = (
+            f"SELECT kind, object_id FROM {SEARCH_TABLE} "
+            f"WHERE document @@ to_tsquery('simple', %s)"
+        )
+        params.append(tsquery)
+        if kind:
+            sql += " AND kind = %s"
+            params.append(kind)
+        sql += " ORDER BY ts_rank(document, to_tsquery('simple', %s)) DESC LIMIT %s"
+        params.append(tsquery)
+    params.append(limit)
+
+    with conn.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [(row[0], row[1]) for row in cursor.fetchall()]
+
+
+def ranked(queryset, ids):
+    # Fetch objects for ids and keep the order the index ranked them in
+    objects = queryset.in_bulk(ids)
+    return [objects[object_id] for object_id in ids if object_id in objects]
@@ -0,0 +1,64 @@
+import threading
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+
+from .models import Sequence
+
+EVENT_SEQUENCE = 'event'
+
+# Per-process cache of reserved ID blocks: {name: [next, end)}
+_blocks = {}
+_lock = threading.Lock()
+
+
+def reserve(name, count=1):
+    # Atomically move the counter forward by count and return the first
+    # number of the reserved range. The UPDATE takes the row lock (or the
+    # SQLite write lock), so concurrent workers can never get the same range.
+    with transaction.atomic():
+        updated = Sequence.objects.filter(name=name).update(value=F('value') + count)
+        if not updated:
+            Sequence.objects.get_or_create(name=name)
+            Sequence.objects.filter(name=name).update(value=F('value') + count)
+        end = Sequence.objects.values_list('value', flat=True).get(name=name)
+    return end - count + 1
+
+
+def allocate(name, count=1):
+    # Returns a range of count fresh numbers from the named sequence.
+    # Outside a transaction, single IDs are served from a per-process block
+    # of SEQUENCE_BLOCK_SIZE numbers, so most inserts skip the counter row.
+    # Inside a transaction a cached block could outlive a rollback, so we
+    # reserve exactly what is asked for.
+    block_size = getattr(settings, 'SEQUENCE_BLOCK_SIZE', 1)
+    if count > 1 or block_size <= 1 or connection.in_atomic_block:
+        start = reserve(name, count)
+        return range(start, start + count)
+
+    with _lock:
+        block = _blocks.get(name)
+        if not block or block[0] >= block[1]:
+            start = reserve(name, block_size)
+            block = _blocks[name] = [start, start + block_size]
+        number = block[0]
+        block[0] += 1
+    return range(number, number + 1)
+
+
+def format_event_id(number):
+    return f'E{number}'
+
+
+def next_event_id():
+    return format_event_id(allocate(EVENT_SEQUENCE)[0])
+
+
+def event_ids(count):
+    return [format_event_id(number) for number in allocate(EVENT_SEQUENCE, count)]
+
+
+def reset_cache():
+    with _lock:
+        _blocks.clear()
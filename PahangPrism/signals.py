@@ -0,0 +1,56 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import catalogue_cache, identity, images, tasks
+from .models import Event, User, Venue
+
+
+# Keep the search index in step with the catalogue. Indexing runs in the
+# task queue: a venue rename reindexes all its events, and on FTS5 every
+# document update scans the index.
+INDEXED_FIELDS = {Event: {'name', 'venue'}, Venue: {'name', 'location'}}
+
+
+def _changes_index(sender, update_fields):
+    # Saves of other fields only (image variants, say) leave the documents alone
+    return update_fields is None or bool(INDEXED_FIELDS[sender] & set(update_fields))
+
+
+@receiver(post_save, sender=Event)
+@receiver(post_delete, sender=Event)
+def index_event(sender, instance, update_fields=None, **kwargs):
+    if _changes_index(sender, update_fields):
+        tasks.reindex.enqueue(kind='event', object_id=instance.eventID)
+
+
+@receiver(post_save, sender=Venue)
+@receiver(post_delete, sender=Venue)
+def index_venue(sender, instance, update_fields=None, **kwargs):
+    # A deleted venue's events are removed by their own post_delete via CASCADE
+    if _changes_index(sender, update_fields):
+        tasks.reindex.enqueue(kind='venue', object_id=instance.venueID)
+
+
+# Image files of deleted events and venues
+@receiver(post_delete, sender=Event)
+@receiver(post_delete, sender=Venue)
+def delete_image_files(sender, instance, **kwargs):
+    paths = images.files(instance)
+    if paths:
+        tasks.delete_files.enqueue(paths=sorted(paths))
+
+
+# Any catalogue change invalidates the cached public pages
+@receiver(post_save, sender=Event)
+@receiver(post_delete, sender=Event)
+@receiver(post_save, sender=Venue)
+@receiver(post_delete, sender=Venue)
+def bump_catalogue_version(sender, **kwargs):
+    catalogue_cache.bump_version()
+
+
+# Drop the cached copy of a user when their row changes
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_identity(sender, instance, **kwargs):
+    identity.invalidate(instance.userID)
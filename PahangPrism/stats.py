@@ -0,0 +1,176 @@
+import time
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from . import catalogue_cache
+from .models import Booking, DailyActivity, Event, StarredItem, Venue
+
+# Popularity counters and trending scores.
+# Event.booked (seats, kept by PahangPrism.booking) and the star_count
+# columns on events and venues are updated in the same transaction as the
+# booking or star that changes them, so ranking never aggregates the
+# Booking and StarredItem tables. Each change is also added to that day's
+# DailyActivity row; refresh_trending() (a periodic task, see tasks.py)
+# turns the recent days into a score that halves every
+# TRENDING_HALF_LIFE_DAYS and stores it in the indexed `trending` columns
+# the home page reads. reconcile() repairs counters that drifted, e.g.
+# through rows changed outside these paths. Once a change commits, the
+# catalogue cache's counters version is bumped so cached pages showing
+# the counters are rebuilt.
+
+BOOKING_WEIGHT = 3.0
+STAR_WEIGHT = 1.0
+
+# Days further back than this many half-lives add under 7% and are dropped
+TRENDING_WINDOW_HALF_LIVES = 4
+
+TOP_LIMIT = 6
+
+REFRESHED_KEY = 'pahangprism:trending-refreshed-at'
+
+MODELS = {'event': Event, 'venue': Venue}
+
+
+def record(kind, object_id, bookings=0, stars=0):
+    # Add to today's activity for one event or venue
+    today = timezone.localdate()
+    row = DailyActivity.objects.filter(kind=kind, object_id=object_id, day=today)
+    changes = {'bookings': F('bookings') + bookings, 'stars': F('stars') + stars}
+    if row.update(**changes):
+        return
+    try:
+        with transaction.atomic():
+            DailyActivity.objects.create(kind=kind, object_id=object_id, day=today, bookings=bookings, stars=stars)
+    except IntegrityError:
+        row.update(**changes)  # Created by a concurrent request
+
+
+def count_star(kind, object_id, delta):
+    # Call in the transaction that creates (delta=1) or deletes (delta=-1) the StarredItem
+    rows = MODELS[kind].objects.filter(pk=object_id)
+    if delta < 0:
+        rows = rows.filter(star_count__gte=-delta)
+    rows.update(star_count=F('star_count') + delta)
+    record(kind, object_id, stars=delta)
+    transaction.on_commit(catalogue_cache.bump_counters)
+
+
+def uncount_stars(user_id):
+    # Call in the transaction that deletes the user, whose stars go with it
+    for event_id, venue_id in StarredItem.objects.filter(userID_id=user_id).values_list('event_id', 'venue_id'):
+        count_star('event' if event_id else 'venue', event_id or venue_id, -1)
+
+
+def count_booking(event_id, delta):
+    # Event.booked itself is kept by the booking engine, which calls this
+    record('event', event_id, bookings=delta)
+    transaction.on_commit(catalogue_cache.bump_counters)
+
+
+def _decay(age_days, half_life):
+    return 0.5 ** (age_days / half_life)
+
+
+def scores(today=None):
+    # {'event': {eventID: score}, 'venue': {venueID: score}} from the activity
+    # window; a venue's score includes the activity of its events
+    today = today or timezone.localdate()
+    half_life = settings.TRENDING_HALF_LIFE_DAYS
+    totals = {'event': defaultdict(float), 'venue': defaultdict(float)}
+    activity = (DailyActivity.objects.filter(day__gte=today - timedelta(days=TRENDING_WINDOW_HALF_LIVES * half_life))
+                .values_list('kind', 'object_id', 'day', 'bookings', 'stars'))
+    for kind, object_id, day, bookings, stars in activity.iterator():
+        weight = (bookings * BOOKING_WEIGHT + stars * STAR_WEIGHT) * _decay((today - day).days, half_life)
+        totals[kind][object_id] += weight
+
+    event_ids = list(totals['event'])
+    for start in range(0, len(event_ids), 500):
+        for event_id, venue_id in Event.objects.filter(pk__in=event_ids[start:start + 500]).values_list('pk', 'venue_id'):
+            totals['venue'][venue_id] += totals['event'][event_id]
+    # Cancellations can outweigh what is left of the bookings they undo
+    return {kind: {object_id: score for object_id, score in by_id.items() if score > 0}
+            for kind, by_id in totals.items()}
+
+
+def refresh_trending(today=None):
+    # Recompute every trending score and drop activity older than the window.
+    # Returns the number of events and venues that now have a score.
+    today = today or timezone.localdate()
+    cutoff = today - timedelta(days=TRENDING_WINDOW_HALF_LIVES * settings.TRENDING_HALF_LIFE_DAYS)
+    with transaction.atomic():
+        DailyActivity.objects.filter(day__lt=cutoff).delete()
+        new_scores = scores(today)
+        for kind, model in MODELS.items():
+            # Only rows that had or get a score are written; the index finds the old ones.
+            # One prepared UPDATE per row: bulk_update's CASE grows with the batch.
+            model.objects.filter(trending__gt=0).update(trending=0)
+            table, pk = connection.ops.quote_name(model._meta.db_table), connection.ops.quote_name(model._meta.pk.column)
+            with connection.cursor() as cursor:
+                cursor.executemany(f'UPDATE {table} SET trending = %s WHERE {pk} = %s',
+                                   [(score, object_id) for object_id, score in new_scores[kind].items()])
+    cache.set(REFRESHED_KEY, time.time(), None)
+    return sum(len(by_id) for by_id in new_scores.values())
+
+
+def refreshed_at():
+    refreshed = cache.get(REFRESHED_KEY)
+    if refreshed is None:
+        cache.add(REFRESHED_KEY, time.time(), None)
+        refreshed = cache.get(REFRESHED_KEY)
+    return refreshed
+
+
+def trending_events(limit=TOP_LIMIT):
+    # Upcoming events by score, walking event_trending_idx from the top;
+    # cached until the next refresh or catalogue change
+    def build():
+        return list(Event.objects.select_related('venue')
+                    .filter(trending__gt=0, date__gte=timezone.localdate())
+                    .order_by('-trending', 'eventID')[:limit])
+
+    return catalogue_cache.cached('trending_events', build, refreshed_at(), limit)
+
+
+def trending_venues(limit=TOP_LIMIT):
+    def build():
+        return list(Venue.objects.filter(trending__gt=0).order_by('-trending', 'venueID')[:limit])
+
+    return catalogue_cache.cached('trending_venues', build, refreshed_at(), limit)
+
+
+def _count(source, field):
+    # Correlated count of source rows pointing at the outer row
+    rows = (source.objects.filter(**{field: OuterRef('pk')}).order_by()
+            .values(field).annotate(count=Count('pk')).values('count'))
+    return Coalesce(Subquery(rows), 0)
+
+
+# (model, counter column, source table, source foreign key)
+COUNTERS = [
+    (Event, 'booked', Booking, 'event'),
+    (Event, 'star_count', StarredItem, 'event'),
+    (Venue, 'star_count', StarredItem, 'venue'),
+]
+
+
+def reconcile(events=None, venues=None, dry_run=False):
+    # Set every counter to the count in its source table. Returns
+    # {'<model>.<column>': number of rows that were wrong}.
+    querysets = {Event: events if events is not None else Event.objects.all(),
+                 Venue: venues if venues is not None else Venue.objects.all()}
+    drift = {}
+    with transaction.atomic():
+        for model, column, source, field in COUNTERS:
+            actual = _count(source, field)
+            wrong = querysets[model].annotate(actual=actual).exclude(**{column: F('actual')})
+            drift[f'{model._meta.model_name}.{column}'] = count = wrong.count()
+            if count and not dry_run:
+                model.objects.filter(pk__in=wrong.values('pk')).update(**{column: actual})
+    return drift
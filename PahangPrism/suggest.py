@@ -0,0 +1,167 @@
+import heapq
+import re
+import threading
+import time
+import unicodedata
+from bisect import bisect_left, bisect_right
+
+from django.conf import settings
+from django.utils import timezone
+
+from . import catalogue_cache
+from .db_routing import primary
+from .models import Event, Venue
+
+# Typeahead for the search box.
+# Each process keeps a prefix index of upcoming event names, venue names and
+# venue locations in memory: a sorted array of keys searched with bisect,
+# where every word of a name starts a key, so "fest" finds "Kite Festival".
+# Suggestions are ranked by popularity (bookings, stars and the trending
+# score kept by stats.py). The index is built on first use and rebuilt when
+# the catalogue version or the date changes (yesterday's events are no longer
+# upcoming), at most every SUGGEST_REBUILD_SECONDS, while other requests go on
+# reading the old one. SUGGEST_MAX_TERMS bounds its
+# size by dropping the least popular names.
+
+MAX_LIMIT = 20
+DEFAULT_LIMIT = 8
+# Prefixes matching more keys than this get their top MAX_LIMIT suggestions
+# worked out when the index is built, so no lookup ranks more than this many
+SCAN_LIMIT = 500
+TRENDING_WEIGHT = 1.0
+
+_NON_WORD = re.compile(r'[^\w]+')
+
+_index = None
+_lock = threading.Lock()
+
+
+def normalize(text):
+    # Lower case, accents removed, runs of punctuation and space as one space
+    text = text.casefold()
+    if not text.isascii():
+        text = ''.join(char for char in unicodedata.normalize('NFKD', text) if not unicodedata.combining(char))
+    return _NON_WORD.sub(' ', text).strip()
+
+
+def _keys(text):
+    # The normalized text from each word on: 'kite festival', 'festival'
+    words = normalize(text).split()
+    return {' '.join(words[start:]) for start in range(len(words))}
+
+
+class PrefixIndex:
+    def __init__(self, terms, version=None, scan_limit=SCAN_LIMIT):
+        # terms: [(score, text, kind, object_id)], one per suggestion. Kept
+        # most popular first, so ranking a range is taking its lowest positions.
+        self.version = version
+        self.built_at = time.monotonic()
+        self.terms = sorted(terms, key=lambda term: -term[0])
+        pairs = sorted((key, position) for position, term in enumerate(self.terms) for key in _keys(term[1]))
+        self.keys = [key for key, _ in pairs]
+        self.positions = [position for _, position in pairs]
+        self.top = {}
+        self._precompute(scan_limit)
+
+    def __len__(self):
+        return len(self.terms)
+
+    def _range(self, prefix, start=0):
+        low = bisect_left(self.keys, prefix, start)
+        return low, bisect_left(self.keys, prefix + '\uffff', low)
+
+    def _best(self, low, high, limit):
+        positions = set(self.positions[low:high])  # A name can match on two of its words
+        return heapq.nsmallest(limit, positions)
+
+    def _precompute(self, scan_limit):
+        # Split crowded ranges by one more character until every range is small enough
+        crowded = [(0, len(self.keys), 1)]
+        while crowded:
+            low, end, length = crowded.pop()
+            while low < end:
+                prefix = self.keys[low][:length]
+                if len(prefix) < length:
+                    low = bisect_right(self.keys, prefix, low, end)  # Only the key itself; longer ones come next
+                    continue
+                high = bisect_left(self.keys, prefix + '\uffff', low, end)
+                if high - low > scan_limit:
+                    self.top[prefix] = self._best(low, high, MAX_LIMIT)
+                    crowded.append((low, high, length + 1))
+                low = high
+
+    def suggest(self, query, limit=DEFAULT_LIMIT):
+        prefix = normalize(query)
+        if not prefix:
+            return []
+        positions = self.top.get(prefix)
+        if positions is None:
+            positions = self._best(*self._range(prefix), limit)
+        return [self.terms[position] for position in positions[:limit]]
+
+
+def _terms():
+    # The most popular SUGGEST_MAX_TERMS names, with repeats of an event name merged
+    events = {}
+    upcoming = (Event.objects.filter(date__gte=timezone.localdate())
+                .values_list('eventID', 'name', 'booked', 'star_count', 'trending'))
+    for event_id, name, booked, star_count, trending in upcoming.iterator(chunk_size=2000):
+        score = 1 + booked + star_count + TRENDING_WEIGHT * trending
+        key = normalize(name)
+        best = events.get(key)
+        if best is None:
+            events[key] = [score, name, 'event', event_id, score]
+        else:
+            best[0] += score
+            if score > best[4]:
+                best[3], best[4] = event_id, score  # The most popular of them is the one linked
+    terms = [(score, name, kind, object_id) for score, name, kind, object_id, _ in events.values()]
+
+    locations = {}
+    for venue_id, name, location, star_count, trending in (
+            Venue.objects.values_list('venueID', 'name', 'location', 'star_count', 'trending')
+            .iterator(chunk_size=2000)):
+        score = 1 + star_count + TRENDING_WEIGHT * trending
+        terms.append((score, name, 'venue', venue_id))
+        key = normalize(location)
+        if key:
+            entry = locations.setdefault(key, [0, location])
+            entry[0] += score
+    terms += [(score, location, 'location', None) for score, location in locations.values()]
+    return heapq.nlargest(settings.SUGGEST_MAX_TERMS, terms, key=lambda term: term[0])
+
+
+def build(version=None):
+    with primary():  # A lagging replica would be cached as this version
+        return PrefixIndex(_terms(), version)
+
+
+def get_index():
+    # This process's index, rebuilt first if the catalogue or the date changed
+    # and the current one is old enough
+    global _index
+    version = (catalogue_cache.get_version(), timezone.localdate())
+    index = _index
+    if index is not None and (index.version == version
+                              or time.monotonic() - index.built_at < settings.SUGGEST_REBUILD_SECONDS):
+        return index
+    # One thread rebuilds; the others keep using the old index, if there is one
+    if not _lock.acquire(blocking=index is None):
+        return index
+    try:
+        if _index is None or _index.version != version:
+            _index = build(version)
+        return _index
+    finally:
+        _lock.release()
+
+
+def suggest(query, limit=DEFAULT_LIMIT):
+    # [{'text', 'kind', 'id'}] for names and places starting with query, most popular first
+    return [{'text': text, 'kind': kind, 'id': object_id}
+            for _, text, kind, object_id in get_index().suggest(query, limit)]
+
+
+def reset():
+    global _index
+    _index = None
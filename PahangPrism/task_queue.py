@@ -0,0 +1,165 @@
+import logging
+import os
+import random
+import socket
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Count, F, Q
+from django.utils import timezone
+
+from .models import Task
+
+# A small task queue kept in the database, so no broker is needed.
+# enqueue() inserts a Task row in the caller's transaction: the task
+# exists only if that transaction commits, and a worker can never see it
+# before the rows it refers to. `manage.py run_tasks` claims due tasks,
+# runs them and deletes them; a failure is retried with exponential
+# backoff until max_attempts, then kept with status 'failed' and its
+# traceback. A task whose worker died is claimed again once its lease
+# (TASKS_LEASE_SECONDS) runs out, so tasks must be safe to run twice.
+#
+# Task functions are registered with @task (see tasks.py) and take only
+# JSON-serialisable keyword arguments. @task(every=seconds) makes a
+# periodic task: schedule_periodic() queues it when the worker starts, and
+# after each run, successful or not, it is queued again `every` seconds on.
+# A periodic task keeps a single row (unique_periodic_task), so workers
+# starting together can't queue it twice.
+#
+# Only the claim that took a task may finish it: every status change
+# checks locked_by and locked_at, so a worker whose lease ran out can't
+# delete or fail a task that has been claimed again since.
+
+logger = logging.getLogger('PahangPrism.tasks')
+
+REGISTRY = {}
+
+_worker_id = f'{socket.gethostname()}:{os.getpid()}'
+
+
+def task(func=None, *, max_attempts=None, every=None):
+    # Register func under its name; func.enqueue(**kwargs) queues a call
+    def register(func):
+        if func.__name__ in REGISTRY:
+            raise ValueError(f'Duplicate task name {func.__name__!r}')
+        REGISTRY[func.__name__] = func
+        func.max_attempts = max_attempts
+        func.every = every
+        func.enqueue = lambda **kwargs: enqueue(func.__name__, **kwargs)
+        return func
+
+    return register(func) if func else register
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def enqueue(name, **kwargs):
+    if name not in REGISTRY:
+        raise KeyError(f'Unknown task {name!r}')
+    if _setting('TASKS_EAGER', False):
+        # No worker (development): run in this process once the data is committed
+        transaction.on_commit(lambda: REGISTRY[name](**kwargs))
+        return None
+    return Task.objects.create(name=name, kwargs=kwargs, max_attempts=_max_attempts(name))
+
+
+def _max_attempts(name):
+    return REGISTRY[name].max_attempts or _setting('TASKS_MAX_ATTEMPTS', 5)
+
+
+def schedule_periodic():
+    # Queue each periodic task that has no row yet, to run now
+    for name, func in REGISTRY.items():
+        if not func.every or Task.objects.filter(name=name, periodic=True).exists():
+            continue
+        try:
+            with transaction.atomic():
+                Task.objects.create(name=name, max_attempts=_max_attempts(name), periodic=True)
+        except IntegrityError:
+            pass  # Queued by another worker starting at the same time
+
+
+def _claimed(task_row):
+    # task_row, if the claim it was returned by still holds it
+    return Task.objects.filter(pk=task_row.pk, locked_by=task_row.locked_by, locked_at=task_row.locked_at)
+
+
+def _reschedule(task_row, **changes):
+    # Queue a periodic task's next run, keeping its row
+    _claimed(task_row).update(
+        status=Task.QUEUED, attempts=0, locked_at=None,
+        run_at=timezone.now() + timedelta(seconds=REGISTRY[task_row.name].every), **changes)
+
+
+def backoff(attempts):
+    # Seconds before retry number `attempts`: base * 2^(n-1), capped, with jitter
+    delay = min(_setting('TASKS_BACKOFF_SECONDS', 5) * 2 ** (attempts - 1), _setting('TASKS_BACKOFF_MAX', 3600))
+    return delay * random.uniform(0.8, 1.2)
+
+
+def claim(limit=10):
+    # Mark up to limit due tasks as running for this worker and return them
+    now = timezone.now()
+    lease_expired = now - timedelta(seconds=_setting('TASKS_LEASE_SECONDS', 600))
+    due = Q(status=Task.QUEUED, run_at__lte=now) | Q(status=Task.RUNNING, locked_at__lt=lease_expired)
+    with transaction.atomic():
+        # On SQLite the IMMEDIATE transaction already holds the write lock;
+        # on Postgres concurrent workers skip each other's rows
+        candidates = Task.objects.filter(due).order_by('run_at', 'pk')
+        if connection.features.has_select_for_update_skip_locked:
+            candidates = candidates.select_for_update(skip_locked=True)
+        ids = list(candidates.values_list('pk', flat=True)[:limit])
+        Task.objects.filter(pk__in=ids).update(
+            status=Task.RUNNING, locked_at=now, locked_by=_worker_id, attempts=F('attempts') + 1)
+    return list(Task.objects.filter(pk__in=ids).order_by('run_at', 'pk'))
+
+
+def execute(task_row):
+    func = REGISTRY.get(task_row.name)
+    try:
+        if func is None:
+            raise KeyError(f'Unknown task {task_row.name!r}')
+        func(**task_row.kwargs)
+    except Exception:
+        error = traceback.format_exc()
+        if task_row.attempts < task_row.max_attempts:
+            delay = backoff(task_row.attempts)
+            logger.warning('Task %s %s failed (attempt %d/%d), retrying in %.0fs\n%s', task_row.pk, task_row.name,
+                           task_row.attempts, task_row.max_attempts, delay, error)
+            _claimed(task_row).update(
+                status=Task.QUEUED, run_at=timezone.now() + timedelta(seconds=delay), locked_at=None, last_error=error)
+        else:
+            logger.error('Task %s %s failed for good after %d attempts\n%s', task_row.pk, task_row.name,
+                         task_row.attempts, error)
+            if func is not None and func.every:
+                _reschedule(task_row, last_error=error)
+            else:
+                _claimed(task_row).update(status=Task.FAILED, locked_at=None, last_error=error)
+        return False
+    if func.every:
+        _reschedule(task_row, last_error='')
+    else:
+        _claimed(task_row).delete()
+    return True
+
+
+def run_pending(batch_size=10, limit=None):
+    # Run due tasks until none are left (or limit have run); returns how many ran
+    ran = 0
+    while limit is None or ran < limit:
+        claimed = claim(batch_size if limit is None else min(batch_size, limit - ran))
+        if not claimed:
+            break
+        for task_row in claimed:
+            execute(task_row)
+            ran += 1
+    return ran
+
+
+def counts():
+    # {status: number of tasks}, for the admin dashboard
+    return dict(Task.objects.order_by().values_list('status').annotate(count=Count('pk')))
@@ -0,0 +1,57 @@
+from django.conf import settings
+from django.core.files.storage import default_storage
+
+from . import booking as booking_engine
+from . import catalogue_cache, images, search_index, stats, user_state
+from .models import Event, Venue
+from .task_queue import task
+
+# Side effects that used to run inside requests, now run by
+# `manage.py run_tasks` (see task_queue.py). Each must be safe to repeat.
+
+CATALOGUE_MODELS = {'event': Event, 'venue': Venue}
+
+
+@task
+def reindex(kind, object_id):
+    # Bring the search index in line with the row, whatever happened to it
+    obj = CATALOGUE_MODELS[kind].objects.filter(pk=object_id).first()
+    if obj is None:
+        search_index.remove(kind, object_id)
+    elif kind == 'event':
+        search_index.index_event(obj)
+    else:
+        search_index.index_venue(obj)
+    # Searches cached since the change may have missed it
+    catalogue_cache.bump_version()
+
+
+@task
+def process_image(kind, object_id, path, old_files):
+    # Build the variants of an uploaded original, then delete the files of
+    # the image it replaced
+    obj = CATALOGUE_MODELS[kind].objects.filter(pk=object_id).first()
+    if obj is None or obj.image != path:
+        return  # Deleted or replaced again since; that change has its own task
+    obj.image_variants = images.process(images.read_source(path), images.prefix_for(obj))
+    obj.save(update_fields=['image_variants'])
+    images.delete_unused(set(old_files), obj)
+
+
+@task
+def delete_files(paths):
+    for path in paths:
+        if path.startswith(f'{images.IMAGE_ROOT}/') and default_storage.exists(path):
+            default_storage.delete(path)
+
+
+@task
+def fill_waitlist(event_id):
+    # Book waitlisted users into seats added by a capacity change
+    for user_id in booking_engine.fill_from_waitlist(event_id):
+        user_state.invalidate(user_id)
+
+
+@task(every=settings.TRENDING_REFRESH_SECONDS)
+def refresh_trending():
+    stats.refresh_trending()
@@ -0,0 +1,12 @@
+from django import template
+from django.templatetags.static import static
+from django.utils.html import format_html
+
+from PahangPrism.assets import bundle_path
+
+register = template.Library()
+
+
+@register.simple_tag
+def css_bundle(name):
+    return format_html('<link rel="stylesheet" href="{}">', static(bundle_path(name)))
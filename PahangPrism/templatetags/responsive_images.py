@@ -0,0 +1,44 @@
+from django import template
+from django.core.files.storage import default_storage
+from django.utils.html import format_html, format_html_join
+
+from PahangPrism.images import FORMATS, MIME_TYPES
+
+register = template.Library()
+
+
+def _srcset(variants, fmt):
+    # One candidate per distinct width; small originals give fewer widths
+    seen = {}
+    for entry in sorted(variants.values(), key=lambda entry: entry['width']):
+        if entry.get(fmt):
+            seen.setdefault(entry['width'], entry[fmt])
+    return ', '.join(f'{default_storage.url(path)} {width}w' for width, path in seen.items())
+
+
+@register.simple_tag
+def responsive_image(obj, variant='card', sizes='100vw', alt='', css_class='', loading='lazy'):
+    # <picture> with AVIF/WebP sources and a JPEG fallback, or an empty
+    # placeholder box when the object has no processed image yet
+    variants = getattr(obj, 'image_variants', None) or {}
+    if variant not in variants:
+        return format_html('<div class="{} image-placeholder" role="img" aria-label="{}"></div>', css_class, alt)
+
+    default = variants[variant]
+    sources = format_html_join(
+        '', '<source type="{}" srcset="{}" sizes="{}">',
+        ((MIME_TYPES[fmt], _srcset(variants, fmt), sizes) for fmt in FORMATS[:-1] if default.get(fmt)),
+    )
+    return format_html(
+        '<picture>{}<img src="{}" srcset="{}" sizes="{}" width="{}" height="{}" alt="{}" class="{}" '
+        'loading="{}" decoding="async"></picture>',
+        sources,
+        default_storage.url(default['jpeg']),
+        _srcset(variants, 'jpeg'),
+        sizes,
+        default['width'],
+        default['height'],
+        alt,
+        css_class,
+        loading,
+    )
@@ -1,3 +1,1358 @@
-from django.test import TestCase
+import io
+import json
+import os
+import shutil
+import tempfile
+from importlib import import_module
+from unittest import skipUnless
+from datetime import date, timedelta
 
-# Create your tests here.
+from django.contrib.staticfiles import finders
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.contrib.messages.storage import default_storage
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.template import Context, Template
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import async_views
+from . import booking as booking_engine
+from . import (assets, catalogue_cache, credentials, db_routing, event_listing, feeds, geo, identity, images,
+               instrumentation, pagination, search_index, sequences, stats, suggest, task_queue, user_state)
+from .catalogue_import import CatalogueImporter
+from .models import Booking, DailyActivity, Event, StarredItem, Task, User, Venue, WaitlistEntry
+
+
+class SearchIndexTests(TestCase):
+    def setUp(self):
+        self.beach = Venue.objects.create(venueID='V1', name='Teluk Cempedak', location='Kuantan')
+        self.park = Venue.objects.create(venueID='V2', name='Taman Negara', location='Jerantut')
+        self.festival = Event.objects.create(name='Kuantan Beach Festival', date=date(2030, 5, 1), venue=self.beach)
+        self.trek = Event.objects.create(name='Canopy Walk', date=date(2030, 6, 1), venue=self.park)
+        task_queue.run_pending()
+
+    def test_prefix_match(self):
+        self.assertIn(('event', self.festival.eventID), search_index.search('festi'))
+        self.assertIn(('venue', 'V2'), search_index.search('neg'))
+
+    def test_name_ranks_above_body(self):
+        hits = search_index.search('kuantan')
+        self.assertLess(hits.index(('event', self.festival.eventID)), hits.index(('venue', 'V1')))
+
+    def test_venue_rename_reindexes_events(self):
+        self.park.name = 'Rainforest Park'
+        self.park.save()
+        task_queue.run_pending()
+        self.assertIn(('event', self.trek.eventID), search_index.search('rainforest'))
+
+    def test_delete_removes_from_index(self):
+        self.beach.delete()
+        task_queue.run_pending()
+        self.assertEqual(search_index.search('kuantan'), [])
+
+    def test_reindex_replaces_document(self):
+        self.trek.name = 'Night Safari'
+        search_index.index_event(self.trek)
+        self.assertEqual(search_index.search('canopy'), [])
+        self.assertEqual(search_index.search('safari'), [('event', self.trek.eventID)])
+        search_index.remove('event', self.trek.eventID)
+        self.assertEqual(search_index.search('safari'), [])
+
+    @skipUnless(connection.vendor == 'sqlite', 'SQLite only')
+    def test_replacing_finds_document_by_rowid(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN DELETE FROM {search_index.SEARCH_TABLE} '
+                           f'WHERE rowid = ({search_index.SQLITE_ROWID})', ['event', self.trek.eventID])
+            plan = ' '.join(str(row) for row in cursor.fetchall())
+        self.assertIn('INDEX 0:=', plan)  # FTS5's rowid lookup, not a full scan
+
+    def test_search_view(self):
+        response = self.client.get(reverse('search'), {'q': 'canopy'})
+        self.assertEqual(list(response.context['events']), [self.trek])
+
+
+class SuggestTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        suggest.reset()
+        self.beach = Venue.objects.create(venueID='V1', name='Teluk Cempedak', location='Kuantan')
+        self.park = Venue.objects.create(venueID='V2', name='Taman Negara', location='Jerantut', star_count=5)
+        self.kites = Event.objects.create(name='Kite Festival', date=date(2030, 5, 1), venue=self.beach)
+        Event.objects.create(name='Kite Festival', date=date(2030, 5, 2), venue=self.beach, booked=4)
+        Event.objects.create(name='Kuantan Food Festival', date=date(2030, 5, 3), venue=self.beach)
+        Event.objects.create(name='Past Festival', date=date(2020, 5, 3), venue=self.beach)
+
+    def test_word_prefixes_ranked_by_popularity(self):
+        suggestions = suggest.suggest('FEST')
+        self.assertEqual([row['text'] for row in suggestions], ['Kite Festival', 'Kuantan Food Festival'])
+        # Repeats of a name are one suggestion, pointing at its most popular event
+        self.assertEqual(suggestions[0]['id'], Event.objects.get(booked=4).eventID)
+        self.assertEqual([(row['text'], row['kind']) for row in suggest.suggest('ku')],
+                         [('Kuantan Food Festival', 'event'), ('Kuantan', 'location')])
+        self.assertEqual([row['id'] for row in suggest.suggest('taman n')], ['V2'])
+        self.assertEqual(suggest.suggest('  '), [])
+
+    def test_accents_and_case(self):
+        Venue.objects.create(venueID='V3', name='Café Jetty', location='Pekan')
+        suggest.reset()
+        self.assertEqual([row['id'] for row in suggest.suggest('cafe')], ['V3'])
+        self.assertEqual([row['id'] for row in suggest.suggest('CAFÉ J')], ['V3'])
+
+    def test_rebuilt_when_catalogue_changes(self):
+        self.assertEqual(suggest.suggest('lantern'), [])
+        Event.objects.create(name='Lantern Parade', date=date(2030, 5, 4), venue=self.park)
+        with override_settings(SUGGEST_REBUILD_SECONDS=60):
+            self.assertEqual(suggest.suggest('lantern'), [])  # Too soon after the last build
+        with override_settings(SUGGEST_REBUILD_SECONDS=0):
+            self.assertEqual([row['text'] for row in suggest.suggest('lantern')], ['Lantern Parade'])
+
+    def test_rebuilt_when_date_changes(self):
+        # An index built yesterday still holds yesterday's events
+        catalogue_version, today = suggest.get_index().version
+        with override_settings(SUGGEST_REBUILD_SECONDS=0):
+            suggest._index = suggest.PrefixIndex([(1, 'Past Festival', 'event', 'E0')], (catalogue_version, today))
+            self.assertEqual([row['text'] for row in suggest.suggest('past')], ['Past Festival'])
+            suggest._index.version = (catalogue_version, today - timedelta(days=1))
+            self.assertEqual([row['text'] for row in suggest.suggest('past')], [])
+
+    @override_settings(SUGGEST_MAX_TERMS=2)
+    def test_least_popular_names_dropped(self):
+        self.assertEqual(len(suggest.get_index()), 2)
+        self.assertEqual([row['text'] for row in suggest.suggest('t')], ['Taman Negara'])
+
+    def test_precomputed_prefixes_match_scans(self):
+        terms = [(i % 7, f'{word} {i}', 'event', f'E{i}')
+                 for i, word in enumerate(['beach run', 'beach fair', 'bay tour', 'night market'] * 30)]
+        scanned = suggest.PrefixIndex(terms, scan_limit=len(terms) * 10)
+        precomputed = suggest.PrefixIndex(terms, scan_limit=5)
+        self.assertIn('beach', precomputed.top)
+        self.assertEqual(scanned.top, {})
+        for query in ['b', 'be', 'beach', 'beach f', 'n', 'run', '1', '12', 'x']:
+            self.assertEqual(precomputed.suggest(query, 5), scanned.suggest(query, 5), query)
+
+    def test_view(self):
+        response = self.client.get(reverse('search_suggest'), {'q': 'neg', 'limit': 100})
+        self.assertEqual(response.json(), {'query': 'neg', 'suggestions': [
+            {'text': 'Taman Negara', 'kind': 'venue', 'id': 'V2'}]})
+        self.assertIn('max-age=60', response['Cache-Control'])
+        with self.assertNumQueries(0):
+            self.client.get(reverse('search_suggest'), {'q': 'kite'})
+
+
+class EventIdSequenceTests(TestCase):
+    def setUp(self):
+        self.venue = Venue.objects.create(venueID='V1', name='Teluk Cempedak', location='Kuantan')
+
+    def test_ids_are_numeric_past_nine(self):
+        events = [Event.objects.create(name=f'Event {i}', date=date(2030, 1, 1), venue=self.venue) for i in range(11)]
+        self.assertEqual(events[9].eventID, 'E10')
+        self.assertEqual(events[10].eventID, 'E11')
+
+    def test_block_allocation_does_not_overlap(self):
+        first = sequences.allocate(sequences.EVENT_SEQUENCE, 5)
+        second = sequences.allocate(sequences.EVENT_SEQUENCE, 5)
+        self.assertEqual(first.stop, second.start)
+        self.assertEqual(sequences.event_ids(2), [f'E{second.stop}', f'E{second.stop + 1}'])
+
+
+class CatalogueImportTests(TestCase):
+    def test_import_csv(self):
+        rows = io.StringIO(
+            'type,venueID,name,location,date,venue\n'
+            'venue,V1,Teluk Cempedak,Kuantan,,\n'
+            'event,,Beach Run,,2030-05-01,V1\n'
+            'event,,Night Market,,2030-05-02,V1\n'
+            'event,,Bad Date,,someday,V1\n'
+            'event,,Lost,,2030-05-03,V9\n'
+        )
+        result = CatalogueImporter(batch_size=2).run(rows, 'csv')
+        self.assertEqual((result.venues, result.events, result.error_count), (1, 2, 2))
+        self.assertEqual(sorted(Event.objects.values_list('eventID', flat=True)), ['E1', 'E2'])
+        self.assertIn(('event', 'E2'), search_index.search('market'))
+
+    def test_dry_run_writes_nothing(self):
+        rows = io.StringIO(
+            '{"type": "venue", "venueID": "V1", "name": "Teluk Cempedak", "location": "Kuantan"}\n'
+            '{"type": "event", "name": "Beach Run", "date": "2030-05-01", "venue": "V1"}\n'
+            'not json\n'
+        )
+        result = CatalogueImporter(dry_run=True).run(rows, 'jsonl')
+        self.assertEqual((result.venues, result.events, result.error_count), (1, 1, 1))
+        self.assertFalse(Venue.objects.exists())
+
+    def test_non_string_type(self):
+        rows = io.StringIO('{"type": 1, "venueID": "V1"}\n{"type": null, "venueID": "V2"}\n')
+        result = CatalogueImporter().run(rows, 'jsonl')
+        self.assertEqual(result.error_count, 2)
+        self.assertIn('unknown row type "1"', result.errors[0])
+
+    def test_upload_with_bom_or_wrong_encoding(self):
+        staff = User.objects.create(full_name='Staff', email='staff@example.com', password='x', is_staff=True)
+        session = self.client.session
+        session.update({'userID': staff.userID, 'is_staff': True})
+        session.save()
+        csv_text = 'type,venueID,name,location\nvenue,V1,Teluk Cempedak,Kuantan\nvenue,V2,Kafé,Pekan\n'
+        upload = SimpleUploadedFile('venues.csv', csv_text.encode('utf-8-sig'))
+        self.client.post(reverse('import_catalogue'), {'catalogue_file': upload})
+        self.assertEqual(sorted(Venue.objects.values_list('venueID', flat=True)), ['V1', 'V2'])
+
+        upload = SimpleUploadedFile('venues.csv', csv_text.replace('V', 'W').encode('latin-1'))
+        response = self.client.post(reverse('import_catalogue'), {'catalogue_file': upload}, follow=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(any('not UTF-8' in str(message) for message in response.context['messages']))
+
+    def test_bad_capacity_or_long_fields(self):
+        rows = io.StringIO(
+            'type,venueID,name,location,date,venue,capacity\n'
+            'venue,V1,Teluk Cempedak,Kuantan,,,\n'
+            f'venue,{"V" * 51},Too Long,Kuantan,,,\n'
+            f'venue,V2,{"N" * 256},Kuantan,,,\n'
+            'event,,Beach Run,,2030-05-01,V1,\u00b2\n'
+            f'event,,{"N" * 256},,2030-05-01,V1,\n'
+            'event,,Night Market,,2030-05-02,V1,0\n'
+        )
+        result = CatalogueImporter().run(rows, 'csv')
+        self.assertEqual((result.venues, result.events, result.error_count), (1, 1, 4))
+        self.assertIn('"venueID" is longer than 50 characters', result.errors[0])
+        self.assertIn('invalid capacity', result.errors[2])
+        self.assertEqual(list(Event.objects.values_list('name', 'capacity')), [('Night Market', 0)])
+
+    def test_venue_coordinates(self):
+        rows = io.StringIO(
+            'type,venueID,name,location,latitude,longitude\n'
+            'venue,V1,Teluk Cempedak,Kuantan,3.8126,103.3721\n'
+            'venue,V2,Bukit Tinggi,Bentong,,\n'
+            'venue,V3,Nowhere,Sea,95,103\n'
+        )
+        result = CatalogueImporter().run(rows, 'csv')
+        self.assertEqual((result.venues, result.error_count), (2, 1))
+        self.assertEqual(Venue.objects.get(pk='V1').geohash, geo.encode(3.8126, 103.3721))
+        self.assertEqual(Venue.objects.get(pk='V2').geohash, '')
+
+
+class AdminTableTests(TestCase):
+    def setUp(self):
+        staff = User.objects.create(full_name='Staff', email='staff@example.com', password='x', is_staff=True)
+        session = self.client.session
+        session['userID'] = staff.userID
+        session['is_staff'] = True
+        session.save()
+        venue = Venue.objects.create(venueID='V1', name='Teluk Cempedak', location='Kuantan')
+        event = Event.objects.create(name='Beach Run', date=date(2030, 5, 1), venue=venue)
+        for i in range(7):
+            user = User.objects.create(full_name=f'Guest {i}', email=f'guest{i}@example.com', password='x')
+            Booking.objects.create(user=user, event=event)
+
+    def test_keyset_pages_cover_table_once(self):
+        seen = []
+        cursor = ''
+        while True:
+            with self.assertNumQueries(1):  # page; the session comes from the cache
+                response = self.client.get(reverse('admin_table', args=['bookings']),
+                                           {'limit': 3, 'sort': 'user', 'dir': 'desc', 'cursor': cursor})
+            seen += [booking.bookingID for booking in response.context['rows']]
+            cursor = response.get('X-Next-Cursor')
+            if not cursor:
+                break
+        self.assertEqual(sorted(seen), sorted(Booking.objects.values_list('bookingID', flat=True)))
+        self.assertEqual(len(seen), 7)
+
+    def test_filter(self):
+        response = self.client.get(reverse('admin_table', args=['users']), {'q': 'guest3'})
+        self.assertEqual([user.full_name for user in response.context['rows']], ['Guest 3'])
+
+    def test_bad_cursor(self):
+        response = self.client.get(reverse('admin_table', args=['events']), {'cursor': 'nonsense'})
+        self.assertEqual(response.status_code, 400)
+
+
+class EventListingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.beach = Venue.objects.create(venueID='V1', name='Teluk Cempedak', location='Kuantan')
+        self.park = Venue.objects.create(venueID='V2', name='Taman Negara', location='Jerantut')
+        Event.objects.create(name='Last Year', date=date(2020, 1, 1), venue=self.beach)
+        for i in range(7):
+            Event.objects.create(name=f'Festival {i}', date=date(2030, 1, 1 + i % 3), venue=self.beach if i % 2 else self.park)
+
+    def test_upcoming_pages_cover_window_once(self):
+        seen = []
+        url = reverse('event_list') + '?limit=3'
+        while url:
+            response = self.client.get(url)
+            seen += [(event.date, event.eventID) for event in response.context['events']]
+            url = response.context['next_url']
+        self.assertEqual(len(seen), 7)
+        self.assertEqual(seen, sorted(seen))
+        self.assertNotContains(response, 'Last Year')
+
+    def test_filters(self):
+        response = self.client.get(reverse('event_list'), {'from': '2019-01-01', 'to': '2030-01-01', 'venue': 'V2'})
+        self.assertEqual({event.venue_id for event in response.context['events']}, {'V2'})
+        self.assertEqual({event.date for event in response.context['events']}, {date(2030, 1, 1)})
+        self.assertContains(self.client.get(reverse('event_list'), {'from': '2019-01-01'}), 'Last Year')
+
+    def test_json_variant(self):
+        page = self.client.get(reverse('event_list'), {'limit': 5, 'format': 'json'}).json()
+        self.assertEqual(len(page['events']), 5)
+        self.assertIn('Festival', page['html'])
+        self.assertNotIn('format=json', page['next'])
+        rest = self.client.get(page['next'] + '&format=json').json()
+        self.assertEqual(len(rest['events']), 2)
+        self.assertIsNone(rest['next'])
+
+    def test_bad_filter_or_cursor(self):
+        self.assertEqual(self.client.get(reverse('event_list'), {'from': 'soon'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('event_list'), {'cursor': 'nonsense'}).status_code, 400)
+        # Well-formed cursors whose values don't fit the ordering fields
+        for cursor in (pagination.encode_cursor(['not-a-date', 'E1']), pagination.encode_cursor([[1], 'E1'])):
+            self.assertEqual(self.client.get(reverse('event_list'), {'cursor': cursor}).status_code, 400)
+            self.assertEqual(self.client.get(reverse('api_events'), {'cursor': cursor}).status_code, 400)
+
+    @skipUnless(connection.vendor == 'sqlite', 'SQLite only')
+    def test_page_query_uses_index(self):
+        filters = event_listing.parse_filters({})
+        _, cursor = event_listing.get_page(filters, limit=2)
+        query = pagination._page_query(event_listing.queryset(filters), event_listing.ORDERING, cursor, 2, False)
+        sql, params = query.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            plan = ' '.join(str(row) for row in cursor.fetchall())
+        self.assertIn('event_date_id_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+
+class ApiTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.venue = Venue.objects.create(venueID='V1', name='Teluk Cempedak', location='Kuantan')
+        self.events = [Event.objects.create(name=f'Beach Festival {i}', date=date(2030, 5, 1 + i), venue=self.venue)
+                       for i in range(5)]
+        search_index.rebuild(Event, Venue)
+        self.user = User.objects.create(full_name='Guest', email='guest@example.com', password='x')
+
+    def login(self):
+        session = self.client.session
+        session['userID'] = self.user.userID
+        session.save()
+
+    def test_events_pages_and_fields(self):
+        seen = []
+        url = reverse('api_events') + '?limit=2&fields=id,venue_name'
+        while url:
+            page = self.client.get(url).json()
+            seen += page['data']
+            url = page['next']
+        self.assertEqual([row['id'] for row in seen], [event.eventID for event in self.events])
+        self.assertEqual(seen[0], {'id': self.events[0].eventID, 'venue_name': 'Teluk Cempedak'})
+        response = self.client.get(reverse('api_venues'), {'fields': 'id,password'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_conditional_get_skips_database(self):
+        response = self.client.get(reverse('api_events'), HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        etag = response['ETag']
+        self.assertFalse(etag.startswith('W/'))
+        self.assertNotEqual(self.client.get(reverse('api_events'))['ETag'], etag)  # uncompressed body
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('api_events'), HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        Event.objects.create(name='Night Market', date=date(2030, 6, 1), venue=self.venue)
+        response = self.client.get(reverse('api_events'), HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_booking_changes_etag_and_body(self):
+        url = reverse('api_events') + '?fields=id,booked&limit=1'
+        response = self.client.get(url)
+        self.assertEqual(response.json()['data'], [{'id': self.events[0].eventID, 'booked': 0}])
+        with self.captureOnCommitCallbacks(execute=True):
+            booking_engine.book(self.user.userID, self.events[0].eventID)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+        self.assertEqual(self.client.get(url).json()['data'], [{'id': self.events[0].eventID, 'booked': 1}])
+
+    def test_search(self):
+        data = self.client.get(reverse('api_search'), {'q': 'teluk', 'fields': 'id,name,location'}).json()
+        self.assertEqual(data['venues'], [{'id': 'V1', 'name': 'Teluk Cempedak', 'location': 'Kuantan'}])
+        self.assertEqual(len(data['events']), 5)  # events match on their venue's name
+        data = self.client.get(reverse('api_search'), {'q': 'beach', 'type': 'event', 'fields': 'id'}).json()
+        self.assertEqual(len(data['events']), 5)
+        self.assertNotIn('venues', data)
+
+    def test_my_bookings_and_stars(self):
+        self.assertEqual(self.client.get(reverse('api_bookings')).status_code, 401)
+        self.login()
+        response = self.client.get(reverse('api_bookings'))
+        self.assertEqual(response.json(), {'data': [], 'next': None})
+        etag = response['ETag']
+        self.assertEqual(self.client.get(reverse('api_bookings'), HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.client.get(reverse('book_event', args=[self.events[0].eventID]))
+        self.client.get(reverse('star_item', args=['venue', 'V1']))
+        response = self.client.get(reverse('api_bookings'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['event_name'] for row in response.json()['data']], ['Beach Festival 0'])
+        stars = self.client.get(reverse('api_stars'), {'fields': 'venue_id,venue_name'}).json()['data']
+        self.assertEqual(stars, [{'venue_id': 'V1', 'venue_name': 'Teluk Cempedak'}])
+
+
+class GeoTests(TestCase):
+    # Around Kuantan: 0.01 degrees of latitude is about 1.1km
+    def setUp(self):
+        cache.clear()
+        self.venues = [Venue.objects.create(venueID=f'V{i}', name=f'Venue {i}', location='Kuantan',
+                                            latitude=3.80 + i * 0.01, longitude=103.33) for i in range(5)]
+        Venue.objects.create(venueID='V9', name='Cameron Highlands', location='Brinchang',
+                             latitude=4.47, longitude=101.38)
+        Venue.objects.create(venueID='V10', name='Unmapped', location='Kuantan')
+
+    def test_geohash(self):
+        self.assertEqual(geo.encode(57.64911, 10.40744, 11), 'u4pruydqqvj')
+        venue = self.venues[0]
+        self.assertEqual(venue.geohash, geo.encode(3.80, 103.33))
+        venue.latitude = 4.47
+        venue.save(update_fields=['latitude'])
+        self.assertEqual(Venue.objects.get(pk=venue.pk).geohash, geo.encode(4.47, 103.33))
+
+    def test_distance(self):
+        # Kuantan to Kuala Lumpur, about 196km as the crow flies
+        self.assertAlmostEqual(geo.distance_km(3.8077, 103.326, 3.139, 101.6869), 196, delta=2)
+
+    def test_venues_within_radius(self):
+        hits = geo.venues_within(3.80, 103.33, 3)
+        self.assertEqual([venue_id for _, venue_id in hits], ['V0', 'V1', 'V2'])
+        self.assertEqual(hits[0][0], 0)
+        # A radius wide enough to need coarser cells still finds the far venue
+        self.assertEqual(len(geo.venues_within(3.80, 103.33, 300)), 6)
+
+    def test_venues_nearby_api(self):
+        seen = []
+        url = reverse('api_venues_nearby') + '?lat=3.845&lon=103.33&radius=10&limit=2&fields=id,distance_km'
+        while url:
+            page = self.client.get(url).json()
+            seen += page['data']
+            url = page['next']
+        self.assertEqual([row['id'] for row in seen], ['V4', 'V3', 'V2', 'V1', 'V0'])
+        self.assertEqual(seen[0]['distance_km'], 0.556)
+        self.assertEqual(self.client.get(reverse('api_venues_nearby'), {'lat': 'north', 'lon': 1}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('api_venues_nearby'), {'lat': 3, 'lon': 103,
+                                                                        'radius': 5000}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('api_venues_nearby'), {'lat': 3, 'lon': 103,
+                                                                        'cursor': 'bad'}).status_code, 400)
+
+    def test_events_nearby_api(self):
+        near, far = self.venues[0], self.venues[2]
+        for day in (3, 1, 2):
+            Event.objects.create(name=f'Night Market {day}', date=date(2030, 5, day), venue=far)
+        Event.objects.create(name='Beach Run', date=date(2030, 6, 1), venue=near)
+        Event.objects.create(name='Past Fair', date=date(2020, 6, 1), venue=near)
+        Event.objects.create(name='Tea Tour', date=date(2030, 5, 1), venue_id='V9')
+        seen = []
+        url = reverse('api_events_nearby') + '?lat=3.80&lon=103.33&radius=5&limit=2&fields=name,venue_id'
+        while url:
+            page = self.client.get(url).json()
+            seen += page['data']
+            url = page['next']
+        self.assertEqual([row['name'] for row in seen],
+                         ['Beach Run', 'Night Market 1', 'Night Market 2', 'Night Market 3'])
+        url = reverse('api_events_nearby') + '?lat=3.80&lon=103.33&radius=5&cursor='
+        for values in ([0.0, 'V1', 'garbage', 'E1'], [0.0, 'V1', '2030-02-30', 'E1'], [0.0, 'V1', 5, 'E1'],
+                       [0.0, 'V1', [1], 'E1'], [0.0, 'V1', '2030-05-01', 1], [0.0, 'V1', None, 'E1']):
+            self.assertEqual(self.client.get(url + pagination.encode_cursor(values)).status_code, 400, values)
+
+    def test_page_stops_after_max_venues(self):
+        # Venues without events still cost a query each, so a page looks at a bounded number
+        Venue.objects.bulk_create([
+            Venue(venueID=f'W{i:03}', name='Empty', location='Kuantan', latitude=3.70 - i * 0.0001,
+                  longitude=103.33, geohash=geo.encode(3.70 - i * 0.0001, 103.33))
+            for i in range(geo.MAX_VENUES_PER_PAGE)
+        ])
+        venue = Venue.objects.create(venueID='W999', name='Fairground', location='Kuantan',
+                                     latitude=3.70 - (geo.MAX_VENUES_PER_PAGE + 1) * 0.0001, longitude=103.33)
+        Event.objects.create(name='Far Fair', date=date(2030, 5, 1), venue=venue)
+        rows, cursor = geo.events_near(3.701, 103.33, 5, Event.objects.all(), ['name'])
+        self.assertEqual(rows, [])
+        self.assertIsNotNone(cursor)
+        rows, cursor = geo.events_near(3.701, 103.33, 5, Event.objects.all(), ['name'], cursor)
+        self.assertEqual(([row['name'] for row in rows], cursor), (['Far Fair'], None))
+
+
+class FeedTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.beach = Venue.objects.create(venueID='V1', name='Teluk Cempedak', location='Kuantan')
+        park = Venue.objects.create(venueID='V2', name='Taman Negara', location='Jerantut')
+        self.festival = Event.objects.create(name='Beach Festival; Night, Day', date=date(2030, 5, 1), venue=self.beach)
+        Event.objects.create(name='Canopy Walk ' + 'Hutan Hujan Tropika — ' * 6, date=date(2030, 6, 1), venue=park)
+        Event.objects.create(name='Old Regatta', date=date(2001, 1, 1), venue=park)
+        self.user = User.objects.create(full_name='Guest', email='guest@example.com', password='x')
+
+    def body(self, response):
+        return b''.join(response.streaming_content) if response.streaming else response.content
+
+    def test_events_ical(self):
+        response = self.client.get(reverse('events_ical'))
+        self.assertEqual(response['Content-Type'], 'text/calendar; charset=utf-8')
+        self.assertIn('max-age=300', response['Cache-Control'])
+        body = self.body(response).decode()
+        self.assertTrue(body.startswith('BEGIN:VCALENDAR\r\n'))
+        self.assertEqual(body.count('BEGIN:VEVENT'), 2)  # upcoming only
+        self.assertIn('SUMMARY:Beach Festival\\; Night\\, Day\r\n', body)
+        self.assertIn('DTSTART;VALUE=DATE:20300501\r\n', body)
+        self.assertTrue(all(len(line.encode()) <= 75 for line in body.split('\r\n')))
+        self.assertIn('Hutan Hujan Tropika — ' * 6, body.replace('\r\n ', ''))  # folded and unfolded
+
+        venue_only = self.body(self.client.get(reverse('events_ical'), {'venue': 'V2'})).decode()
+        self.assertEqual(venue_only.count('BEGIN:VEVENT'), 1)
+        self.assertEqual(self.client.get(reverse('events_ical'), {'from': 'soon'}).status_code, 400)
+
+    def test_events_rss(self):
+        response = self.client.get(reverse('events_rss'), {'venue': 'V1'})
+        self.assertEqual(response['Content-Type'], 'application/rss+xml; charset=utf-8')
+        body = self.body(response).decode()
+        self.assertIn(f'<guid isPermaLink="false">{self.festival.eventID}</guid>', body)
+        self.assertNotIn('Canopy Walk', body)
+
+    def test_conditional_get_and_cache(self):
+        response = self.client.get(reverse('events_ical'))
+        first = self.body(response)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(reverse('events_ical'), HTTP_IF_NONE_MATCH=response['ETag']).status_code,
+                             304)
+            self.assertEqual(self.client.get(reverse('events_ical')).content, first)  # cached body
+
+        self.festival.name = 'Beach Carnival'
+        self.festival.save()
+        response = self.client.get(reverse('events_ical'), HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'Beach Carnival', self.body(response))
+
+    def test_large_feed_streams_without_caching(self):
+        self.addCleanup(setattr, feeds, 'CACHE_MAX_BYTES', feeds.CACHE_MAX_BYTES)
+        feeds.CACHE_MAX_BYTES = 100
+        response = self.client.get(reverse('events_rss'))
+        self.assertTrue(response.streaming)
+        self.assertIn(b'Canopy Walk', self.body(response))
+        self.assertTrue(self.client.get(reverse('events_rss')).streaming)
+
+    def test_bookings_feed(self):
+        session = self.client.session
+        session['userID'] = self.user.userID
+        session.save()
+        self.client.post(reverse('book_event', args=[self.festival.eventID]))
+        url = self.client.get(reverse('booked_events')).context['calendar_url']
+        self.client.logout()
+
+        response = self.client.get(url)
+        self.assertIn('private', response['Cache-Control'])
+        body = self.body(response).decode()
+        self.assertEqual(body.count('BEGIN:VEVENT'), 1)
+        self.assertIn('STATUS:CONFIRMED', body)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+        booking_engine.cancel(Booking.objects.get())
+        user_state.invalidate(self.user.userID)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(self.body(response).decode().count('BEGIN:VEVENT'), 0)
+
+        self.assertEqual(self.client.get(url.replace(f'/{self.user.userID}:', '/999:')).status_code, 404)
+
+
+class UserStateCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(full_name='Guest', email='guest@example.com', password='x')
+        session = self.client.session
+        session['userID'] = self.user.userID
+        session.save()
+        self.venue = Venue.objects.create(venueID='V1', name='Teluk Cempedak', location='Kuantan')
+        self.event = Event.objects.create(name='Beach Run', date=date(2030, 5, 1), venue=self.venue)
+
+    def test_state_is_cached_until_a_write(self):
+        self.client.get(reverse('event_list'))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('event_list'))
+        sql = ' '.join(query['sql'] for query in queries)
+        self.assertNotIn('"PahangPrism_starreditem"."userID_id" =', sql)
+        self.assertNotIn('PahangPrism_booking', sql)
+        self.assertNotIn(self.event.eventID, response.context['starred_events'])
+
+        self.client.get(reverse('star_item', args=['event', self.event.eventID]))
+        self.client.get(reverse('book_event', args=[self.event.eventID]))
+        response = self.client.get(reverse('event_list'))
+        self.assertIn(self.event.eventID, response.context['starred_events'])
+        self.assertIn(self.event.eventID, response.context['booked_events'])
+
+        booking = Booking.objects.get(user=self.user)
+        self.client.get(reverse('cancel_booking', args=[booking.bookingID]))
+        response = self.client.get(reverse('event_list'))
+        self.assertNotIn(self.event.eventID, response.context['booked_events'])
+
+    def test_venue_list_uses_session_user(self):
+        StarredItem.objects.create(userID=self.user, venue=self.venue)
+        response = self.client.get(reverse('venue_list'))
+        self.assertIn('V1', response.context['starred_venues'])
+
+
+class CatalogueCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.venue = Venue.objects.create(venueID='V1', name='Teluk Cempedak', location='Kuantan')
+        Event.objects.create(name='Beach Run', date=date(2030, 5, 1), venue=self.venue)
+
+    def test_anonymous_page_cached_until_catalogue_changes(self):
+        self.client.get(reverse('event_list'))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('event_list'))
+        self.assertContains(response, 'Beach Run')
+
+        Event.objects.create(name='Night Market', date=date(2030, 5, 2), venue=self.venue)
+        self.assertContains(self.client.get(reverse('event_list')), 'Night Market')
+        stats = catalogue_cache.stats()
+        self.assertEqual((stats['event_list']['hits'], stats['event_list']['misses']), (1, 2))
+
+
+class QueryCountTests(TestCase):
+    # Each view must run the same number of queries for N and 10N rows.
+    # If one of these fails, a view has grown a per-row query again.
+    N = 3
+
+    def setUp(self):
+        self.user = User.objects.create(full_name='Staff', email='staff@example.com', password='x', is_staff=True)
+        self.seeded = 0
+
+    def login(self):
+        session = self.client.session
+        session['userID'] = self.user.userID
+        session['is_staff'] = True
+        session.save()
+
+    def seed(self, count):
+        # Venues, events, a star on each and a booking on each event by a fresh user
+        start = self.seeded
+        self.seeded += count
+        venues = Venue.objects.bulk_create(
+            Venue(venueID=f'V{i}', name=f'Venue {i}', location='Kuantan') for i in range(start, self.seeded)
+        )
+        events = Event.objects.bulk_create(
+            Event(eventID=event_id, name=f'Festival {i}', date=date(2030, 1, 1), venue=venue)
+            for i, (event_id, venue) in enumerate(zip(sequences.event_ids(count), venues))
+        )
+        guests = User.objects.bulk_create(
+            User(full_name=f'Guest {i}', email=f'guest{i}@example.com', password='x') for i in range(start, self.seeded)
+        )
+        StarredItem.objects.bulk_create(
+            [StarredItem(userID=self.user, event=event) for event in events] +
+            [StarredItem(userID=self.user, venue=venue) for venue in venues] +
+            [StarredItem(userID=guest, event=event) for guest, event in zip(guests, events)]
+        )
+        Booking.objects.bulk_create(
+            [Booking(user=self.user, event=event) for event in events] +
+            [Booking(user=guest, event=event) for guest, event in zip(guests, events)]
+        )
+        search_index.rebuild(Event, Venue)
+
+    def count_queries(self, url, data=None):
+        cache.clear()
+        self.login()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, data)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def assertConstantQueries(self, url, data=None):
+        self.seed(self.N)
+        small = self.count_queries(url, data)
+        self.seed(self.N * 9)
+        self.assertEqual(self.count_queries(url, data), small)
+
+    def test_event_list(self):
+        self.assertConstantQueries(reverse('event_list'))
+
+    def test_event_list_anonymous(self):
+        self.seed(self.N)
+        cache.clear()
+        with self.assertNumQueries(2):  # events (with their star_count) + venue filter choices
+            self.client.get(reverse('event_list'))
+        self.seed(self.N * 9)
+        cache.clear()
+        with self.assertNumQueries(2):  # events (with their star_count) + venue filter choices
+            self.client.get(reverse('event_list'))
+
+    def test_venue_list(self):
+        self.assertConstantQueries(reverse('venue_list'))
+
+    def test_search(self):
+        self.assertConstantQueries(reverse('search'), {'q': 'festival'})
+
+    def test_starred_list(self):
+        self.assertConstantQueries(reverse('starred_list'))
+
+    def test_booked_events(self):
+        self.assertConstantQueries(reverse('booked_events'))
+
+    def test_user_dashboard(self):
+        self.assertConstantQueries(reverse('user_dashboard'))
+
+    def test_admin_bookings_table(self):
+        self.assertConstantQueries(reverse('admin_table', args=['bookings']))
+
+    def test_edit_booking(self):
+        self.seed(self.N)
+        booking = Booking.objects.first()
+        small = self.count_queries(reverse('edit_booking', args=[booking.bookingID]))
+        self.seed(self.N * 9)
+        self.assertEqual(self.count_queries(reverse('edit_booking', args=[booking.bookingID])), small)
+
+    def test_edit_event(self):
+        self.seed(self.N)
+        small = self.count_queries(reverse('edit_event', args=['E1']))
+        self.seed(self.N * 9)
+        self.assertEqual(self.count_queries(reverse('edit_event', args=['E1'])), small)
+
+    def test_cancel_booking(self):
+        self.seed(self.N)
+        self.login()
+        bookings = Booking.objects.filter(user=self.user).values_list('bookingID', flat=True)
+        with CaptureQueriesContext(connection) as small:
+            self.client.get(reverse('cancel_booking', args=[bookings[0]]))
+        self.seed(self.N * 9)
+        with CaptureQueriesContext(connection) as large:
+            self.client.get(reverse('cancel_booking', args=[bookings[0]]))
+        self.assertEqual(len(large), len(small))
+
+
+class StarredItemTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(full_name='Guest', email='guest@example.com', password='x')
+        session = self.client.session
+        session['userID'] = self.user.userID
+        session.save()
+        self.venue = Venue.objects.create(venueID='V1', name='Teluk Cempedak', location='Kuantan')
+        self.event = Event.objects.create(name='Beach Run', date=date(2030, 5, 1), venue=self.venue)
+
+    def test_star_toggle_and_counts(self):
+        self.client.get(reverse('star_item', args=['event', self.event.eventID]))
+        self.client.get(reverse('star_item', args=['venue', 'V1']))
+        self.assertEqual(Event.objects.get(pk=self.event.pk).star_count, 1)
+        with self.assertNumQueries(1):  # starred items; the session comes from the cache
+            response = self.client.get(reverse('starred_list'))
+        self.assertEqual(response.context['events'], [self.event])
+        self.assertEqual(response.context['venues'], [self.venue])
+
+        self.client.get(reverse('star_item', args=['event', self.event.eventID]))
+        self.assertEqual(Event.objects.get(pk=self.event.pk).star_count, 0)
+
+    def test_star_shows_in_cached_event_list(self):
+        anonymous = self.client_class()
+        self.assertContains(anonymous.get(reverse('event_list')), 'Starred by 0 users')
+        self.assertContains(self.client.get(reverse('event_list')), 'Starred by 0 users')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.get(reverse('star_item', args=['event', self.event.eventID]))
+        self.assertContains(anonymous.get(reverse('event_list')), 'Starred by 1 user<')
+        self.assertContains(self.client.get(reverse('event_list')), 'Starred by 1 user<')
+
+    def test_star_unknown_target(self):
+        self.assertEqual(self.client.get(reverse('star_item', args=['event', 'E404'])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('star_item', args=['user', '1'])).status_code, 404)
+
+    def test_deleting_event_removes_stars(self):
+        StarredItem.objects.create(userID=self.user, event=self.event)
+        self.event.delete()
+        self.assertFalse(StarredItem.objects.exists())
+
+
+class BookingEngineTests(TestCase):
+    def setUp(self):
+        venue = Venue.objects.create(venueID='V1', name='Teluk Cempedak', location='Kuantan')
+        self.event = Event.objects.create(name='Beach Run', date=date(2030, 5, 1), venue=venue, capacity=1)
+        self.first = User.objects.create(full_name='First', email='first@example.com', password='x')
+        self.second = User.objects.create(full_name='Second', email='second@example.com', password='x')
+
+    def test_full_event_waitlists_and_promotes(self):
+        self.assertEqual(booking_engine.book(self.first.userID, self.event.eventID), booking_engine.BOOKED)
+        self.assertEqual(booking_engine.book(self.first.userID, self.event.eventID), booking_engine.ALREADY_BOOKED)
+        self.assertEqual(booking_engine.book(self.second.userID, self.event.eventID), booking_engine.WAITLISTED)
+        self.assertEqual(booking_engine.book(self.second.userID, self.event.eventID), booking_engine.ALREADY_WAITLISTED)
+        self.event.refresh_from_db()
+        self.assertEqual(self.event.booked, 1)
+
+        promoted = booking_engine.cancel(Booking.objects.get(user=self.first))
+        self.assertEqual(promoted, self.second.userID)
+        self.assertTrue(Booking.objects.filter(user=self.second, event=self.event).exists())
+        self.assertFalse(WaitlistEntry.objects.exists())
+        self.event.refresh_from_db()
+        self.assertEqual(self.event.booked, 1)
+
+    def test_invalid_capacity_is_rejected(self):
+        staff = User.objects.create(full_name='Staff', email='staff@example.com', password='x', is_staff=True)
+        session = self.client.session
+        session.update({'userID': staff.userID, 'is_staff': True})
+        session.save()
+        for capacity in ('abc', '2.5', '-5', '\u00b2'):
+            response = self.client.post(reverse('admin_dashboard'), {
+                'add_event': '1', 'event_name': 'Kite Festival', 'event_date': '2030-05-02',
+                'event_venue': 'V1', 'event_capacity': capacity}, follow=True)
+            self.assertContains(response, 'Event not added: invalid capacity')
+            response = self.client.post(reverse('edit_event', args=[self.event.eventID]), {
+                'name': 'Beach Run', 'date': '2030-05-01', 'venue': 'V1', 'capacity': capacity})
+            self.assertContains(response, 'Event not updated: invalid capacity')
+        self.assertEqual(list(Event.objects.values_list('name', 'capacity')), [('Beach Run', 1)])
+
+    def test_duplicate_insert_rolls_back_seat(self):
+        self.event.capacity = None
+        self.event.save()
+        Booking.objects.create(user=self.first, event=self.event)  # bypasses the counter, like a racing request
+        self.assertEqual(booking_engine.book(self.first.userID, self.event.eventID), booking_engine.ALREADY_BOOKED)
+        self.event.refresh_from_db()
+        self.assertEqual(self.event.booked, 0)
+
+    def test_raising_capacity_fills_from_waitlist(self):
+        booking_engine.book(self.first.userID, self.event.eventID)
+        booking_engine.book(self.second.userID, self.event.eventID)
+        Event.objects.filter(pk=self.event.pk).update(capacity=2)
+        self.assertEqual(booking_engine.fill_from_waitlist(self.event.eventID), [self.second.userID])
+
+    def test_deleting_user_frees_seats(self):
+        booking_engine.book(self.first.userID, self.event.eventID)
+        booking_engine.book(self.second.userID, self.event.eventID)
+        staff = User.objects.create(full_name='Staff', email='staff@example.com', password='x', is_staff=True)
+        session = self.client.session
+        session.update({'userID': staff.userID, 'is_staff': True})
+        session.save()
+        self.client.post(reverse('delete_user', args=[self.first.userID]))
+        self.assertFalse(User.objects.filter(pk=self.first.pk).exists())
+        self.assertTrue(Booking.objects.filter(user=self.second, event=self.event).exists())
+        self.assertFalse(WaitlistEntry.objects.exists())
+        self.event.refresh_from_db()
+        self.assertEqual(self.event.booked, 1)
+
+
+class AsyncViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(full_name='Guest', email='guest@example.com', password='x')
+        venue = Venue.objects.create(venueID='V1', name='Teluk Cempedak', location='Kuantan')
+        self.event = Event.objects.create(name='Beach Festival', date=date(2030, 5, 1), venue=venue)
+        Booking.objects.create(user=self.user, event=self.event)
+        task_queue.run_pending()
+        session = SessionStore()
+        session['userID'] = self.user.userID
+        session.save()
+        self.session_key = session.session_key
+
+    def request(self, path, data=None):
+        request = RequestFactory().get(path, data)
+        request.session = SessionStore(self.session_key)
+        return request
+
+    async def test_read_views_match_sync_versions(self):
+        for name, data in [('event_list', None), ('venue_list', None), ('search', {'q': 'beach'}),
+                           ('booked_events', None), ('user_dashboard', None)]:
+            response = await getattr(async_views, name)(self.request('/', data))
+            self.assertEqual(response.status_code, 200, name)
+            self.assertContains(response, 'Teluk Cempedak' if name == 'venue_list' else 'Beach Festival')
+
+    async def test_login_with_cold_session_cache(self):
+        await User.objects.filter(pk=self.user.pk).aupdate(password=credentials.hash_password('s3cret'))
+        for _ in range(2):
+            request = RequestFactory().post('/login/', {'email': 'guest@example.com', 'password': 's3cret'})
+            request.session = import_module(settings.SESSION_ENGINE).SessionStore(self.session_key)
+            request._messages = default_storage(request)
+            await cache.aclear()  # The session is only in the database
+            response = await async_views.login(request)
+            self.assertEqual(response.status_code, 302)
+            await request.session.asave()
+        self.assertEqual(await SessionStore(self.session_key).aget('userID'), self.user.userID)
+
+
+class ImageVariantTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.venue = Venue.objects.create(venueID='V1', name='Teluk Cempedak', location='Kuantan')
+
+    def upload(self, color):
+        from PIL import Image
+        buffer = io.BytesIO()
+        Image.new('RGB', (2000, 1000), color).save(buffer, 'PNG')
+        return SimpleUploadedFile('beach.png', buffer.getvalue(), content_type='image/png')
+
+    def attach(self, color):
+        # Store the original, then run the queued processing as the worker would
+        images.attach(self.venue, self.upload(color))
+        task_queue.run_pending()
+        self.venue.refresh_from_db()
+
+    def test_attach_builds_variants_and_replaces_files(self):
+        self.attach('blue')
+        self.assertEqual(self.venue.image_variants['card']['width'], 640)
+        self.assertEqual(self.venue.image_variants['hero']['height'], 800)
+        old_files = images.files(self.venue)
+
+        self.attach('green')
+        self.assertTrue(old_files.isdisjoint(images.files(self.venue)))
+        response = self.client.get(f'/media/{self.venue.image_variants["thumb"]["jpeg"]}')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+        response = self.client.get(f'/media/{sorted(old_files)[0]}')
+        self.assertEqual(response.status_code, 404)
+
+    def test_responsive_image_tag(self):
+        template = Template("{% load responsive_images %}{% responsive_image venue 'card' alt=venue.name %}")
+        self.assertIn('image-placeholder', template.render(Context({'venue': self.venue})))
+
+        self.attach('blue')
+        html = template.render(Context({'venue': self.venue}))
+        self.assertIn('<picture>', html)
+        self.assertIn('width="640" height="320"', html)
+        self.assertIn(' 320w, ', html)
+
+    def test_only_images_are_stored(self):
+        upload = self.upload('blue')
+        upload.name = 'beach.exe'
+        self.assertTrue(images.store_original(upload, 'venue/V1').endswith('-original.png'))
+
+        staff = User.objects.create(full_name='Staff', email='staff@example.com', password='x', is_staff=True)
+        session = self.client.session
+        session.update({'userID': staff.userID, 'is_staff': True})
+        session.save()
+        script = SimpleUploadedFile('beach.png', b'<script>alert(1)</script>', content_type='image/png')
+        response = self.client.post(reverse('edit_venue', args=['V1']),
+                                    {'name': 'Teluk Cempedak', 'location': 'Kuantan', 'image': script})
+        self.assertContains(response, 'beach.png is not an image')
+        self.venue.refresh_from_db()
+        self.assertEqual(self.venue.image, '')
+        self.assertFalse(Task.objects.filter(name='process_image').exists())
+
+
+TASK_CALLS = []
+
+
+@task_queue.task(max_attempts=2)
+def record_call(value, fail=False):
+    # A task for TaskQueueTests
+    if fail:
+        raise RuntimeError(f'failed on {value}')
+    TASK_CALLS.append(value)
+
+
+class TaskQueueTests(TestCase):
+    def setUp(self):
+        TASK_CALLS.clear()
+
+    def test_task_runs_once_and_is_deleted(self):
+        record_call.enqueue(value=1)
+        self.assertEqual(task_queue.run_pending(), 1)
+        self.assertEqual(TASK_CALLS, [1])
+        self.assertFalse(Task.objects.exists())
+        self.assertEqual(task_queue.run_pending(), 0)
+
+    def test_rolled_back_transaction_enqueues_nothing(self):
+        try:
+            with transaction.atomic():
+                record_call.enqueue(value=1)
+                raise RuntimeError
+        except RuntimeError:
+            pass
+        self.assertFalse(Task.objects.exists())
+
+    def test_failure_backs_off_then_fails(self):
+        task = record_call.enqueue(value=1, fail=True)
+        with self.assertLogs('PahangPrism.tasks', 'WARNING'):
+            self.assertEqual(task_queue.run_pending(), 1)
+        task.refresh_from_db()
+        self.assertEqual((task.status, task.attempts), (Task.QUEUED, 1))
+        self.assertGreater(task.run_at, timezone.now())
+        self.assertEqual(task_queue.run_pending(), 0)  # not due yet
+
+        Task.objects.filter(pk=task.pk).update(run_at=timezone.now())
+        with self.assertLogs('PahangPrism.tasks', 'ERROR'):
+            task_queue.run_pending()
+        task.refresh_from_db()
+        self.assertEqual((task.status, task.attempts), (Task.FAILED, 2))
+        self.assertIn('RuntimeError: failed on 1', task.last_error)
+        self.assertEqual(task_queue.counts(), {Task.FAILED: 1})
+
+    def test_expired_claim_leaves_reclaimed_task_alone(self):
+        record_call.enqueue(value=1)
+        [first] = task_queue.claim()
+        Task.objects.filter(pk=first.pk).update(locked_at=timezone.now() - timedelta(hours=1))
+        [second] = task_queue.claim()
+        task_queue.execute(first)  # Finishes after its lease ran out
+        self.assertEqual(Task.objects.get(pk=first.pk).status, Task.RUNNING)
+        task_queue.execute(second)
+        self.assertFalse(Task.objects.exists())
+
+    def test_expired_lease_is_claimed_again(self):
+        task = record_call.enqueue(value=1)
+        self.assertEqual(task_queue.claim(), [task])
+        self.assertEqual(task_queue.claim(), [])  # held by the first worker
+        Task.objects.filter(pk=task.pk).update(locked_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(task_queue.claim(), [task])
+
+    @override_settings(TASKS_EAGER=True)
+    def test_eager_mode_runs_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            record_call.enqueue(value=1)
+            self.assertEqual(TASK_CALLS, [])
+        self.assertEqual(TASK_CALLS, [1])
+        self.assertFalse(Task.objects.exists())
+
+    def test_capacity_change_fills_waitlist_in_worker(self):
+        venue = Venue.objects.create(venueID='V1', name='Teluk Cempedak', location='Kuantan')
+        event = Event.objects.create(name='Beach Run', date=date(2030, 5, 1), venue=venue, capacity=0)
+        user = User.objects.create(full_name='Guest', email='guest@example.com', password='x')
+        booking_engine.book(user.userID, event.eventID)
+        staff = User.objects.create(full_name='Staff', email='staff@example.com', password='x', is_staff=True)
+        session = self.client.session
+        session.update({'userID': staff.userID, 'is_staff': True})
+        session.save()
+
+        self.client.post(reverse('edit_event', args=[event.eventID]),
+                         {'name': 'Beach Run', 'date': '2030-05-01', 'venue': 'V1', 'capacity': '1'})
+        self.assertFalse(Booking.objects.exists())
+        errors = io.StringIO()
+        call_command('run_tasks', '--once', stdout=io.StringIO(), stderr=errors)
+        self.assertTrue(Booking.objects.filter(user=user, event=event).exists())
+        self.assertIn('set REDIS_URL', errors.getvalue())  # The tests' cache is per process
+
+
+class StatsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.beach = Venue.objects.create(venueID='V1', name='Teluk Cempedak', location='Kuantan')
+        self.park = Venue.objects.create(venueID='V2', name='Taman Negara', location='Jerantut')
+        self.festival = Event.objects.create(name='Beach Festival', date=date(2030, 5, 1), venue=self.beach)
+        self.trek = Event.objects.create(name='Canopy Walk', date=date(2030, 6, 1), venue=self.park)
+        self.past = Event.objects.create(name='Old Regatta', date=date(2001, 1, 1), venue=self.park)
+        self.user = User.objects.create(full_name='Guest', email='guest@example.com', password='x')
+        session = self.client.session
+        session['userID'] = self.user.userID
+        session.save()
+
+    def activity(self, kind, object_id):
+        return DailyActivity.objects.filter(kind=kind, object_id=object_id).values_list('bookings', 'stars').first()
+
+    def test_star_and_unstar_update_counters(self):
+        url = reverse('star_item', args=['venue', 'V1'])
+        self.client.post(url)
+        self.beach.refresh_from_db()
+        self.assertEqual(self.beach.star_count, 1)
+        self.client.post(url)
+        self.beach.refresh_from_db()
+        self.assertEqual(self.beach.star_count, 0)
+        self.assertEqual(self.activity('venue', 'V1'), (0, 0))
+
+    def test_bookings_are_counted(self):
+        booking_engine.book(self.user.userID, self.festival.eventID)
+        self.assertEqual(self.activity('event', self.festival.eventID), (1, 0))
+        booking_engine.cancel(Booking.objects.get())
+        self.assertEqual(self.activity('event', self.festival.eventID), (0, 0))
+
+    def test_deleting_user_takes_back_stars(self):
+        self.client.post(reverse('star_item', args=['venue', 'V1']))
+        self.client.post(reverse('star_item', args=['event', self.trek.eventID]))
+        staff = User.objects.create(full_name='Staff', email='staff@example.com', password='x', is_staff=True)
+        session = self.client.session
+        session.update({'userID': staff.userID, 'is_staff': True})
+        session.save()
+        self.client.post(reverse('delete_user', args=[self.user.userID]))
+        self.assertEqual([Venue.objects.get(pk='V1').star_count, Event.objects.get(pk=self.trek.pk).star_count],
+                         [0, 0])
+        self.assertEqual(self.activity('venue', 'V1'), (0, 0))
+        self.assertEqual(stats.reconcile(dry_run=True), {'event.booked': 0, 'event.star_count': 0,
+                                                          'venue.star_count': 0})
+
+    def test_refresh_decays_and_ranks(self):
+        today = timezone.localdate()
+        DailyActivity.objects.create(kind='event', object_id=self.festival.eventID, day=today, bookings=2)
+        DailyActivity.objects.create(kind='event', object_id=self.trek.eventID, day=today - timedelta(days=3),
+                                     bookings=3)
+        DailyActivity.objects.create(kind='event', object_id=self.past.eventID, day=today, bookings=50)
+        DailyActivity.objects.create(kind='venue', object_id='V1', day=today - timedelta(days=60), stars=100)
+
+        self.assertEqual(stats.refresh_trending(), 5)
+        self.trek.refresh_from_db()
+        self.assertAlmostEqual(self.trek.trending, 3 * stats.BOOKING_WEIGHT / 2)  # one half-life old
+        self.assertEqual(DailyActivity.objects.filter(kind='venue').count(), 0)  # outside the window
+        self.assertEqual(stats.trending_events(), [self.festival, self.trek])  # past events left out
+        self.assertEqual(stats.trending_venues(), [self.park, self.beach])  # their events' activity
+
+        DailyActivity.objects.all().delete()
+        stats.refresh_trending()
+        self.assertEqual(stats.trending_events(), [])
+        self.assertFalse(Event.objects.filter(trending__gt=0).exists())
+
+    def test_home_page_lists_trending(self):
+        self.client.logout()
+        self.assertNotContains(self.client.get(reverse('index')), 'Trending Events')
+        DailyActivity.objects.create(kind='event', object_id=self.trek.eventID, day=timezone.localdate(), stars=1)
+        stats.refresh_trending()
+        with self.assertNumQueries(2):  # the two trending lists, then served from the cache
+            response = self.client.get(reverse('index'))
+        self.assertContains(response, 'Canopy Walk')
+        with self.assertNumQueries(0):
+            self.client.get(reverse('index'))
+
+    def test_reconcile_fixes_drift(self):
+        Booking.objects.create(user=self.user, event=self.trek)
+        StarredItem.objects.create(userID=self.user, event=self.trek)
+        Event.objects.filter(pk=self.festival.pk).update(star_count=7)
+        self.assertEqual(stats.reconcile(dry_run=True), {'event.booked': 1, 'event.star_count': 2, 'venue.star_count': 0})
+        self.assertEqual(Event.objects.get(pk=self.festival.pk).star_count, 7)
+
+        out = io.StringIO()
+        call_command('reconcile_stats', stdout=out)
+        self.assertEqual(list(Event.objects.order_by('date').values_list('booked', 'star_count')),
+                         [(0, 0), (0, 0), (1, 1)])
+        self.assertEqual(stats.reconcile(), {'event.booked': 0, 'event.star_count': 0, 'venue.star_count': 0})
+
+    def test_refresh_is_periodic(self):
+        task_queue.run_pending()  # indexing from setUp
+        task_queue.schedule_periodic()
+        self.assertEqual(task_queue.run_pending(), 1)
+        task = Task.objects.get(name='refresh_trending')
+        self.assertEqual(task.status, Task.QUEUED)
+        self.assertGreater(task.run_at, timezone.now())
+        task_queue.schedule_periodic()
+        self.assertEqual(Task.objects.count(), 1)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Task.objects.create(name='refresh_trending', periodic=True)  # As a second worker starting would
+
+
+class CssBundleTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        bundle_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, bundle_root)
+        settings_override = override_settings(CSS_BUNDLE_ROOT=bundle_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        finders.get_finder.cache_clear()
+        self.addCleanup(finders.get_finder.cache_clear)
+
+    def test_bundle_concatenates_minifies_and_rebases_urls(self):
+        with open(finders.find(assets.bundle_path('event_list')), encoding='utf-8') as bundle:
+            css = bundle.read()
+        self.assertNotIn('/*', css)
+        self.assertNotIn('\n    ', css)
+        self.assertIn('.event-card{', css)
+        self.assertIn('url("../../image/beachkuantan.jpg")', css)
+        self.assertIsNotNone(finders.find('image/beachkuantan.jpg'))
+        self.assertEqual(finders.find('css/bundles/unknown.css'), None)
+
+    def test_pages_link_one_stylesheet(self):
+        response = self.client.get(reverse('event_list'))
+        self.assertContains(response, 'rel="stylesheet"', count=2)  # bundle + web font
+        self.assertContains(response, '/static/css/bundles/event_list.css')
+        self.assertNotContains(response, '<style>')
+
+
+class IdentityTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(full_name='Guest', email='guest@example.com', password='x')
+        session = self.client.session
+        session['userID'] = self.user.userID
+        session.save()
+
+    def test_warm_request_needs_no_queries(self):
+        self.client.get(reverse('index'))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('index'))
+        self.assertContains(response, 'Welcome back, Guest!')
+
+    def test_user_changes_invalidate_cached_identity(self):
+        self.assertEqual(identity.get_user(self.user.userID).full_name, 'Guest')
+        self.user.full_name = 'Renamed'
+        self.user.save()
+        self.assertEqual(identity.get_user(self.user.userID).full_name, 'Renamed')
+        self.assertNotIn('password', identity.get_user(self.user.userID).__dict__)
+
+        user_id = self.user.userID
+        self.user.delete()
+        self.assertIsNone(identity.get_user(user_id))
+        self.assertRedirects(self.client.get(reverse('user_dashboard')), reverse('login'))
+
+
+class CredentialTests(TestCase):
+    def login(self, email, password):
+        return self.client.post(reverse('login'), {'email': email, 'password': password})
+
+    def test_register_hashes_and_login_verifies(self):
+        self.client.post(reverse('register'), {'full_name': 'Guest', 'email': 'guest@example.com', 'password': 's3cret'})
+        user = User.objects.get(email='guest@example.com')
+        self.assertTrue(user.password.startswith('argon2$'))
+        self.assertRedirects(self.login('guest@example.com', 's3cret'), reverse('index'))
+        self.assertEqual(self.client.session['userID'], user.userID)
+
+    def test_plaintext_row_is_upgraded_on_login(self):
+        user = User.objects.create(full_name='Guest', email='guest@example.com', password='old-plain')
+        self.assertIsNone(credentials.authenticate('guest@example.com', 'wrong'))
+        self.assertEqual(credentials.authenticate('guest@example.com', 'old-plain'), user)
+        user.refresh_from_db()
+        self.assertTrue(credentials.is_hashed(user.password))
+        self.assertEqual(credentials.authenticate('guest@example.com', 'old-plain'), user)
+        self.assertIsNone(credentials.authenticate('nobody@example.com', 'old-plain'))
+
+    def test_changed_password_still_logs_in(self):
+        user = User.objects.create(full_name='Guest', email='guest@example.com', password='old-plain')
+        self.login('guest@example.com', 'old-plain')
+        self.client.post(reverse('update_profile'), {
+            'full_name': 'Guest', 'email': 'guest@example.com',
+            'new_password': 'n3w-pass', 'confirm_password': 'n3w-pass',
+        })
+        self.client.post(reverse('logout'))
+        self.assertRedirects(self.login('guest@example.com', 'n3w-pass'), reverse('index'))
+        self.assertEqual(self.client.session['userID'], user.userID)
+
+    async def test_async_authenticate(self):
+        user = await User.objects.acreate(full_name='Guest', email='guest@example.com',
+                                          password=credentials.hash_password('s3cret'))
+        self.assertEqual(await credentials.aauthenticate('guest@example.com', 's3cret'), user)
+        self.assertIsNone(await credentials.aauthenticate('guest@example.com', 'wrong'))
+
+
+@skipUnless(db_routing.replica_configured(), 'needs DATABASE_REPLICA_URL, see README')
+class ReplicaRoutingTests(TestCase):
+    # The test replica is a separate empty database, so anything read from
+    # it is visibly missing
+    databases = '__all__'
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(full_name='Guest', email='guest@example.com', password='x')
+        venue = Venue.objects.create(venueID='V1', name='Teluk Cempedak', location='Kuantan')
+        self.event = Event.objects.create(name='Beach Run', date=date(2030, 5, 1), venue=venue)
+        session = self.client.session
+        session['userID'] = self.user.userID
+        session.save()
+
+    def starred_events(self):
+        # The user's stars are loaded in the event list view; the events themselves come from the primary
+        user_state.invalidate(self.user.userID)
+        return self.client.get(reverse('event_list')).context['starred_events']
+
+    def test_catalogue_reads_replica_until_user_writes(self):
+        StarredItem.objects.create(userID=self.user, event=self.event)
+        self.assertEqual(self.starred_events(), set())  # from the replica
+
+        response = self.client.get(reverse('star_item', args=['venue', 'V1']))
+        self.assertIn(db_routing.PIN_COOKIE, response.cookies)
+        self.assertEqual(self.starred_events(), {self.event.eventID})  # pinned to the primary
+
+        del self.client.cookies[db_routing.PIN_COOKIE]
+        self.assertEqual(self.starred_events(), set())
+
+    def test_search_reads_replica_index(self):
+        search_index.index_event(self.event)
+        self.assertEqual(list(self.client.get(reverse('search'), {'q': 'beach'}).context['events']), [])
+        with db_routing.primary():
+            self.assertEqual(search_index.search('beach'), [('event', self.event.eventID)])
+
+    def test_other_pages_use_primary(self):
+        Booking.objects.create(user=self.user, event=self.event)
+        self.assertContains(self.client.get(reverse('user_dashboard')), 'Beach Run')
+
+
+@skipUnless(connection.vendor == 'sqlite', 'SQLite only')
+class SqliteTuningTests(TestCase):
+    def test_connection_pragmas_and_immediate_writes(self):
+        self.assertEqual(connection.transaction_mode, 'IMMEDIATE')
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], settings.SQLITE_BUSY_TIMEOUT)
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)  # NORMAL
+
+
+@override_settings(REQUEST_METRICS_SAMPLE_RATE=1, REQUEST_METRICS_FLUSH_SECONDS=0, METRICS_TOKEN='scrape')
+class InstrumentationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        instrumentation.reset()
+        venue = Venue.objects.create(venueID='V1', name='Teluk Cempedak', location='Kuantan')
+        Event.objects.create(name='Beach Run', date=date(2030, 5, 1), venue=venue)
+
+    def test_views_are_measured_and_exported(self):
+        self.client.get(reverse('event_list'))
+        self.client.get(reverse('event_list'))
+        rows = {row['view']: row for row in instrumentation.summary()}
+        self.assertEqual(rows['event_list']['count'], 2)
+        self.assertGreater(rows['event_list']['queries_avg'], 0)
+
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer scrape')
+        self.assertContains(response, 'pahangprism_request_duration_seconds_bucket{view="event_list",le="+Inf"} 2')
+        self.assertContains(response, 'pahangprism_request_duplicate_queries_total{view="event_list"} 0')
+
+        staff = User.objects.create(full_name='Staff', email='staff@example.com', password='x', is_staff=True)
+        session = self.client.session
+        session.update({'userID': staff.userID, 'is_staff': True})
+        session.save()
+        self.assertContains(self.client.get(reverse('admin_dashboard')), '<td>event_list</td>')
+
+    def test_duplicates_and_quantiles(self):
+        queries = [('SELECT 1', '()', 0.002)] * 3 + [('SELECT 2', '()', 0.001)]
+        for duration in (0.02, 0.03, 0.04, 0.3):
+            instrumentation.observe('star_item', duration, queries, 1500)
+        row = instrumentation.summary()[0]
+        self.assertEqual(row['duplicates_avg'], 2)
+        self.assertTrue(3 < row['queries_p95'] <= 5)  # interpolated inside the (3, 5] bucket
+        self.assertTrue(25 <= row['p50_ms'] <= 50)
+        self.assertTrue(250 <= row['p99_ms'] <= 500)
+
+    def test_processes_are_kept_and_expired_ones_dropped(self):
+        instrumentation.observe('star_item', 0.02, [], 1500)
+        other = {'star_item': instrumentation._snapshot()['star_item']}
+        cache.set(instrumentation.SNAPSHOT_KEY.format('other:1'), other)
+        cache.set(instrumentation.PROCESSES_KEY, ['other:1', 'gone:2'])
+        self.assertEqual(instrumentation.collect()['star_item']['count'], 2)  # this process and other:1
+        self.assertEqual(cache.get(instrumentation.PROCESSES_KEY), ['other:1', instrumentation._process_id])
+
+    @override_settings(SLOW_REQUEST_MS=0.001)
+    def test_slow_requests_are_logged_with_sql(self):
+        with self.assertLogs('PahangPrism.slow_requests', 'WARNING') as logs:
+            self.client.get(reverse('venue_list'))
+        self.assertIn('PahangPrism_venue', logs.output[0])
+
+    @override_settings(SLOW_REQUEST_MS=0.001, REQUEST_METRICS_SAMPLE_RATE=0)
+    def test_unsampled_slow_requests_are_logged(self):
+        with self.assertLogs('PahangPrism.slow_requests', 'WARNING') as logs:
+            self.client.get(reverse('venue_list'))
+        self.assertIn('not sampled', logs.output[0])
+        self.assertEqual(instrumentation.summary(), [])
+
+
+class LoadTestTests(TransactionTestCase):
+    # The load test's worker threads only see committed rows
+    def test_seed_replay_and_clear(self):
+        out = io.StringIO()
+        call_command('seed_catalogue', venues=3, events=20, users=5, bookings=30, stars=10, stdout=out)
+        self.assertEqual(Event.objects.count(), 20)
+        self.assertEqual(Booking.objects.count(), 30)
+        self.assertEqual(sum(Event.objects.values_list('booked', flat=True)), 30)
+
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        output = os.path.join(directory, 'run.json')
+        call_command('loadtest', requests=30, concurrency=1, seed=1, output=output, stdout=out)
+        with open(output) as f:
+            results = json.load(f)
+        self.assertEqual(results['requests'], 30)
+        for name, stats in results['endpoints'].items():
+            self.assertEqual(stats['errors'], 0, name)
+
+        call_command('seed_catalogue', clear=True, stdout=out)
+        self.assertFalse(Venue.objects.exists())
+        self.assertFalse(User.objects.exists())
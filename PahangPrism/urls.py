@@ -1,24 +1,33 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import api, async_views, feeds, views
+
+# Under ASGI the read-heavy pages and login are served by their async versions
+read_views = async_views if settings.ASYNC_VIEWS else views
 
 urlpatterns = [
     path('admin-dashboard/', views.admin_dashboard, name='admin_dashboard'),
+    path('admin-dashboard/import/', views.import_catalogue, name='import_catalogue'),
+    path('admin-dashboard/cache-stats/', views.catalogue_cache_stats, name='catalogue_cache_stats'),
+    path('metrics/', views.metrics, name='metrics'),
     path('', views.index, name='index'),
-    path('login/', views.login, name='login'),
+    path('login/', read_views.login, name='login'),
     path('logout/', views.logout, name='logout'),
     path('register/', views.register, name='register'),
-    path('events/', views.event_list, name='event_list'),
-    path('venues/', views.venue_list, name='venue_list'),
-    path('search/', views.search, name='search'),
+    path('events/', read_views.event_list, name='event_list'),
+    path('venues/', read_views.venue_list, name='venue_list'),
+    path('search/', read_views.search, name='search'),
+    path('search/suggest/', views.search_suggest, name='search_suggest'),
     path('starred/', views.starred_list, name='starred_list'),
-    path('booked/', views.booked_events, name='booked_events'),
+    path('booked/', read_views.booked_events, name='booked_events'),
     path('star-item/<str:content_type>/<str:object_id>/', views.star_item, name='star_item'),
     path('book-event/<str:eventID>/', views.book_event, name='book_event'),
     path('cancel-booking/<int:bookingID>/', views.cancel_booking, name='cancel_booking'),
-    path('dashboard/', views.user_dashboard, name='user_dashboard'),
+    path('dashboard/', read_views.user_dashboard, name='user_dashboard'),
     path('update-profile/', views.update_profile, name='update_profile'),
     path('about/', views.about, name='about'),
     path('database-management/', views.admin_database_management, name='admin_database_management'),
+    path('database-management/<str:table>/', views.admin_table, name='admin_table'),
     path('user/edit/<int:userID>/', views.edit_user, name='edit_user'),
     path('user/delete/<int:userID>/', views.delete_user, name='delete_user'),
     path('venue/edit/<str:venueID>/', views.edit_venue, name='edit_venue'),
@@ -27,5 +36,17 @@ urlpatterns = [
     path('event/delete/<str:eventID>/', views.delete_event, name='delete_event'),
     path('booking/edit/<str:bookingID>/', views.edit_booking, name='edit_booking'),
     path('booking/delete/<str:bookingID>/', views.delete_booking, name='delete_booking'),
+    # Read-only JSON API, see api.py
+    path('api/v1/events/', api.events, name='api_events'),
+    path('api/v1/venues/', api.venues, name='api_venues'),
+    path('api/v1/events/nearby/', api.events_nearby, name='api_events_nearby'),
+    path('api/v1/venues/nearby/', api.venues_nearby, name='api_venues_nearby'),
+    path('api/v1/search/', api.search, name='api_search'),
+    path('api/v1/me/bookings/', api.bookings, name='api_bookings'),
+    path('api/v1/me/stars/', api.stars, name='api_stars'),
+    # Calendar feeds, see feeds.py
+    path('feeds/events.ics', feeds.events_ical, name='events_ical'),
+    path('feeds/events.rss', feeds.events_rss, name='events_rss'),
+    path('feeds/bookings/<str:token>.ics', feeds.bookings_ical, name='bookings_ical'),
 ]
 
@@ -0,0 +1,91 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Booking, StarredItem
+
+# Per-user "interaction state": what the user has starred and booked.
+# List pages check every card against these sets, so they are kept as
+# sets in the cache and rebuilt only after the user changes something.
+# Views that write stars or bookings must call invalidate().
+
+EMPTY_STATE = {
+    'starred_events': frozenset(),
+    'starred_venues': frozenset(),
+    'booked_events': frozenset(),
+}
+
+
+def _key(user_id):
+    return f'pahangprism:user-state:{user_id}'
+
+
+def _changed_key(user_id):
+    return f'pahangprism:user-state-changed-at:{user_id}'
+
+
+def load(user_id):
+    starred_events, starred_venues = set(), set()
+    for event_id, venue_id in StarredItem.objects.filter(userID_id=user_id).values_list('event_id', 'venue_id'):
+        if event_id:
+            starred_events.add(event_id)
+        else:
+            starred_venues.add(venue_id)
+    booked_events = set(Booking.objects.filter(user_id=user_id).values_list('event_id', flat=True))
+    return {
+        'starred_events': frozenset(starred_events),
+        'starred_venues': frozenset(starred_venues),
+        'booked_events': frozenset(booked_events),
+    }
+
+
+async def aload(user_id):
+    starred_events, starred_venues = set(), set()
+    async for event_id, venue_id in StarredItem.objects.filter(userID_id=user_id).values_list('event_id', 'venue_id'):
+        if event_id:
+            starred_events.add(event_id)
+        else:
+            starred_venues.add(venue_id)
+    booked_events = {event_id async for event_id in Booking.objects.filter(user_id=user_id).values_list('event_id', flat=True)}
+    return {
+        'starred_events': frozenset(starred_events),
+        'starred_venues': frozenset(starred_venues),
+        'booked_events': frozenset(booked_events),
+    }
+
+
+def get_state(user_id):
+    if not user_id:
+        return EMPTY_STATE
+    state = cache.get(_key(user_id))
+    if state is None:
+        state = load(user_id)
+        cache.set(_key(user_id), state, getattr(settings, 'USER_STATE_CACHE_TIMEOUT', 300))
+    return state
+
+
+async def aget_state(user_id):
+    if not user_id:
+        return EMPTY_STATE
+    state = await cache.aget(_key(user_id))
+    if state is None:
+        state = await aload(user_id)
+        await cache.aset(_key(user_id), state, getattr(settings, 'USER_STATE_CACHE_TIMEOUT', 300))
+    return state
+
+
+def changed_at(user_id):
+    # Unix time of the user's last star or booking change, for the API's
+    # ETag and Last-Modified headers; "now" if the key was lost
+    changed = cache.get(_changed_key(user_id))
+    if changed is None:
+        cache.add(_changed_key(user_id), time.time(), None)
+        changed = cache.get(_changed_key(user_id))
+    return changed
+
+
+def invalidate(user_id):
+    if user_id:
+        cache.delete(_key(user_id))
+        cache.set(_changed_key(user_id), time.time(), None)
@@ -1,16 +1,24 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
-from .models import Venue, Event, StarredItem, User, Booking
-from django.http import JsonResponse
-from django.core.files.storage import default_storage
-from django.core.files.base import ContentFile
+from .models import Venue, Event, StarredItem, User, Booking, WaitlistEntry
+from django.http import JsonResponse, Http404, HttpResponse, HttpResponseBadRequest, HttpResponseForbidden
 from django.conf import settings
-import os
+import io
 from django.contrib.auth.decorators import login_required, user_passes_test
+from django.db import IntegrityError, connections, router, transaction
 from django.db.models import Q
 from .forms import UserProfileForm
-from django.contrib.auth.hashers import make_password
 from django.core.exceptions import ValidationError
+from django.views.static import serve
+from django.utils.cache import patch_cache_control
+from django.utils.crypto import constant_time_compare
+from . import (catalogue_cache, credentials, event_listing, feeds, geo, images, instrumentation, search_index,
+               stats, suggest, task_queue, tasks, user_state)
+from . import booking as booking_engine
+from .catalogue_cache import cache_anonymous_page
+from .db_routing import read_from_replica
+from .catalogue_import import CatalogueImporter, detect_format
+from .pagination import InvalidCursor, keyset_page, page_size
 
 def search_item(request):
     if request.method == 'GET':
@@ -30,11 +38,16 @@ def search_item(request):
             return render(request, 'search_item.html', {'error': 'Item not found'})
 
 
+@cache_anonymous_page('index', vary_on=stats.refreshed_at)
+@read_from_replica
 def index(request):
-    context = {}
-    if request.session.get('userID'):
-        user = User.objects.get(userID=request.session['userID'])
-        context['user_full_name'] = user.full_name
+    # Trending lists come from the precomputed scores (see stats.py)
+    context = {
+        'trending_events': stats.trending_events(),
+        'trending_venues': stats.trending_venues(),
+    }
+    if request.pahang_user:
+        context['user_full_name'] = request.pahang_user.full_name
     return render(request, 'index.html', context)
 
 
@@ -48,7 +61,7 @@ def register(request):
             messages.error(request, 'Email already exists!')
             return redirect('register')
 
-        new_user = User(full_name=full_name, email=email, password=password)
+        new_user = User(full_name=full_name, email=email, password=credentials.hash_password(password))
         new_user.save()
         messages.success(request, 'Account created successfully! Please log in.')
         return redirect('login')
@@ -63,8 +76,8 @@ def login(request):
         email = request.POST['email']
         password = request.POST['password']
 
-        try:
-            user = User.objects.get(email=email, password=password)
+        user = credentials.authenticate(email, password)
+        if user is not None:
             request.session['userID'] = user.userID
             request.session['is_staff'] = user.is_staff
             messages.success(request, 'You are now logged in.')
@@ -74,8 +87,7 @@ def login(request):
             if next_url:
                 return redirect(next_url)
             return redirect('index')
-        except User.DoesNotExist:
-            messages.error(request, 'Invalid email or password.')
+        messages.error(request, 'Invalid email or password.')
 
     return render(request, 'login.html')
 
@@ -90,32 +102,30 @@ def logout(request):
         return redirect('index')
 
 
+@cache_anonymous_page('event_list', vary_on=catalogue_cache.get_counters_version)
+@read_from_replica
 def event_list(request):
-    events = Event.objects.all().order_by('date')  # Fetch all events, ordered by date
-    userID = request.session.get('userID')
-    starred_events = []
-    if userID:
-        starred_events = StarredItem.objects.filter(userID_id=userID, content_type='event').values_list('object_id', flat=True)
-    
-    context = {
-        'events': events,
-        'starred_events': starred_events
-    }
-    return render(request, 'event_list.html', context)
+    # One keyset page of the date window; cached until the catalogue or its counters change
+    try:
+        filters = event_listing.parse_filters(request.GET)
+        events, next_cursor = event_listing.get_page(filters, request.GET.get('cursor'), request.GET.get('limit'))
+    except (event_listing.InvalidFilter, InvalidCursor):
+        return HttpResponseBadRequest('Invalid filter or cursor')
+    state = user_state.get_state(request.session.get('userID'))
+    return event_listing.response(request, filters, events, next_cursor, state, event_listing.venue_choices())
+
+
+@cache_anonymous_page('venue_list')
+@read_from_replica
+def venue_list(request):
+    venues = catalogue_cache.cached('venues', lambda: list(Venue.objects.all()))
 
+    # Starred venues of the logged in PahangPrism user (not request.user, which is contrib.auth)
+    state = user_state.get_state(request.session.get('userID'))
 
-def venue_list(request):
-    venues = Venue.objects.all()
-    
-    # If the user is logged in, get their starred venues
-    starred_venues = []
-    if request.user.is_authenticated:
-        starred_items = StarredItem.objects.filter(userID=request.user, content_type='venue')
-        starred_venues = [item.object_id for item in starred_items]
-    
     context = {
         'venues': venues,
-        'starred_venues': starred_venues
+        'starred_venues': state['starred_venues'],
     }
     return render(request, 'venue_list.html', context)
 
@@ -123,12 +133,24 @@ def venue_list(request):
 def star_item(request, content_type, object_id):
     userID = request.session.get('userID')
     if userID:
-        starred_item = StarredItem.objects.filter(userID_id=userID, content_type=content_type, object_id=object_id).first()
-
-        if starred_item:
-            starred_item.delete()  # Unstar the item
-        else:
-            StarredItem.objects.create(userID_id=userID, content_type=content_type, object_id=object_id)
+        if content_type not in ('event', 'venue'):
+            raise Http404
+        target = {f'{content_type}_id': object_id}
+        # The star and the item's star_count change together
+        with transaction.atomic():
+            unstarred, _ = StarredItem.objects.filter(userID_id=userID, **target).delete()
+            if unstarred:
+                stats.count_star(content_type, object_id, -1)
+            else:
+                get_object_or_404(Event if content_type == 'event' else Venue, pk=object_id)
+                try:
+                    with transaction.atomic():
+                        StarredItem.objects.create(userID_id=userID, **target)
+                except IntegrityError:
+                    pass  # Starred by a concurrent request (a double submit), which counted it
+                else:
+                    stats.count_star(content_type, object_id, 1)
+        user_state.invalidate(userID)
 
         return redirect('starred_list')
     return redirect('login')
@@ -137,11 +159,10 @@ def star_item(request, content_type, object_id):
 def starred_list(request):
     userID = request.session.get('userID')
     if userID:
-        starred_items = StarredItem.objects.filter(userID_id=userID)
-
-        # Retrieve starred venues and events
-        venues = Venue.objects.filter(venueID__in=[item.object_id for item in starred_items if item.content_type == 'venue'])
-        events = Event.objects.filter(eventID__in=[item.object_id for item in starred_items if item.content_type == 'event'])
+        # One joined query for both kinds of starred item
+        starred_items = StarredItem.objects.filter(userID_id=userID).select_related('event', 'venue')
+        venues = [item.venue for item in starred_items if item.venue_id]
+        events = [item.event for item in starred_items if item.event_id]
 
         return render(request, 'starred_list.html', {'venues': venues, 'events': events})
     return redirect('login')
@@ -155,14 +176,19 @@ def book_event(request, eventID):
     event = get_object_or_404(Event, eventID=eventID)
     user_id = request.session['userID']
 
-    # Check if the user has already booked this event
-    if Booking.objects.filter(user_id=user_id, event=event).exists():
+    # Reserve a seat atomically; full events put the user on the waitlist
+    outcome = booking_engine.book(user_id, event.eventID)
+    user_state.invalidate(user_id)
+
+    if outcome == booking_engine.ALREADY_BOOKED:
         messages.error(request, 'You have already booked this event.')
         return redirect('event_list')
-
-    # Create a new booking
-    Booking.objects.create(user_id=user_id, event=event)
-    messages.success(request, f'You have successfully booked {event.name}.')
+    if outcome == booking_engine.WAITLISTED:
+        messages.info(request, f'{event.name} is fully booked. You have been added to the waitlist.')
+    elif outcome == booking_engine.ALREADY_WAITLISTED:
+        messages.info(request, f'You are already on the waitlist for {event.name}.')
+    else:
+        messages.success(request, f'You have successfully booked {event.name}.')
     return redirect('booked_events')
 
 
@@ -173,7 +199,9 @@ def booked_events(request):
         return redirect('login')
     
     bookings = Booking.objects.filter(user_id=userID).select_related('event')
-    return render(request, 'booked_events.html', {'bookings': bookings})
+    waitlist = WaitlistEntry.objects.filter(user_id=userID).select_related('event').order_by('created_at')
+    context = {'bookings': bookings, 'waitlist': waitlist, 'calendar_url': feeds.bookings_url(request, userID)}
+    return render(request, 'booked_events.html', context)
 
 
 def cancel_booking(request, bookingID):
@@ -181,18 +209,28 @@ def cancel_booking(request, bookingID):
         messages.error(request, 'You must be logged in to cancel a booking.')
         return redirect('login')
 
-    booking = get_object_or_404(Booking, bookingID=bookingID, user_id=request.session['userID'])
+    booking = get_object_or_404(Booking.objects.select_related('event'), bookingID=bookingID, user_id=request.session['userID'])
     event_name = booking.event.name
-    booking.delete()
+    promoted_user_id = booking_engine.cancel(booking)
+    user_state.invalidate(booking.user_id)
+    user_state.invalidate(promoted_user_id)
     messages.success(request, f'Your booking for {event_name} has been cancelled.')
     return redirect('booked_events')
 
+@read_from_replica
 def search(request):
     query = request.GET.get('q')
     events = []
     venues = []
-    if query:
-        events = Event.objects.filter(
+    # The index is read through the same database as the models, i.e. the replica if there is one
+    conn = connections[router.db_for_read(Event)]
+    if query and search_index.is_supported(conn):
+        # Ranked lookup through the FTS5 / tsvector index
+        hits = search_index.search(query, conn=conn)
+        events = search_index.ranked(Event.objects.select_related('venue'), [pk for kind, pk in hits if kind == 'event'])
+        venues = search_index.ranked(Venue.objects.all(), [pk for kind, pk in hits if kind == 'venue'])
+    elif query:
+        events = Event.objects.select_related('venue').filter(
             Q(name__icontains=query) |
             Q(venue__name__icontains=query)
         )
@@ -201,23 +239,33 @@ def search(request):
             Q(location__icontains=query)
         )
     
-    starred_venues = request.session.get('starred_venues', [])
-    
+    state = user_state.get_state(request.session.get('userID'))
+
     context = {
         'query': query,
         'events': events,
         'venues': venues,
-        'starred_venues': starred_venues,
+        'starred_venues': state['starred_venues'],
+        'booked_events': state['booked_events'],
     }
     return render(request, 'search.html', context)
 
+def search_suggest(request):
+    # Typeahead for the search box: names and places starting with ?q=, from
+    # the in-memory index in suggest.py, so no query per keystroke
+    query = request.GET.get('q', '')[:100]
+    limit = min(page_size(request.GET.get('limit'), suggest.DEFAULT_LIMIT), suggest.MAX_LIMIT)
+    response = JsonResponse({'query': query, 'suggestions': suggest.suggest(query, limit)})
+    patch_cache_control(response, public=True, max_age=60)
+    return response
+
 def user_dashboard(request):
-    if not request.session.get('userID'):
+    user = request.pahang_user
+    if not user:
         messages.error(request, 'You must be logged in to view your dashboard.')
         return redirect('login')
     
-    user = User.objects.get(userID=request.session['userID'])
-    bookings = Booking.objects.filter(user=user).select_related('event', 'event__venue')
+    bookings = Booking.objects.filter(user_id=user.userID).select_related('event', 'event__venue')
     
     context = {
         'user': user,
@@ -226,19 +274,20 @@ def user_dashboard(request):
     return render(request, 'user_dashboard.html', context)
 
 def update_profile(request):
-    if not request.session.get('userID'):
+    if not request.pahang_user:
         messages.error(request, 'You must be logged in to update your profile.')
         return redirect('login')
     
     if request.method == 'POST':
-        user = User.objects.get(userID=request.session['userID'])
+        # A full row, since the cached identity leaves out the password
+        user = User.objects.get(userID=request.pahang_user.userID)
         user.full_name = request.POST.get('full_name')
         user.email = request.POST.get('email')
         
         new_password = request.POST.get('new_password')
         if new_password:
             if new_password == request.POST.get('confirm_password'):
-                user.password = make_password(new_password)
+                user.password = credentials.hash_password(new_password)
             else:
                 messages.error(request, 'Passwords do not match.')
                 return redirect('user_dashboard')
@@ -254,6 +303,7 @@ def update_profile(request):
     
     return redirect('index')
 
+@cache_anonymous_page('about')
 def about(request):
     return render(request, 'about.html')
 
@@ -262,18 +312,27 @@ def admin_dashboard(request):
         messages.error(request, 'You must be logged in as staff to access the admin dashboard.')
         return redirect('login')
     
-    venues = Venue.objects.all()
+    venues = Venue.objects.only('venueID', 'name').order_by('name')
     
     if request.method == 'POST':
         if 'add_event' in request.POST:
             name = request.POST['event_name']
             date = request.POST['event_date']
             venue_id = request.POST.get('event_venue')
+            capacity = request.POST.get('event_capacity')
+            image = request.FILES.get('event_image')
             
             try:
+                capacity = booking_engine.parse_capacity(capacity)
+                if image:
+                    images.check(image)
                 venue = Venue.objects.get(venueID=venue_id)
-                Event.objects.create(name=name, date=date, venue=venue)
+                event = Event.objects.create(name=name, date=date, venue=venue, capacity=capacity)
+                if image:
+                    images.attach(event, image)
                 messages.success(request, 'Event added successfully!')
+            except (booking_engine.InvalidCapacity, images.InvalidImage) as e:
+                messages.error(request, f'Event not added: {e}.')
             except Venue.DoesNotExist:
                 messages.error(request, f'Selected venue (ID: {venue_id}) does not exist. Please choose a valid venue.')
         
@@ -282,19 +341,70 @@ def admin_dashboard(request):
             name = request.POST['venue_name']
             location = request.POST['venue_location']
             image = request.FILES.get('venue_image')
+            try:
+                latitude, longitude = geo.parse_coordinates(request.POST.get('venue_latitude'),
+                                                            request.POST.get('venue_longitude'))
+                if image:
+                    images.check(image)
+            except (geo.InvalidLocation, images.InvalidImage) as e:
+                messages.error(request, f'Venue not added: {e}.')
+                return redirect('admin_dashboard')
             
-            image_path = 'default_venue_image.jpg'
+            venue = Venue.objects.create(venueID=venueID, name=name, location=location,
+                                         latitude=latitude, longitude=longitude)
             if image:
-                file_name = f"venue_{venueID}_{image.name}"
-                path = default_storage.save(f'venue_images/{file_name}', ContentFile(image.read()))
-                image_path = os.path.join('venue_images', file_name)
-            
-            Venue.objects.create(venueID=venueID, name=name, location=location, image_path=image_path)
+                # The original is stored now; the worker builds the resized variants
+                images.attach(venue, image)
             messages.success(request, 'Venue added successfully!')
         
         return redirect('admin_dashboard')
     
-    return render(request, 'admin_dashboard.html', {'venues': venues})
+    context = {
+        'venues': venues,
+        'performance': instrumentation.summary(),
+        'sample_rate': settings.REQUEST_METRICS_SAMPLE_RATE,
+        'task_counts': task_queue.counts(),
+    }
+    return render(request, 'admin_dashboard.html', context)
+
+def import_catalogue(request):
+    if not request.session.get('userID') or not request.session.get('is_staff'):
+        messages.error(request, 'You must be logged in as staff to access the admin dashboard.')
+        return redirect('login')
+
+    if request.method == 'POST' and request.FILES.get('catalogue_file'):
+        upload = request.FILES['catalogue_file']
+        dry_run = request.POST.get('dry_run') == 'on'
+        importer = CatalogueImporter(dry_run=dry_run, default_type=request.POST.get('row_type') or None)
+        # Wrap the upload so rows are decoded and parsed as they are read;
+        # utf-8-sig drops the BOM Excel writes at the start of a CSV
+        stream = io.TextIOWrapper(upload.file, encoding='utf-8-sig', newline='')
+        result = importer.run(stream, detect_format(upload.name))
+
+        for error in result.errors[:10]:
+            messages.error(request, error)
+        prefix = 'Dry run: ' if dry_run else 'Imported '
+        if result.error_count:
+            messages.warning(request, prefix + result.summary())
+        else:
+            messages.success(request, prefix + result.summary())
+    else:
+        messages.error(request, 'Please choose a CSV or JSONL file to import.')
+
+    return redirect('admin_dashboard')
+
+def metrics(request):
+    # Prometheus text format
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    authorized = token and constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}')
+    if not authorized and not (request.session.get('userID') and request.session.get('is_staff')):
+        return HttpResponseForbidden()
+    return HttpResponse(instrumentation.prometheus_text(), content_type='text/plain; version=0.0.4')
+
+def catalogue_cache_stats(request):
+    if not request.session.get('userID') or not request.session.get('is_staff'):
+        return HttpResponseForbidden()
+    return JsonResponse(catalogue_cache.stats())
 
 def is_staff(user):
     return user.is_staff
@@ -304,18 +414,72 @@ def admin_database_management(request):
         messages.error(request, 'You must be logged in as staff to access this page.')
         return redirect('login')
 
-    users = User.objects.all()
-    venues = Venue.objects.all()
-    events = Event.objects.all()
-    bookings = Booking.objects.all()
+    # The page is only a shell; each table is fetched from admin_table on demand
+    return render(request, 'admin_database_management.html')
+
+
+# Table definitions for admin_table: base queryset, sortable columns
+# (URL key -> field) and the fields the filter box searches
+ADMIN_TABLES = {
+    'users': {
+        'queryset': lambda: User.objects.all(),
+        'pk': 'userID',
+        'sort': {'id': 'userID', 'name': 'full_name', 'email': 'email'},
+        'filter': ['full_name', 'email'],
+    },
+    'venues': {
+        'queryset': lambda: Venue.objects.all(),
+        'pk': 'venueID',
+        'sort': {'id': 'venueID', 'name': 'name', 'location': 'location'},
+        'filter': ['venueID', 'name', 'location'],
+    },
+    'events': {
+        'queryset': lambda: Event.objects.select_related('venue'),
+        'pk': 'eventID',
+        'sort': {'id': 'eventID', 'name': 'name', 'date': 'date', 'venue': 'venue__name'},
+        'filter': ['eventID', 'name', 'venue__name'],
+    },
+    'bookings': {
+        'queryset': lambda: Booking.objects.select_related('user', 'event'),
+        'pk': 'bookingID',
+        'sort': {'id': 'bookingID', 'user': 'user__full_name', 'event': 'event__name', 'date': 'booking_date'},
+        'filter': ['user__full_name', 'user__email', 'event__name'],
+    },
+}
+
+
+def admin_table(request, table):
+    if not request.session.get('userID') or not request.session.get('is_staff'):
+        return HttpResponseForbidden()
+    if table not in ADMIN_TABLES:
+        raise Http404
 
-    context = {
-        'users': users,
-        'venues': venues,
-        'events': events,
-        'bookings': bookings,
-    }
-    return render(request, 'admin_database_management.html', context)
+    config = ADMIN_TABLES[table]
+    queryset = config['queryset']()
+    query = request.GET.get('q', '').strip()
+    if query:
+        condition = Q()
+        for field in config['filter']:
+            condition |= Q(**{f'{field}__icontains': query})
+        queryset = queryset.filter(condition)
+
+    sort_field = config['sort'].get(request.GET.get('sort'), config['pk'])
+    fields = [sort_field] if sort_field == config['pk'] else [sort_field, config['pk']]
+    try:
+        rows, next_cursor = keyset_page(
+            queryset,
+            fields,
+            cursor=request.GET.get('cursor'),
+            limit=page_size(request.GET.get('limit')),
+            descending=request.GET.get('dir') == 'desc',
+        )
+    except InvalidCursor:
+        return HttpResponseBadRequest('Invalid cursor')
+
+    response = render(request, 'admin_table_rows.html', {'table': table, 'rows': rows})
+    if next_cursor:
+        response['X-Next-Cursor'] = next_cursor
+    return response
 
 def edit_user(request, userID):
     if not request.session.get('userID') or not request.session.get('is_staff'):
@@ -340,7 +504,13 @@ def delete_user(request, userID):
     
     user = get_object_or_404(User, userID=userID)
     if request.method == 'POST':
-        user.delete()
+        with transaction.atomic():
+            promoted = booking_engine.cancel_all(user.userID)
+            stats.uncount_stars(user.userID)
+            user.delete()
+        user_state.invalidate(user.userID)
+        for promoted_user_id in promoted:
+            user_state.invalidate(promoted_user_id)
         messages.success(request, f'User {user.full_name} has been deleted successfully.')
         return redirect('admin_database_management')
     return render(request, 'confirm_delete.html', {'item': user, 'item_type': 'User'})
@@ -352,18 +522,20 @@ def edit_venue(request, venueID):
     
     venue = get_object_or_404(Venue, venueID=venueID)
     if request.method == 'POST':
+        try:
+            venue.latitude, venue.longitude = geo.parse_coordinates(request.POST.get('latitude'),
+                                                                    request.POST.get('longitude'))
+            if 'image' in request.FILES:
+                images.check(request.FILES['image'])
+        except (geo.InvalidLocation, images.InvalidImage) as e:
+            messages.error(request, f'Venue not updated: {e}.')
+            return render(request, 'edit_venue.html', {'venue': venue})
         venue.name = request.POST.get('name')
         venue.location = request.POST.get('location')
-        if 'image' in request.FILES:
-            image = request.FILES['image']
-            file_name = f"venue_{venueID}_{image.name}"
-            # Delete the old image if it exists
-            if venue.image_path and os.path.isfile(os.path.join(settings.MEDIA_ROOT, venue.image_path)):
-                os.remove(os.path.join(settings.MEDIA_ROOT, venue.image_path))
-            # Save the new image
-            path = default_storage.save(f'venue_images/{file_name}', ContentFile(image.read()))
-            venue.image_path = path
         venue.save()
+        if 'image' in request.FILES:
+            # Replaces the old image and deletes its files
+            images.attach(venue, request.FILES['image'])
         messages.success(request, f'Venue {venue.name} has been updated successfully.')
         return redirect('admin_database_management')
     return render(request, 'edit_venue.html', {'venue': venue})
@@ -386,12 +558,24 @@ def edit_event(request, eventID):
         return redirect('login')
     
     event = get_object_or_404(Event, eventID=eventID)
-    venues = Venue.objects.all()
+    venues = Venue.objects.only('venueID', 'name').order_by('name')
     if request.method == 'POST':
+        try:
+            capacity = booking_engine.parse_capacity(request.POST.get('capacity'))
+            if 'image' in request.FILES:
+                images.check(request.FILES['image'])
+        except (booking_engine.InvalidCapacity, images.InvalidImage) as e:
+            messages.error(request, f'Event not updated: {e}.')
+            return render(request, 'edit_event.html', {'event': event, 'venues': venues})
         event.name = request.POST.get('name')
         event.date = request.POST.get('date')
         event.venue = get_object_or_404(Venue, venueID=request.POST.get('venue'))
-        event.save()
+        event.capacity = capacity
+        event.save(update_fields=['name', 'date', 'venue', 'capacity'])
+        if 'image' in request.FILES:
+            images.attach(event, request.FILES['image'])
+        # Extra seats go to the waitlist first
+        tasks.fill_waitlist.enqueue(event_id=event.eventID)
         messages.success(request, f'Event {event.name} has been updated successfully.')
         return redirect('admin_database_management')
     return render(request, 'edit_event.html', {'event': event, 'venues': venues})
@@ -414,12 +598,17 @@ def edit_booking(request, bookingID):
         return redirect('login')
     
     booking = get_object_or_404(Booking, bookingID=bookingID)
-    users = User.objects.all()
-    events = Event.objects.all()
+    # Dropdowns only need the ID and the label
+    users = User.objects.only('userID', 'full_name').order_by('full_name')
+    events = Event.objects.only('eventID', 'name').order_by('name')
     if request.method == 'POST':
+        previous_user_id = booking.user_id
         booking.user = get_object_or_404(User, userID=request.POST.get('user'))
-        booking.event = get_object_or_404(Event, eventID=request.POST.get('event'))
-        booking.save()
+        event = get_object_or_404(Event, eventID=request.POST.get('event'))
+        promoted_user_id = booking_engine.move(booking, event.eventID)
+        user_state.invalidate(previous_user_id)
+        user_state.invalidate(booking.user_id)
+        user_state.invalidate(promoted_user_id)
         messages.success(request, f'Booking {booking.bookingID} has been updated successfully.')
         return redirect('admin_database_management')
     return render(request, 'edit_booking.html', {'booking': booking, 'users': users, 'events': events})
@@ -431,11 +620,17 @@ def delete_booking(request, bookingID):
     
     booking = get_object_or_404(Booking, bookingID=bookingID)
     if request.method == 'POST':
-        booking.delete()
+        promoted_user_id = booking_engine.cancel(booking)
+        user_state.invalidate(booking.user_id)
+        user_state.invalidate(promoted_user_id)
         messages.success(request, f'Booking {booking.bookingID} has been deleted successfully.')
         return redirect('admin_database_management')
     return render(request, 'confirm_delete.html', {'item': booking, 'item_type': 'Booking'})
 
-
-
-
+def serve_media(request, path):
+    # Uploaded media. Processed images have content-hashed names, so they
+    # can be cached by browsers and CDNs for a year without revalidation.
+    response = serve(request, path, document_root=settings.MEDIA_ROOT)
+    if path.startswith(f'{images.IMAGE_ROOT}/'):
+        response['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
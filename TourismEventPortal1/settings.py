@@ -44,13 +44,17 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    # Directly after SecurityMiddleware so static requests skip the rest
+    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'PahangPrism.instrumentation.RequestMetricsMiddleware',
+    'PahangPrism.db_routing.ReplicaPinMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
+    'PahangPrism.identity.IdentityMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
 ]
 
 ROOT_URLCONF = 'TourismEventPortal1.urls'
@@ -72,6 +76,11 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'TourismEventPortal1.wsgi.application'
+ASGI_APPLICATION = 'TourismEventPortal1.asgi.application'
+
+# Set DJANGO_ASGI=True when serving through asgi.py (see gunicorn.conf.py).
+# The read-heavy pages then use the async views in PahangPrism/async_views.py.
+ASYNC_VIEWS = os.environ.get('DJANGO_ASGI', '') == 'True'
 
 
 # Database
@@ -85,6 +94,79 @@ DATABASES = {
 }
 
 
+def database_from_url(url):
+    # DATABASE_POOL=True gives each process a psycopg connection pool on
+    # Postgres. Otherwise connections persist between requests and are
+    # health-checked before reuse (Django can't combine the two).
+    pooled = os.environ.get('DATABASE_POOL', '') == 'True'
+    config = dj_database_url.parse(url, conn_max_age=0 if pooled else 600, conn_health_checks=not pooled)
+    if pooled and config['ENGINE'] == 'django.db.backends.postgresql':
+        config.setdefault('OPTIONS', {})['pool'] = {
+            'min_size': int(os.environ.get('DATABASE_POOL_MIN_SIZE', '2')),
+            'max_size': int(os.environ.get('DATABASE_POOL_MAX_SIZE', '10')),
+        }
+    return config
+
+
+if os.environ.get('DATABASE_URL'):
+    DATABASES['default'] = database_from_url(os.environ['DATABASE_URL'])
+
+# Optional read replica for the catalogue pages (see PahangPrism/db_routing.py).
+# Two SQLite files work for local testing, e.g. sqlite:///replica.sqlite3
+if os.environ.get('DATABASE_REPLICA_URL'):
+    DATABASES['replica'] = database_from_url(os.environ['DATABASE_REPLICA_URL'])
+
+# SQLite in production: WAL lets readers run alongside the single writer,
+# write transactions take the write lock up front (BEGIN IMMEDIATE) so they
+# queue on the busy timeout instead of failing with "database is locked"
+# when upgrading from a read, and synchronous=NORMAL is durable under WAL
+# except for the last commits on power loss. Run `manage.py sqlite_checkpoint`
+# periodically to keep the WAL file small.
+SQLITE_BUSY_TIMEOUT = int(os.environ.get('SQLITE_BUSY_TIMEOUT', '5000'))  # ms
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': SQLITE_BUSY_TIMEOUT,
+    'mmap_size': int(os.environ.get('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024))),
+    'cache_size': -int(os.environ.get('SQLITE_CACHE_KB', str(64 * 1024))),  # negative means KiB
+    'temp_store': 'MEMORY',
+}
+
+for database in DATABASES.values():
+    if database['ENGINE'] == 'django.db.backends.sqlite3':
+        database.setdefault('OPTIONS', {}).update({
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': SQLITE_BUSY_TIMEOUT / 1000,
+            'init_command': ';'.join(f'PRAGMA {name}={value}' for name, value in SQLITE_PRAGMAS.items()),
+        })
+
+DATABASE_ROUTERS = ['PahangPrism.db_routing.ReplicaRouter']
+
+# Seconds a user's reads stay on the primary after they write, so they
+# see their own changes while the replica catches up
+REPLICA_PIN_SECONDS = int(os.environ.get('REPLICA_PIN_SECONDS', '10'))
+
+
+# Password hashing (see PahangPrism/credentials.py).
+# New hashes use the first hasher; hashes from the others still verify and
+# are rewritten with the first on the next login.
+PASSWORD_HASHERS = [
+    'PahangPrism.hashers.TunedArgon2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+]
+if os.environ.get('PASSWORD_HASHER') == 'pbkdf2':
+    PASSWORD_HASHERS.insert(0, PASSWORD_HASHERS.pop(1))
+
+# Argon2 cost per hash (see PahangPrism/hashers.py); memory is in KiB
+ARGON2_TIME_COST = int(os.environ.get('ARGON2_TIME_COST', '2'))
+ARGON2_MEMORY_COST = int(os.environ.get('ARGON2_MEMORY_COST', '19456'))
+ARGON2_PARALLELISM = int(os.environ.get('ARGON2_PARALLELISM', '1'))
+
+# Threads per process that run password hashing; concurrent logins beyond this queue
+PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', '2'))
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -122,6 +204,28 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 
 STATIC_URL = '/static/'
 
+STATICFILES_FINDERS = [
+    'django.contrib.staticfiles.finders.FileSystemFinder',
+    'django.contrib.staticfiles.finders.AppDirectoriesFinder',
+    'PahangPrism.assets.BundleFinder',
+]
+
+# Where BundleFinder writes the concatenated CSS bundles (see PahangPrism/assets.py)
+CSS_BUNDLE_ROOT = BASE_DIR / 'build' / 'static'
+
+# In production collectstatic writes content-hashed copies of every file plus
+# .gz and .br versions, and whitenoise serves the hashed names with a
+# far-future immutable Cache-Control header
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': ('django.contrib.staticfiles.storage.StaticFilesStorage' if DEBUG
+                    else 'whitenoise.storage.CompressedManifestStaticFilesStorage'),
+    },
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
@@ -132,5 +236,77 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
-db_from_env = dj_database_url.config(conn_max_age=500)
-DATABASES['default'].update(db_from_env)
\ No newline at end of file
+# Cache
+# Local memory by default, which only suits a single process: catalogue
+# versions live in the cache, so a change made in one process is not seen
+# by the others. Set REDIS_URL when running more than one gunicorn worker or
+# the task worker; both warn at startup otherwise.
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'pahangprism',
+        }
+    }
+
+# Seconds cached catalogue pages and lists live (see PahangPrism/catalogue_cache.py).
+# Edits bump the catalogue version, so with a shared cache this only bounds
+# memory use; with a per-process one it is how stale other processes can get.
+CATALOGUE_CACHE_TIMEOUT = int(os.environ.get('CATALOGUE_CACHE_TIMEOUT', '3600'))
+
+# Seconds a user's starred/booked ID sets stay cached (see PahangPrism/user_state.py)
+USER_STATE_CACHE_TIMEOUT = int(os.environ.get('USER_STATE_CACHE_TIMEOUT', '300'))
+
+# Sessions are read from the cache and written through to the database, so
+# a warm request does no session query. Set SESSION_ENGINE to
+# django.contrib.sessions.backends.signed_cookies to keep them client side.
+SESSION_ENGINE = os.environ.get('SESSION_ENGINE', 'django.contrib.sessions.backends.cached_db')
+
+# Seconds the logged in user's row stays cached (see PahangPrism/identity.py)
+IDENTITY_CACHE_TIMEOUT = int(os.environ.get('IDENTITY_CACHE_TIMEOUT', '300'))
+
+# Request metrics (see PahangPrism/instrumentation.py): the fraction of
+# requests measured, how often each process publishes its totals, and the
+# wall time in ms above which any request is logged, with its SQL if it was
+# sampled (0 = off).
+# /metrics/ is open to staff sessions, or to scrapers sending
+# "Authorization: Bearer <METRICS_TOKEN>".
+REQUEST_METRICS_SAMPLE_RATE = float(os.environ.get('REQUEST_METRICS_SAMPLE_RATE', '0.1'))
+REQUEST_METRICS_FLUSH_SECONDS = int(os.environ.get('REQUEST_METRICS_FLUSH_SECONDS', '10'))
+SLOW_REQUEST_MS = int(os.environ.get('SLOW_REQUEST_MS', '1000'))
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+# Event IDs reserved per worker process at a time (see PahangPrism/sequences.py).
+# 1 keeps IDs gap-free; larger blocks skip the counter row on most inserts.
+SEQUENCE_BLOCK_SIZE = int(os.environ.get('SEQUENCE_BLOCK_SIZE', '1'))
+
+# Background tasks (see PahangPrism/task_queue.py), run by `manage.py run_tasks`.
+# Failed tasks are retried TASKS_MAX_ATTEMPTS times in all, waiting
+# TASKS_BACKOFF_SECONDS * 2^(attempt - 1) (at most TASKS_BACKOFF_MAX) between
+# tries; a task still running after TASKS_LEASE_SECONDS is assumed lost and
+# run again. TASKS_EAGER=True runs tasks in the web process after commit,
+# for development without a worker.
+TASKS_EAGER = os.environ.get('TASKS_EAGER', '') == 'True'
+TASKS_MAX_ATTEMPTS = int(os.environ.get('TASKS_MAX_ATTEMPTS', '5'))
+TASKS_BACKOFF_SECONDS = float(os.environ.get('TASKS_BACKOFF_SECONDS', '5'))
+TASKS_BACKOFF_MAX = float(os.environ.get('TASKS_BACKOFF_MAX', '3600'))
+TASKS_LEASE_SECONDS = int(os.environ.get('TASKS_LEASE_SECONDS', '600'))
+
+# Trending scores on the home page (see PahangPrism/stats.py): a day's
+# bookings and stars count half as much every TRENDING_HALF_LIFE_DAYS, and
+# the run_tasks worker recomputes the scores every TRENDING_REFRESH_SECONDS.
+TRENDING_HALF_LIFE_DAYS = float(os.environ.get('TRENDING_HALF_LIFE_DAYS', '3'))
+TRENDING_REFRESH_SECONDS = int(os.environ.get('TRENDING_REFRESH_SECONDS', '600'))
+
+# Search box suggestions (see PahangPrism/suggest.py) come from an in-memory
+# index in each process holding at most SUGGEST_MAX_TERMS names, rebuilt
+# after catalogue changes but not more often than every SUGGEST_REBUILD_SECONDS.
+SUGGEST_MAX_TERMS = int(os.environ.get('SUGGEST_MAX_TERMS', '50000'))
+SUGGEST_REBUILD_SECONDS = float(os.environ.get('SUGGEST_REBUILD_SECONDS', '60'))
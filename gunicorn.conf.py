@@ -0,0 +1,40 @@
+# Gunicorn settings, picked up automatically from the working directory.
+#
+# Default (sync) profile:  gunicorn --log-file -
+# ASGI profile:            DJANGO_ASGI=True gunicorn --log-file -
+# The ASGI profile serves asgi.py with uvicorn workers, and settings switch
+# the read-heavy pages to PahangPrism/async_views.py.
+import os
+import subprocess
+import sys
+
+ASGI = os.environ.get('DJANGO_ASGI', '') == 'True'
+
+if ASGI:
+    wsgi_app = 'TourismEventPortal1.asgi:application'
+    worker_class = 'uvicorn.workers.UvicornWorker'
+else:
+    wsgi_app = 'TourismEventPortal1.wsgi:application'
+    worker_class = 'sync'
+
+# On SQLite the master also runs a WAL checkpointer next to the workers
+# (0 disables it); see PahangPrism/management/commands/sqlite_checkpoint.py
+SQLITE_CHECKPOINT_INTERVAL = float(os.environ.get('SQLITE_CHECKPOINT_INTERVAL', '300'))
+_checkpointer = None
+
+
+def when_ready(server):
+    global _checkpointer
+    if server.cfg.workers > 1 and not os.environ.get('REDIS_URL'):
+        # Catalogue versions live in the cache (see PahangPrism/catalogue_cache.py)
+        server.log.warning('%d workers with a per-process cache: catalogue changes made in one worker '
+                           'are not seen by the others. Set REDIS_URL to share the cache.', server.cfg.workers)
+    if SQLITE_CHECKPOINT_INTERVAL and os.environ.get('DATABASE_URL', 'sqlite:').startswith('sqlite:'):
+        _checkpointer = subprocess.Popen([
+            sys.executable, 'manage.py', 'sqlite_checkpoint', '--every', str(SQLITE_CHECKPOINT_INTERVAL),
+        ])
+
+
+def on_exit(server):
+    if _checkpointer is not None:
+        _checkpointer.terminate()